@@ -1,206 +1,198 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import pandas_ta as ta
-import mplfinance as mpf
-import matplotlib.font_manager as fm
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import json
 import os
 import time
 import streamlit.components.v1 as components
+from price_store import PriceStore, previous_close
+import vector_backtest
+import portfolio
+import intraday
+import indicators
+import sweep
+import jpx_listing
+import screener
+import snapshot
+import chart
+import strategies
+from strategies import check_current_signal
+from sheet_repo import SheetRepository, open_spreadsheet, add_op, delete_op
+from metrics import METRICS
 
-# バックテスト用ライブラリ (エラー回避)
-try:
-    from backtesting import Backtest, Strategy
-    from backtesting.lib import crossover
-except ImportError:
-    st.error("ライブラリ 'backtesting' が見つかりません。")
-
+# 重いライブラリ (backtesting / bokeh / mplfinance / matplotlib / gspread / pandas_ta) は
+# 使うタブ・ボタンの処理の中で初めて読み込む (起動して最初の画面が出るまでを速くするため)
 # ==========================================
 # 設定エリア
 # ==========================================
 SHEET_URL = os.getenv('SHEET_URL', '')
 GCP_KEY_JSON = os.getenv('GCP_SERVICE_ACCOUNT_KEY', '')
 
-# 日本語フォント設定
-font_path = 'ipaexg.ttf'
-try:
-    fm.fontManager.addfont(font_path)
-    font_prop = fm.FontProperties(fname=font_path)
-    font_name = font_prop.get_name()
-    pd.options.plotting.backend = 'matplotlib'
-    import matplotlib.pyplot as plt
-    plt.rc('font', family=font_name)
-except:
-    font_name = "sans-serif"
+# パラメータ総当たりを並列に評価するプロセス数 (1銘柄の組み合わせをまとまりに分けて配る)
+SWEEP_WORKERS = int(os.getenv('SWEEP_WORKERS', os.cpu_count() or 1))
 
-# ==========================================
-# 0. 銘柄リスト取得 (検索用キャッシュ)
-# ==========================================
-@st.cache_data
-def get_jpx_ticker_list():
-    """東証の全銘柄リストを取得してキャッシュする"""
-    default_list = [
-        "7203: トヨタ自動車", "9984: ソフトバンクグループ", "8306: 三菱UFJフィナンシャル・グループ",
-        "6758: ソニーグループ", "6861: キーエンス", "6098: リクルートホールディングス",
-        "9432: 日本電信電話", "4063: 信越化学工業", "8035: 東京エレクトロン",
-        "9861: 吉野家ホールディングス", "7267: ホンダ", "5401: 日本製鉄"
-    ]
+# 足の間隔 (分足は intraday の保存領域から読む)
+INTERVAL_LABELS = {"日足": "1d", "15分足": "15m", "5分足": "5m"}
+
+# 日本語フォント設定 (画像でチャートを描く時に1回だけ登録する)
+@st.cache_resource
+def get_font_name():
+    font_path = 'ipaexg.ttf'
     try:
-        url = "https://www.jpx.co.jp/markets/statistics-equities/misc/tvdivq0000001vg2-att/data_j.xls"
-        df = pd.read_excel(url)
-        df['コード'] = df['コード'].astype(str).str.strip()
-        df['銘柄名'] = df['銘柄名'].str.strip()
-        search_list = [f"{row['コード']}: {row['銘柄名']}" for _, row in df.iterrows()]
-        return search_list
+        import matplotlib.font_manager as fm
+        fm.fontManager.addfont(font_path)
+        font_prop = fm.FontProperties(fname=font_path)
+        font_name = font_prop.get_name()
+        pd.options.plotting.backend = 'matplotlib'
+        import matplotlib.pyplot as plt
+        plt.rc('font', family=font_name)
+        return font_name
     except:
-        return default_list
+        return "sans-serif"
 
 # ==========================================
-# 1. AI分析用 戦略クラス定義
+# 0. 銘柄リスト取得 (検索用キャッシュ)
 # ==========================================
+@st.cache_data(ttl=86400)
+def get_jpx_listing():
+    """東証の全銘柄一覧 (ローカル保存分があればダウンロードしない)"""
+    return jpx_listing.load_listing()
+
+@st.cache_resource
+def get_jpx_index():
+    """銘柄検索用の索引 (プロセス内で1回だけ作る)"""
+    return jpx_listing.SearchIndex(get_jpx_listing())
 
-class SmaCross(Strategy):
-    n1 = 5
-    n2 = 25
-    def init(self):
-        close = pd.Series(self.data.Close)
-        self.sma1 = self.I(ta.sma, close, self.n1)
-        self.sma2 = self.I(ta.sma, close, self.n2)
-    def next(self):
-        if crossover(self.sma1, self.sma2): self.buy()
-        elif crossover(self.sma2, self.sma1): self.position.close()
-
-class RsiOscillator(Strategy):
-    upper = 70
-    lower = 30
-    def init(self):
-        close = pd.Series(self.data.Close)
-        self.rsi = self.I(ta.rsi, close, 14)
-    def next(self):
-        if crossover(self.rsi, self.lower): self.buy()
-        elif crossover(self.upper, self.rsi): self.position.close()
-
-class MacdTrend(Strategy):
-    def init(self):
-        close = pd.Series(self.data.Close)
-        macd = ta.macd(close, fast=12, slow=26, signal=9)
-        self.macd = self.I(lambda: macd.iloc[:, 0])
-        self.signal = self.I(lambda: macd.iloc[:, 1])
-    def next(self):
-        if crossover(self.macd, self.signal): self.buy()
-        elif crossover(self.signal, self.macd): self.position.close()
-
-class BollingerBands(Strategy):
-    def init(self):
-        close = pd.Series(self.data.Close)
-        bb = ta.bbands(close, length=20, std=2)
-        self.lower = self.I(lambda: bb.iloc[:, 0])
-        self.upper = self.I(lambda: bb.iloc[:, 2])
-    def next(self):
-        if self.data.Close < self.lower: 
-            if not self.position.is_long: self.buy()
-        elif self.data.Close > self.upper: 
-            self.position.close()
-
-STRATEGIES = [
-    {"name": "SMAクロス", "class": SmaCross},
-    {"name": "RSI逆張り", "class": RsiOscillator},
-    {"name": "MACD", "class": MacdTrend},
-    {"name": "ボリンジャー", "class": BollingerBands}
-]
-STRATEGY_MAP = {s["name"]: s["class"] for s in STRATEGIES}
+@st.cache_resource
+def get_price_store():
+    """株価データのローカル保存 (プロセス内で共有し、差分だけ取得する)"""
+    return PriceStore()
+
+@st.cache_resource
+def get_intraday_store(interval):
+    """分足の保存領域 (月ごとのファイル)"""
+    return intraday.IntradayStore(interval)
 
 # ==========================================
-# 2. 判定ロジック
+# 1. 計算結果のキャッシュ (全ユーザー共通)
 # ==========================================
-def check_current_signal(strategy_name, df):
-    """最新データに基づいて売買シグナルを判定"""
+# キーは (銘柄, 期間, 戦略, 資金, 最終足)。新しい足が来るとキーが変わって計算し直し、
+# 古い結果は件数上限を超えた時に使われていないものから捨てられる
+RESULT_CACHE_ENTRIES = 256
+
+def bar_key(df):
+    """最終足の日付と終値 (取引時間中に最終足の値が変わった時も別の結果として扱う)"""
+    return f"{df.index[-1].date()}:{float(df['Close'].iloc[-1])}"
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_chart(ticker, period, bar, title, renderer, _df):
+    """チャート (renderer="vega" なら Vega-Lite の仕様、"png" なら画像) と現在値・前日比 (分足も前の取引日の終値と比べる)"""
+    METRICS.incr("result_cache.miss")
+    df = chart.chart_frame(_df, ticker)
+    body = chart.vega_spec(df, title) if renderer == "vega" else chart.render_png(df, title, get_font_name())
+    close = float(_df['Close'].iloc[-1])
+    prev_close, basis = previous_close(_df)
+    return body, close, close - prev_close, basis
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_backtest(ticker, period, strategy, cash, bar, _df):
+    """検証実行の結果 (統計値・資産推移・チャートのHTML)"""
+    METRICS.incr("result_cache.miss")
+    from backtesting import Backtest
+    bt = Backtest(_df, strategies.strategy_classes()[strategy], cash=cash, commission=.002)
+    stats = bt.run()
+    plot_html = None
     try:
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
-        close = float(latest['Close'])
-        
-        def g(row, k, d=0): return float(row[k]) if k in row and not pd.isna(row[k]) else d
-
-        sma5, sma25 = g(latest,'SMA_5'), g(latest,'SMA_25')
-        p_sma5, p_sma25 = g(prev,'SMA_5'), g(prev,'SMA_25')
-        rsi = g(latest,'RSI_14', 50)
-        macd, sig = g(latest,'MACD_12_26_9'), g(latest,'MACDs_12_26_9')
-        p_macd, p_sig = g(prev,'MACD_12_26_9'), g(prev,'MACDs_12_26_9')
-        bbl, bbu = g(latest,'BBL_20_2.0'), g(latest,'BBU_20_2.0')
-
-        if strategy_name == "SMAクロス":
-            if p_sma5 < p_sma25 and sma5 > sma25: return "買い 🚀", "ゴールデンクロス"
-            elif p_sma5 > p_sma25 and sma5 < sma25: return "売り 🔻", "デッドクロス"
-        elif strategy_name == "RSI逆張り":
-            if rsi < 30: return "買い 🚀", f"売られすぎ(RSI{rsi:.0f})"
-            elif rsi > 70: return "売り 🔻", f"買われすぎ(RSI{rsi:.0f})"
-        elif strategy_name == "MACD":
-            if p_macd < p_sig and macd > sig: return "買い 🚀", "MACD上抜け"
-            elif p_macd > p_sig and macd < sig: return "売り 🔻", "MACD下抜け"
-        elif strategy_name == "ボリンジャー":
-            if close < bbl: return "買い 🚀", "バンド下限割れ"
-            elif close > bbu: return "売り 🔻", "バンド上限到達"
-            
-        return "ステイ 🤔", "シグナルなし"
-    except:
-        return "判定不能", "データ不足"
+        # 図はメモリ上で組み立てる (bt.plot() は plot.html を書くので使わない)
+        plot_html = chart.backtest_html(_df, stats['_equity_curve']['Equity'], stats['_trades'],
+                                        f"{ticker} {strategy}")
+    except: pass
+    public = pd.Series({k: v for k, v in stats.items() if not k.startswith('_')}, dtype=object)
+    return public, stats['_equity_curve']['Equity'], plot_html
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_intraday_backtest(ticker, interval, cash, last):
+    """分足の全戦略の検証結果 {戦略名: (統計値, 日ごとの資産推移)} (保存済みの分足をチャンクごとに流す)"""
+    METRICS.incr("result_cache.miss")
+    engine = intraday.backtest(get_intraday_store(interval), ticker, cash=cash)
+    stats = engine.stats()
+    return {name: (stats[name], engine.equity_curve(name)) for name in stats}
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_sweep(ticker, period, strategy, cash, bar, _df):
+    """パラメータ総当たりの成績表"""
+    METRICS.incr("result_cache.miss")
+    return sweep.sweep_ticker(_df, [strategy], cash=cash, commission=.002, workers=SWEEP_WORKERS)
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_portfolio(tickers, period, strategy, cash, bars, _frames):
+    """保有株全体を共通の資金で検証した結果 (統計値・資産推移・銘柄ごとの寄与度)"""
+    METRICS.incr("result_cache.miss")
+    stats = portfolio.run(_frames, strategy, cash=cash, commission=.002)
+    public = pd.Series({k: v for k, v in stats.items() if not k.startswith('_')}, dtype=object)
+    return public, stats['_equity_curve'][['Equity']], stats['_contribution']
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def cached_diagnosis(ticker, period, cash, bar, _df):
+    """AI診断の全戦略成績表 (勝率順)"""
+    METRICS.incr("result_cache.miss")
+    # 判定用の指標は直近2本だけ (バックテストと共有のキャッシュから取得、_df には列を足さない)
+    tail = indicators.signal_tail(_df, ticker)
+    stats, signals = {}, {}
+    for name in strategies.NAMES:
+        try:
+            stats[name] = vector_backtest.run(_df, name, cash=cash, commission=.002, ticker=ticker)
+            signals[name] = check_current_signal(name, tail)
+        except Exception as e:
+            METRICS.failure("diagnosis", e, ticker=ticker, strategy=name)
+    return snapshot.sort_table(snapshot.diagnosis_rows(stats, signals, cash))
 
 # ==========================================
-# 3. UI & メイン処理
+# 2. UI & メイン処理
 # ==========================================
 st.set_page_config(page_title="AI株価監視盤", layout="wide")
 st.title("📈 AI株価一括スキャン & 分析アプリ")
 
-# スプシ接続
-def get_sheet_client():
+# スプシ接続 (認証と読み込み結果はプロセス内で使い回す)
+@st.cache_resource
+def get_sheet_repo():
     if not GCP_KEY_JSON or not SHEET_URL: return None
     try:
-        key_dict = json.loads(GCP_KEY_JSON)
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(key_dict, scope)
-        client = gspread.authorize(creds)
-        return client.open_by_url(SHEET_URL)
+        return SheetRepository(open_spreadsheet(GCP_KEY_JSON, SHEET_URL))
     except: return None
 
-sheet = get_sheet_client()
+repo = get_sheet_repo()
 df_sheet = pd.DataFrame()
 
 # --- サイドバー ---
 st.sidebar.header("📝 銘柄リスト管理")
-if sheet:
+if repo:
     mode = st.sidebar.radio("編集モード", ["保有株 (Holdings)", "監視株 (Watchlist)"])
     ws_name = "Holdings" if "保有" in mode else "Watchlist"
+    # repo は全セッション共有なので、未保存の追加・削除はセッションごとに持つ
+    edits = st.session_state.setdefault("sheet_edits", [])
     try:
-        ws = sheet.worksheet(ws_name)
-        data = ws.get_all_records()
-        df_sheet = pd.DataFrame(data)
-        if not df_sheet.empty: df_sheet = df_sheet.astype(str)
+        df_sheet = repo.frame(ws_name)
         st.sidebar.write(f"登録数: {len(df_sheet)}銘柄")
         
         # 🔍 検索機能 (復活)
         with st.sidebar.expander("🔍 銘柄を検索して追加", expanded=False):
-            all_tickers = get_jpx_ticker_list()
+            query = st.text_input("銘柄名やコードで検索", placeholder="例: 7203 / トヨタ / とよた")
+            matches = get_jpx_index().search(query, limit=20)
             selected_item = st.selectbox(
-                "銘柄名やコードで検索", 
-                options=[""] + all_tickers,
-                format_func=lambda x: x if x else "ここに入力して検索..."
+                "候補",
+                options=[""] + matches,
+                format_func=lambda x: x if x else ("該当なし" if query else "上に入力して検索...")
             )
             if st.button("リストに追加する"):
                 if selected_item:
                     try:
                         code, name = selected_item.split(": ", 1)
                         clean_code = code.strip()
-                        if not df_sheet.empty and clean_code in df_sheet['Ticker'].values:
+                        queued = [op[2] for op in edits if op[0] == "add" and op[1] == ws_name]
+                        if (not df_sheet.empty and clean_code in df_sheet['Ticker'].values) or clean_code in queued:
                             st.sidebar.warning(f"⚠️ {name} は既に登録済みです")
                         else:
-                            ws.append_row([clean_code, name])
-                            st.sidebar.success(f"✅ {name} を追加しました！")
-                            time.sleep(1)
-                            st.rerun()
+                            edits.append(add_op(ws_name, clean_code, name))
+                            st.sidebar.success(f"✅ {name} を追加予定に入れました (保存で反映)")
                     except:
                         st.sidebar.error("形式エラー")
                 else:
@@ -210,18 +202,30 @@ if sheet:
             if not df_sheet.empty:
                 d = st.selectbox("削除銘柄", df_sheet['Ticker'].tolist())
                 if st.button("削除"):
-                    cell = ws.find(d)
-                    ws.delete_rows(cell.row)
-                    st.success("削除しました")
-                    time.sleep(1)
-                    st.rerun()
+                    edits.append(delete_op(ws_name, d))
+                    st.success("削除予定に入れました (保存で反映)")
+
+        # 追加・削除はこのセッションのキューに溜め、保存ボタンで1回のまとめ書きにする
+        if edits:
+            labels = {"add": "追加", "delete": "削除"}
+            st.sidebar.caption("未保存の変更: " + " / ".join(f"{labels[k]} {t} ({n})" for k, n, t, _ in edits))
+            col_save, col_discard = st.sidebar.columns(2)
+            if col_save.button(f"💾 保存 ({len(edits)}件)"):
+                repo.flush(edits)
+                edits.clear()
+                st.sidebar.success("保存しました")
+                time.sleep(1)
+                st.rerun()
+            if col_discard.button("取り消し"):
+                edits.clear()
+                st.rerun()
     except Exception as e:
         st.sidebar.error(f"読み込みエラー: {e}")
 else:
     st.sidebar.warning("API設定なし (GitHub Secretsを確認してください)")
 
 # --- メインエリア ---
-tab1, tab2, tab3 = st.tabs(["📊 チャート分析", "🧪 バックテスト研究所", "🤖 AI戦略コンシェルジュ"])
+tab1, tab2, tab3, tab4 = st.tabs(["📊 チャート分析", "🧪 バックテスト研究所", "🤖 AI戦略コンシェルジュ", "🔭 全銘柄スクリーナー"])
 
 # 銘柄リスト準備
 target_tickers = []
@@ -238,38 +242,34 @@ else:
 # ----------------------------------------------------
 with tab1:
     st.subheader("リアルタイム チャート")
-    c1, c2 = st.columns(2)
+    c1, c2, c3 = st.columns(3)
     t1 = c1.selectbox("銘柄", target_tickers, format_func=lambda x: f"{x} : {target_dict.get(x,'')}", key="t1")
     p1 = c2.radio("期間", ["3mo", "6mo", "1y"], index=1, horizontal=True, key="p1")
+    i1 = INTERVAL_LABELS[c3.radio("足", list(INTERVAL_LABELS), horizontal=True, key="i1")]
+    r1 = st.radio("描画方式", ["軽量 (ブラウザで描画)", "画像 (mplfinance)"], horizontal=True, key="r1")
     
     if st.button("チャート表示 🚀", key="b1"):
-        yf_code = f"{t1}.T" if str(t1).isdigit() else t1
         with st.spinner('取得中...'):
             try:
-                df = yf.download(yf_code, period=p1, interval='1d', progress=False)
+                with METRICS.span("fetch", ticker=t1, interval=i1):
+                    if i1 == "1d":
+                        df = get_price_store().get(t1, period=p1)
+                    else:
+                        # 分足は保存済みの分に差分を足し、期間内の月のファイルだけ読む
+                        get_intraday_store(i1).update(t1)
+                        df = get_intraday_store(i1).load(t1, period=p1)
                 if df.empty:
                     st.error("データなし")
                 else:
-                    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-                    
-                    df.ta.sma(length=5, append=True)
-                    df.ta.sma(length=25, append=True)
-                    df.ta.sma(length=75, append=True)
-                    df.ta.rsi(length=14, append=True)
-                    
-                    latest = df.iloc[-1]
-                    st.metric("現在値", f"{int(latest['Close']):,} 円", f"{latest['Close']-df.iloc[-2]['Close']:.1f}")
-                    
-                    plots = [
-                        mpf.make_addplot(df['SMA_5'], color='orange', width=1),
-                        mpf.make_addplot(df['SMA_25'], color='skyblue', width=1),
-                        mpf.make_addplot(df['SMA_75'], color='green', width=1),
-                        mpf.make_addplot(df['RSI_14'], color='purple', panel=2, ylabel='RSI')
-                    ]
-                    my_style = mpf.make_mpf_style(base_mpf_style='yahoo', rc={'font.family': font_name})
-                    fig, ax = mpf.plot(df, type='candle', style=my_style, addplot=plots, volume=True, returnfig=True,
-                                   title=f"{t1} - {target_dict.get(t1,'')}", figsize=(10,8))
-                    st.pyplot(fig)
+                    renderer = "vega" if r1.startswith("軽量") else "png"
+                    with METRICS.span("chart", ticker=t1, renderer=renderer):
+                        body, close, change, basis = cached_chart(t1, f"{p1}/{i1}", bar_key(df),
+                                                                  f"{t1} - {target_dict.get(t1,'')}", renderer, df)
+                    st.metric("現在値", f"{int(close):,} 円", f"{change:.1f} ({basis})")
+                    if renderer == "vega":
+                        st.vega_lite_chart(spec=body)
+                    else:
+                        st.image(body)
             except Exception as e:
                 st.error(f"エラー: {e}")
 
@@ -278,20 +278,29 @@ with tab1:
 # ----------------------------------------------------
 with tab2:
     st.subheader("戦略シミュレーション")
-    c1, c2, c3 = st.columns(3)
+    c1, c2, c3, c4 = st.columns(4)
     t2 = c1.selectbox("銘柄", target_tickers, format_func=lambda x: f"{x} : {target_dict.get(x,'')}", key="t2")
-    s2 = c2.selectbox("戦略", list(STRATEGY_MAP.keys()), key="s2")
+    s2 = c2.selectbox("戦略", strategies.NAMES, key="s2")
     cash = c3.number_input("初期資金(円)", value=1000000, step=100000)
+    i2 = INTERVAL_LABELS[c4.selectbox("足", list(INTERVAL_LABELS), key="i2")]
     
     if st.button("検証実行 ⚔️", key="b2"):
-        yf_code = f"{t2}.T" if str(t2).isdigit() else t2
         with st.spinner('シミュレーション中...'):
             try:
-                df = yf.download(yf_code, period="2y", interval='1d', progress=False)
-                if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-                
-                bt = Backtest(df, STRATEGY_MAP[s2], cash=cash, commission=.002)
-                stats = bt.run()
+                if i2 == "1d":
+                    with METRICS.span("fetch", ticker=t2):
+                        df = get_price_store().get(t2, period="2y")
+                    with METRICS.span("backtest", ticker=t2, strategy=s2):
+                        stats, equity_curve, plot_html = cached_backtest(t2, "2y", s2, cash, bar_key(df), df)
+                else:
+                    store = get_intraday_store(i2)
+                    with METRICS.span("fetch", ticker=t2, interval=i2):
+                        store.update(t2)
+                    if store.last_time(t2) is None:
+                        raise ValueError("分足のデータがありません")
+                    with METRICS.span("backtest", ticker=t2, strategy=s2, interval=i2):
+                        stats, equity_curve = cached_intraday_backtest(t2, i2, cash, str(store.last_time(t2)))[s2]
+                    plot_html = None
                 
                 # 結果計算
                 final_equity = stats['Equity Final [$]']
@@ -320,15 +329,71 @@ with tab2:
                     st.error(f"🐢 **ガチホの勝利...** ガチホの方が **{int(abs(diff)):,}円** お得でした。")
                 
                 st.write("##### 📈 資産の推移")
-                st.line_chart(stats['_equity_curve']['Equity'])
+                st.line_chart(equity_curve)
                 
                 with st.expander("詳細データ"): st.dataframe(stats.to_frame().T)
                 
+                if plot_html:
+                    components.html(plot_html, height=600, scrolling=True)
+            except Exception as e:
+                st.error(f"検証エラー: {e}")
+
+    # パラメータ総当たり (選択中の戦略のパラメータ候補をすべて検証)
+    if st.button("パラメータ最適化 🔧", key="b2s"):
+        if i2 != "1d":
+            st.info("パラメータ最適化は日足だけです")
+        else:
+            with st.spinner('パラメータを総当たりで検証中...'):
                 try:
-                    bt.plot(filename='plot.html', open_browser=False)
-                    with open('plot.html', 'r', encoding='utf-8') as f:
-                        components.html(f.read(), height=600, scrolling=True)
-                except: pass
+                    with METRICS.span("fetch", ticker=t2):
+                        df = get_price_store().get(t2, period="2y")
+                    with METRICS.span("sweep", ticker=t2, strategy=s2):
+                        table = cached_sweep(t2, "2y", s2, cash, bar_key(df), df)
+                    st.markdown(f"### 🔧 {s2} のパラメータ別成績 ({len(table)}通り)")
+                    st.caption("勝率が高い順に並んでいます。取引回数が少ない組み合わせは偶然の可能性があります。")
+                    st.dataframe(
+                        table[["パラメータ", "勝率", "収益率", "取引回数", "PF", "最大DD"]].style.format({
+                            "勝率": "{:.1f}%",
+                            "収益率": "{:.1f}%",
+                            "PF": "{:.2f}",
+                            "最大DD": "{:.1f}%"
+                        }).background_gradient(subset=["勝率", "収益率"], cmap="Greens")
+                    )
+                except Exception as e:
+                    st.error(f"検証エラー: {e}")
+
+    # ポートフォリオ検証 (保有株の全銘柄を、共通の初期資金で同時に運用した場合)
+    # サイドバーで監視株を選んでいても、検証するのは常に Holdings シート
+    if st.button("保有株 (Holdings) 全体で検証 📦", key="b2p"):
+        with st.spinner('ポートフォリオをシミュレーション中...'):
+            try:
+                holdings = list(repo.tickers("Holdings")) if repo else []
+                with METRICS.span("fetch", tickers=len(holdings)):
+                    frames = get_price_store().get_many(holdings, period="2y") if holdings else {}
+                if not holdings:
+                    st.error("保有株 (Holdings) が登録されていません")
+                elif not frames:
+                    st.error("データなし")
+                else:
+                    with METRICS.span("portfolio", tickers=len(frames), strategy=s2):
+                        pstats, pcurve, contrib = cached_portfolio(
+                            tuple(frames), "2y", s2, cash, tuple(bar_key(d) for d in frames.values()), frames)
+                    st.markdown(f"### 📦 保有株ポートフォリオ検証 ({len(frames)}銘柄・{s2})")
+                    st.caption("日足で、初期資金を全銘柄で共有し、1銘柄あたり資産の均等割りまで買います。")
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("最終資産", f"{int(pstats['Equity Final [$]']):,}円",
+                                delta=f"{pstats['Return [%]']:.1f}%")
+                    col2.metric("均等保有", f"{pstats['Buy & Hold Return [%]']:.1f}%")
+                    col3.metric("最大DD", f"{pstats['Max. Drawdown [%]']:.1f}%")
+                    col4.metric("取引回数", f"{pstats['# Trades']}回")
+                    st.line_chart(pcurve)
+                    st.dataframe(
+                        contrib[["銘柄", "取引回数", "勝率", "損益", "寄与度", "保有株数"]].style.format({
+                            "勝率": "{:.1f}%",
+                            "損益": "{:,.0f}",
+                            "寄与度": "{:+.2f}%"
+                        })
+                    )
             except Exception as e:
                 st.error(f"検証エラー: {e}")
 
@@ -343,65 +408,27 @@ with tab3:
     cash3 = 1000000 # AI診断の基準資金
     
     if st.button("AI診断を開始 🧠", key="b3"):
-        yf_code = f"{t3}.T" if str(t3).isdigit() else t3
-        
         with st.spinner("AIが思考中... 全戦略の詳細バックテストを実行しています..."):
             try:
-                df = yf.download(yf_code, period="2y", interval='1d', progress=False)
+                with METRICS.span("fetch", ticker=t3):
+                    df = get_price_store().get(t3, period="2y")
                 if df.empty:
                     st.error("データなし")
                     st.stop()
-                if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-                
-                # 指標一括計算
-                df.ta.sma(length=5, append=True)
-                df.ta.sma(length=25, append=True)
-                df.ta.rsi(length=14, append=True)
-                df.ta.macd(fast=12, slow=26, signal=9, append=True)
-                df.ta.bbands(length=20, std=2, append=True)
-                
-                results = []
-                progress = st.progress(0)
                 
-                # ガチホ参考値 (どの戦略でも同じなので最初に計算)
-                buy_hold_ret = 0
-                buy_hold_val = 0
+                # 夜間ジョブ (notify.py) の計算結果が今のデータと同じ最終足なら、それを読むだけで済ませる
+                with METRICS.span("diagnosis", ticker=t3) as span:
+                    res_df = snapshot.fresh_table(t3, df.index[-1], df['Close'].iloc[-1], cash3)
+                    span["snapshot"] = res_df is not None
+                    if res_df is None:
+                        res_df = cached_diagnosis(t3, "2y", cash3, bar_key(df), df)
+                if span["snapshot"]:
+                    start = res_df.attrs.get("stats_start") or "不明"
+                    st.caption(f"夜間分析の保存結果を表示しています (評価期間: {start} 〜 {df.index[-1].date()})。")
                 
-                for i, strat in enumerate(STRATEGIES):
-                    try:
-                        bt = Backtest(df, strat["class"], cash=cash3, commission=.002)
-                        stats = bt.run()
-                        
-                        # ガチホ値の取得 (初回のみでOKだが毎回取っても同じ)
-                        buy_hold_ret = stats['Buy & Hold Return [%]']
-                        buy_hold_val = cash3 * (1 + buy_hold_ret / 100)
-                        
-                        action, reason = check_current_signal(strat["name"], df)
-                        
-                        # 結果格納
-                        results.append({
-                            "戦略名": strat["name"],
-                            "勝率": stats['Win Rate [%]'],
-                            "収益率": stats['Return [%]'],
-                            "最終資産": stats['Equity Final [$]'],
-                            "PF": stats['Profit Factor'],
-                            "取引回数": stats['# Trades'],
-                            "最大DD": stats['Max. Drawdown [%]'],
-                            "シャープレシオ": stats['Sharpe Ratio'],
-                            "現在の判定": action,
-                            "根拠": reason,
-                            "ガチホ差額": stats['Equity Final [$]'] - buy_hold_val
-                        })
-                    except:
-                        pass
-                    progress.progress((i + 1) / len(STRATEGIES))
-                
-                if not results:
+                if res_df.empty:
                     st.error("有効な戦略が見つかりませんでした。")
                 else:
-                    res_df = pd.DataFrame(results)
-                    # 勝率順にソート
-                    res_df = res_df.sort_values("勝率", ascending=False).reset_index(drop=True)
                     best = res_df.iloc[0]
                     
                     st.success("診断完了！")
@@ -439,3 +466,48 @@ with tab3:
                 
             except Exception as e:
                 st.error(f"診断エラー: {e}")
+
+# ----------------------------------------------------
+# Tab 4: 全銘柄スクリーナー
+# ----------------------------------------------------
+with tab4:
+    st.subheader("🔭 全銘柄スクリーナー")
+    st.info("東証の全株式について、AI診断と同じ4戦略の「今日のシグナル」をまとめて判定します。")
+
+    limit4 = st.number_input("対象銘柄数 (0なら全銘柄)", min_value=0, value=0, step=100, key="n4")
+    only4 = st.checkbox("シグナルが出ている銘柄だけ表示", value=True, key="c4")
+
+    if st.button("スクリーニング開始 🔭", key="b4"):
+        # 銘柄一覧は開始を押した時に初めて読む
+        listing = get_jpx_listing()
+        codes4 = jpx_listing.stock_codes(listing)
+        targets = codes4[:limit4] if limit4 else codes4
+        with st.spinner(f"{len(targets)}銘柄を判定中... (初回は株価の取得に時間がかかります)"):
+            try:
+                t0 = time.time()
+                with METRICS.span("screener", tickers=len(targets)):
+                    res4 = screener.run_screen(targets, store=get_price_store())
+                if only4:
+                    res4 = screener.firing(res4)
+                names = dict(zip(listing['コード'], listing['銘柄名']))
+                res4.insert(0, "銘柄名", [names.get(c, "") for c in res4.index])
+                st.success(f"{len(targets)}銘柄中 {len(res4)}銘柄 ({time.time() - t0:.1f}秒)")
+                st.dataframe(res4.style.format({"終値": "{:,.1f}", "RSI": "{:.0f}"}))
+            except Exception as e:
+                st.error(f"スクリーニングエラー: {e}")
+
+# 指標キャッシュの効果 (同じ指標の再計算をどれだけ省けたか)
+cache_stats = indicators.CACHE.stats()
+st.sidebar.caption(f"指標キャッシュ: ヒット{cache_stats['hits']} / ミス{cache_stats['misses']}")
+
+# 処理時間の内訳 (このサーバープロセスで記録した分、全ユーザー共通)
+if st.sidebar.checkbox("🐞 デバッグ表示", key="debug"):
+    with st.sidebar.expander("処理時間", expanded=True):
+        st.dataframe(METRICS.summary().style.format(precision=1), hide_index=True)
+        counters = dict(METRICS.counters)
+        if counters:
+            st.caption(", ".join(f"{k}={v}" for k, v in sorted(counters.items())))
+        recent = METRICS.spans().tail(20).iloc[::-1]
+        if not recent.empty:
+            st.caption("直近の記録")
+            st.dataframe(recent.drop(columns=["type", "ts"], errors='ignore'), hide_index=True)
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+"""
+benchmark.py (分析処理の速度計測、開発用)
+・乱数の種から毎回同じ架空の株価 (窓開け・出来高つきのランダムウォーク) を N銘柄 × M本 作り、
+  取得 → 指標 → バックテスト → 判定 → レポート作成 の各段階を通信なしで計測します。
+  株価は PriceStore に FrameFetcher、スプレッドシートは FakeSpreadsheet (offline.py) を差し込んで供給します。
+・段階ごとに 1銘柄あたりの処理時間 (p50 / p90 / p99)、毎秒の処理銘柄数、常駐メモリの増分を表示します。
+  --tracemalloc を付けると段階中に確保したメモリのピークも測ります (計測の分だけ処理が遅くなります)。
+・--json で結果を保存し、--compare で前回の結果と比べられます。
+  例: python benchmark.py --tickers 10 100 1000 --json bench.json
+"""
+
+STAGES = ["sheet", "fetch", "indicators", "backtest", "signal", "analyze", "screener"]
+
+
+# ==========================================
+# 1. 架空の株価
+# ==========================================
+def synthetic_market(n_tickers, n_bars=500, seed=0):
+    """
+    {コード: OHLCV} を返す (同じ引数なら毎回同じデータ)
+    ・日々の値動きは対数正規、たまに大きな窓開け (前日終値と当日始値の差) が入る
+    ・出来高は対数正規で、値動きが大きい日ほど多い
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_bars)
+    frames = {}
+    for i in range(n_tickers):
+        base = rng.uniform(200, 20000)
+        ret = rng.normal(0, rng.uniform(0.01, 0.03), n_bars)
+        gap = rng.normal(0, 0.005, n_bars) + np.where(rng.random(n_bars) < 0.02, rng.normal(0, 0.05, n_bars), 0)
+        close = base * np.exp(np.cumsum(ret + gap))
+        open_ = np.concatenate([[base], close[:-1]]) * np.exp(gap)
+        wick = np.abs(rng.normal(0, 0.006, (2, n_bars)))
+        high = np.maximum(open_, close) * (1 + wick[0])
+        low = np.minimum(open_, close) * (1 - wick[1])
+        volume = np.round(rng.lognormal(11, 0.5, n_bars) * (1 + 20 * np.abs(ret + gap)))
+        frames[str(1000 + i)] = pd.DataFrame(
+            {'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+    return frames
+
+
+# ==========================================
+# 2. 計測
+# ==========================================
+def peak_rss_mb():
+    """このプロセスのこれまでの最大常駐メモリ (MB)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+    except ImportError:
+        return float('nan')
+
+
+def rss_mb():
+    """今の常駐メモリ (MB、Linux の /proc から読む。読めない環境では NaN)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+@contextlib.contextmanager
+def stage_memory(trace=False):
+    """
+    段階の前後の常駐メモリの増分 (MB) を測る
+    ru_maxrss はプロセスが始まってからの最大値なので、前の段階のピークに隠れて段階ごとの値にならない
+    trace=True なら段階中に確保したメモリのピーク (tracemalloc) も測る
+    """
+    mem = {"rss_delta_mb": float('nan'), "alloc_peak_mb": float('nan')}
+    before = rss_mb()
+    if trace:
+        tracemalloc.start()
+    try:
+        yield mem
+    finally:
+        if trace:
+            mem["alloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        mem["rss_delta_mb"] = rss_mb() - before
+
+
+def summarize(durations, wall, memory=None, count=None):
+    """
+    1件ごとの処理時間 [秒] のリストを、パーセンタイル [ms] と毎秒の処理件数にまとめる
+    count: 毎秒の処理件数の件数 (全銘柄をまとめて1回で処理する段階は銘柄数。省略時は durations の件数)
+    """
+    d = np.asarray(durations) * 1000
+    count = len(d) if count is None else count
+    return {
+        "count": count,
+        "wall_s": wall,
+        "per_sec": count / wall if wall else float('nan'),
+        "p50_ms": float(np.percentile(d, 50)),
+        "p90_ms": float(np.percentile(d, 90)),
+        "p99_ms": float(np.percentile(d, 99)),
+        "max_ms": float(d.max()),
+        **(memory or {"rss_delta_mb": float('nan'), "alloc_peak_mb": float('nan')}),
+    }
+
+
+def timed_each(items, func):
+    """items の1件ずつに func を適用し、(結果の辞書, 1件ごとの時間, 全体の時間) を返す"""
+    results, durations = {}, []
+    t0 = time.perf_counter()
+    for key, value in items:
+        t = time.perf_counter()
+        results[key] = func(key, value)
+        durations.append(time.perf_counter() - t)
+    return results, durations, time.perf_counter() - t0
+
+
+def run_benchmark(n_tickers, n_bars=500, seed=0, stages=STAGES, trace=False):
+    """1つの規模 (銘柄数 × 本数) で各段階を計測して {段階: 集計} を返す (trace は stage_memory を参照)"""
+    import notify
+    import indicators
+    import screener
+    from price_store import PriceStore, TokenBucket
+    from sheet_repo import SheetRepository
+    from offline import FrameFetcher, FakeSpreadsheet
+
+    market = synthetic_market(n_tickers, n_bars, seed)
+    codes = list(market)
+    report = {}
+
+    if "sheet" in stages:
+        half = len(codes) // 2
+        fake = FakeSpreadsheet({
+            "Holdings": [["Ticker", "Name"]] + [[c, f"保有{c}"] for c in codes[:half]],
+            "Watchlist": [["Ticker", "Name"]] + [[c, f"監視{c}"] for c in codes[half:]],
+        })
+        with stage_memory(trace) as mem:
+            t0 = time.perf_counter()
+            repo = SheetRepository(fake)
+            repo.tickers("Holdings"), repo.tickers("Watchlist")
+            wall = time.perf_counter() - t0
+        # 全銘柄を1回の読み込みで取るので、毎秒の件数は銘柄数で数える
+        report["sheet"] = summarize([wall], wall, mem, count=len(codes))
+
+    frames = market
+    if "fetch" in stages:
+        fetcher = FrameFetcher(market)
+        with tempfile.TemporaryDirectory() as root, stage_memory(trace) as mem:
+            store = PriceStore(root=root, fetcher=fetcher, batch_fetcher=fetcher.batch,
+                               limiter=TokenBucket(rate=1e9, burst=1e9))
+            durations = []
+            t0 = time.perf_counter()
+            frames = {}
+            for i in range(0, len(codes), 50):
+                t = time.perf_counter()
+                frames.update(store.get_many(codes[i:i + 50], period="2y"))
+                durations.extend([(time.perf_counter() - t) / len(codes[i:i + 50])] * len(codes[i:i + 50]))
+            wall = time.perf_counter() - t0
+        report["fetch"] = summarize(durations, wall, mem)
+
+    # 段階ごとに指標キャッシュを空にして、それぞれの計算量を測る
+    if "indicators" in stages:
+        indicators.CACHE.clear()
+        with stage_memory(trace) as mem:
+            _, durations, wall = timed_each(frames.items(), lambda t, df: indicators.append_indicators(df.copy(), t))
+        report["indicators"] = summarize(durations, wall, mem)
+
+    stats = {}
+    if {"backtest", "analyze"} & set(stages):
+        indicators.CACHE.clear()
+        with stage_memory(trace) as mem:
+            stats, durations, wall = timed_each(frames.items(), lambda t, df: notify.backtest_ticker(
+                (t, df.index.values, df[notify.OHLCV_COLUMNS].to_numpy(dtype=float))))
+        if "backtest" in stages:
+            report["backtest"] = summarize(durations, wall, mem)
+
+    with_ind = {t: indicators.append_indicators(df.copy(), t) for t, df in frames.items()} \
+        if {"signal", "analyze"} & set(stages) else {}
+
+    if "signal" in stages:
+        names = [s["name"] for s in notify.STRATEGIES]
+        with stage_memory(trace) as mem:
+            _, durations, wall = timed_each(
+                with_ind.items(), lambda t, df: [notify.check_current_signal(n, df) for n in names])
+        report["signal"] = summarize(durations, wall, mem)
+
+    if "analyze" in stages:
+        with stage_memory(trace) as mem:
+            _, durations, wall = timed_each(
+                with_ind.items(),
+                lambda t, df: notify.analyze_ticker_ai(t, t, "holding", df=df, strategy_stats=stats[t]))
+        report["analyze"] = summarize(durations, wall, mem)
+
+    if "screener" in stages:
+        with stage_memory(trace) as mem:
+            t0 = time.perf_counter()
+            screener.screen_panel(screener.build_panel(frames))
+            wall = time.perf_counter() - t0
+        # 全銘柄を1回の配列演算で判定するので、毎秒の件数は銘柄数で数える
+        report["screener"] = summarize([wall], wall, mem, count=len(frames))
+    return report
+
+
+# ==========================================
+# 3. 表示・比較
+# ==========================================
+def print_report(results, baseline=None):
+    rows = []
+    for size, report in results.items():
+        for stage, r in report.items():
+            row = {"規模": size, "段階": stage, "件数/秒": r["per_sec"], "p50[ms]": r["p50_ms"],
+                   "p90[ms]": r["p90_ms"], "p99[ms]": r["p99_ms"], "合計[秒]": r["wall_s"],
+                   "RSS増分[MB]": r.get("rss_delta_mb", float('nan')),
+                   "確保ピーク[MB]": r.get("alloc_peak_mb", float('nan'))}
+            old = (baseline or {}).get(size, {}).get(stage)
+            if old:
+                row["前回比(p50)"] = r["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float('nan')
+            rows.append(row)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析処理の段階ごとの速度計測 (通信なし)")
+    parser.add_argument('--tickers', type=int, nargs='+', default=[10, 100, 1000], help="銘柄数 (複数指定可、10〜5000)")
+    parser.add_argument('--bars', type=int, default=500, help="1銘柄あたりの日足の本数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES, help="計測する段階")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="段階中に確保したメモリのピークも測る (計測の分だけ処理が2〜3倍遅くなる)")
+    parser.add_argument('--json', help="結果を保存するJSONファイル")
+    parser.add_argument('--compare', help="比較する前回の結果 (JSON)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for n in args.tickers:
+        size = f"{n}x{args.bars}"
+        print(f"--- {size} ---", flush=True)
+        results[size] = run_benchmark(n, args.bars, args.seed, args.stages, args.tracemalloc)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+    print(f"プロセス全体のピークメモリ {peak_rss_mb():.0f} MB")
+
+    if args.json:
+        meta = {"python": sys.version.split()[0], "cpu_count": os.cpu_count(),
+                "created_at": pd.Timestamp.now().isoformat(timespec='seconds'), "args": vars(args)}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+"""
+chart.py (チャート描画)
+・ローソク足 + SMA / 出来高 / RSI を Vega-Lite の仕様 (JSON) にして、描画はブラウザ側に任せます。
+  サーバーは数値の配列を送るだけなので、画像を作る時間もメモリも掛かりません。
+・足の数が CHART_MAX_POINTS を超える時は LTTB 法で形を保ったまま間引きます
+  (間引いた足の高値・安値・出来高は次に残す足までの分をまとめるので、ヒゲは消えません)。
+・mplfinance で画像を作る従来の描画 (render_png) も残しています。図は毎回必ず閉じます。
+・バックテスト結果の図 (backtest_html) は Bokeh の図をメモリ上で組み立て、HTML文字列で返します
+  (bt.plot() のように plot.html を書いて読み直さないので、同時に使う人がいても混ざりません)。
+・python chart.py で、描画時間とメモリ使用量 (RSS) を繰り返し描画して比べられます。
+"""
+
+CHART_MAX_POINTS = 400
+CHART_SPECS = [
+    ("sma", {"length": 5}), ("sma", {"length": 25}),
+    ("sma", {"length": 75}), ("rsi", {"length": 14}),
+]
+SMA_COLORS = {"SMA_5": "orange", "SMA_25": "skyblue", "SMA_75": "green"}
+
+
+# ==========================================
+# 1. 間引き (LTTB: Largest-Triangle-Three-Buckets)
+# ==========================================
+def lttb(y, threshold):
+    """
+    折れ線の形を保つように threshold 点を選び、その位置 (昇順) を返す
+    最初と最後の点は必ず残し、間の各区間からは前後の点と作る三角形が最大の点を選ぶ
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x, avg_y = x[nlo:nhi].mean(), np.nanmean(y[nlo:nhi]) if nhi > nlo else y[-1]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.nanargmax(area)) if np.isfinite(area).any() else lo
+        picked.append(a)
+    picked.append(n - 1)
+    return np.asarray(picked)
+
+
+def downsample(df, max_points=CHART_MAX_POINTS):
+    """
+    終値で LTTB を掛けて足を選び、選ばれなかった足は直前に残した足にまとめる
+    (日付は残した足、始値は最初、高値は最大、安値は最小、出来高は合計、終値と指標はまとめた最後の足の値)
+    """
+    if len(df) <= max_points:
+        return df
+    keep = lttb(df['Close'].values, max_points)
+    groups = np.searchsorted(keep, np.arange(len(df)), side='right') - 1
+    grouped = df.groupby(groups)
+    out = grouped.last()
+    out.index = df.index[keep]
+    out['Open'] = grouped['Open'].first().values
+    out['High'] = grouped['High'].max().values
+    out['Low'] = grouped['Low'].min().values
+    if 'Volume' in df:
+        out['Volume'] = grouped['Volume'].sum().values
+    return out
+
+
+# ==========================================
+# 2. ブラウザで描画する Vega-Lite 仕様
+# ==========================================
+def chart_frame(df, ticker="", max_points=CHART_MAX_POINTS):
+    """指標を付けてから間引いた、描画用のDataFrame"""
+    import indicators
+    df = df.copy()
+    indicators.append_indicators(df, ticker, specs=CHART_SPECS)
+    return downsample(df, max_points)
+
+
+def vega_spec(df, title="", height=480):
+    """ローソク足 + SMA / 出来高 / RSI の3段チャート (df は chart_frame の結果)"""
+    data = df.reset_index()
+    data = data.rename(columns={data.columns[0]: "Date"})
+    data["Date"] = pd.to_datetime(data["Date"]).dt.strftime('%Y-%m-%dT%H:%M:%S')
+    cols = ["Date", "Open", "High", "Low", "Close", "Volume", "RSI_14"] + [c for c in SMA_COLORS if c in data]
+    values = data[[c for c in cols if c in data]].round(4).astype(object).where(data.notna(), None).to_dict('records')
+
+    x = {"field": "Date", "type": "temporal", "title": None}
+    color = {"condition": {"test": "datum.Open < datum.Close", "value": "#e0403f"}, "value": "#2a9d59"}
+    price = {
+        "height": height * 0.6,
+        "layer": [
+            {"mark": "rule", "encoding": {"x": x, "y": {"field": "Low", "type": "quantitative", "scale": {"zero": False},
+                                                         "title": "株価"},
+                                          "y2": {"field": "High"}, "color": color}},
+            {"mark": "bar", "encoding": {"x": x, "y": {"field": "Open", "type": "quantitative"},
+                                         "y2": {"field": "Close"}, "color": color}},
+        ] + [
+            {"mark": {"type": "line", "color": c, "strokeWidth": 1},
+             "encoding": {"x": x, "y": {"field": name, "type": "quantitative"}}}
+            for name, c in SMA_COLORS.items() if name in df
+        ],
+    }
+    volume = {"height": height * 0.15, "mark": "bar",
+              "encoding": {"x": x, "y": {"field": "Volume", "type": "quantitative", "title": "出来高"}, "color": color}}
+    rsi = {"height": height * 0.25, "layer": [
+        {"mark": {"type": "line", "color": "purple"},
+         "encoding": {"x": x, "y": {"field": "RSI_14", "type": "quantitative", "title": "RSI",
+                                    "scale": {"domain": [0, 100]}}}},
+        {"data": {"values": [{"y": 30}, {"y": 70}]}, "mark": {"type": "rule", "strokeDash": [4, 4], "color": "gray"},
+         "encoding": {"y": {"field": "y", "type": "quantitative"}}},
+    ]}
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "title": title,
+        "data": {"values": values},
+        "vconcat": [price, volume, rsi],
+        "resolve": {"scale": {"x": "shared"}},
+    }
+
+
+# ==========================================
+# 3. 画像で描画 (mplfinance)
+# ==========================================
+def render_png(df, title="", font_name="sans-serif"):
+    """mplfinance でPNGを作る (df は chart_frame の結果、図は必ず閉じる)"""
+    import io
+    import mplfinance as mpf
+    import matplotlib.pyplot as plt
+    plots = [
+        mpf.make_addplot(df['SMA_5'], color='orange', width=1),
+        mpf.make_addplot(df['SMA_25'], color='skyblue', width=1),
+        mpf.make_addplot(df['SMA_75'], color='green', width=1),
+        mpf.make_addplot(df['RSI_14'], color='purple', panel=2, ylabel='RSI')
+    ]
+    my_style = mpf.make_mpf_style(base_mpf_style='yahoo', rc={'font.family': font_name})
+    fig, ax = mpf.plot(df, type='candle', style=my_style, addplot=plots, volume=True, returnfig=True,
+                       title=title, figsize=(10,8), warn_too_much_data=len(df) + 1)
+    try:
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight')
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# ==========================================
+# 4. バックテスト結果の図 (Bokeh、ファイルを使わない)
+# ==========================================
+BACKTEST_MAX_POINTS = 600
+BULL_COLOR, BEAR_COLOR = "#e0403f", "#2a9d59"
+
+
+def backtest_html(df, equity, trades, title="", max_points=BACKTEST_MAX_POINTS):
+    """
+    資産推移 (上段) とローソク足・売買位置 (下段) の図を HTML 文字列で返す
+    df: OHLCV、equity: 資産額のSeries、trades: Backtest.run() の _trades (EntryTime などの列)
+    """
+    from bokeh.plotting import figure
+    from bokeh.layouts import column
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+
+    keep = lttb(equity.values, max_points)
+    eq = equity.iloc[keep]
+    price = downsample(df, max_points)
+    width_ms = float(np.median(np.diff(price.index.values).astype('timedelta64[ms]').astype(float))) * 0.8 \
+        if len(price) > 1 else 8.64e7 * 0.8
+
+    tools = "xpan,xwheel_zoom,box_zoom,reset,save"
+    p_eq = figure(x_axis_type='datetime', height=180, sizing_mode='stretch_width', tools=tools,
+                  title=title, active_scroll='xwheel_zoom')
+    p_eq.line(eq.index, eq.values, color='navy', line_width=1.5, legend_label="資産額")
+    p_eq.legend.location = 'top_left'
+
+    p_px = figure(x_axis_type='datetime', height=320, sizing_mode='stretch_width', tools=tools,
+                  x_range=p_eq.x_range, active_scroll='xwheel_zoom')
+    up = price['Close'] >= price['Open']
+    colors = np.where(up, BULL_COLOR, BEAR_COLOR)
+    p_px.segment(price.index, price['High'], price.index, price['Low'], color=colors)
+    p_px.vbar(price.index, width_ms, price['Open'], price['Close'], fill_color=colors, line_color=colors)
+    if trades is not None and len(trades):
+        p_px.scatter(trades['EntryTime'], trades['EntryPrice'], marker='triangle', size=9,
+                     color='black', legend_label="買い")
+        closed = trades.dropna(subset=['ExitPrice'])
+        p_px.scatter(closed['ExitTime'], closed['ExitPrice'], marker='inverted_triangle', size=9,
+                     color=np.where(closed['PnL'] > 0, BULL_COLOR, BEAR_COLOR).tolist(), legend_label="決済")
+        p_px.legend.location = 'top_left'
+    return file_html(column(p_eq, p_px, sizing_mode='stretch_width'), CDN, title or "backtest")
+
+
+# ==========================================
+# 5. ベンチマーク (描画時間とRSS)
+# ==========================================
+def rss_mb():
+    """現在のプロセスの常駐メモリ (MB)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark(df, renders=30):
+    """各描画方式を renders 回繰り返し、1回あたりの時間と RSS の増え方を返す"""
+    import json
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import mplfinance as mpf
+
+    frame = chart_frame(df)
+    full = chart_frame(df, max_points=len(df))
+
+    def unclosed():
+        # 従来の描画 (figを閉じない)
+        mpf.plot(full, type='candle', style='yahoo', volume=True, returnfig=True, figsize=(10,8),
+                 warn_too_much_data=len(full) + 1)[0].savefig(os.devnull, format='png')
+
+    cases = {
+        "vega-lite (間引きあり)": lambda: json.dumps(vega_spec(frame)),
+        "vega-lite (間引きなし)": lambda: json.dumps(vega_spec(full)),
+        "mplfinance (図を閉じる)": lambda: render_png(full),
+        "mplfinance (図を閉じない)": unclosed,
+    }
+    rows = []
+    for name, func in cases.items():
+        func()  # 初回のimport等を除く
+        before, t0 = rss_mb(), time.perf_counter()
+        for _ in range(renders):
+            func()
+        rows.append({"描画方式": name, "1回あたり[ms]": (time.perf_counter() - t0) / renders * 1000,
+                     "RSS増加[MB]": rss_mb() - before})
+    plt.close('all')
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="チャート描画の時間とメモリ使用量の比較")
+    parser.add_argument('ticker', nargs='?', help="銘柄 (省略時は乱数データ)")
+    parser.add_argument('--bars', type=int, default=1500, help="乱数データの足数")
+    parser.add_argument('--renders', type=int, default=30, help="繰り返し描画する回数")
+    args = parser.parse_args(argv)
+
+    if args.ticker:
+        from price_store import PriceStore
+        df = PriceStore().get(args.ticker, period="5y")
+    else:
+        from vector_backtest import synthetic_ohlcv
+        df = synthetic_ohlcv(n=args.bars, seed=0)
+    print(f"{len(df)}本 → 間引き後 {min(len(df), CHART_MAX_POINTS)}本, {args.renders}回描画")
+    print(benchmark(df, args.renders).to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import sys
+import copy
+import time
+import argparse
+import threading
+import pandas as pd
+import intraday
+from price_store import period_start
+from intraday import ChunkedBacktest
+from strategies import STRATEGIES, BUY, SELL, best_strategy, check_current_signal
+from line_push import signal_key
+from metrics import METRICS
+
+"""
+daemon.py (常駐して新しい足を監視する notify の常駐モード)
+・1日1回の起動 (cron) の代わりに常駐し、指標とバックテストの途中状態を銘柄ごとにメモリに持ち続けます。
+・poll 秒ごとに新しい足を取得し、足が変わった銘柄だけ、増えた足の分だけ状態を進めて判定し直します。
+  最後の足は取引中に値が変わるので仮の足として扱い、状態のコピーに足して判定します
+  (次の足が来て確定するまで、本体の状態には入れません)。
+・勝率No.1の戦略の判定が「買い / 売り」に変わった銘柄があった時だけ、まとめて1通送ります。
+  起動直後の1回目は今の判定を覚えるだけで送りません。
+  同じ日に一度送った銘柄と判定の組は、送信側 (line_push) が送り直しません。
+・株価の取得元 (source)・送信先 (send)・時計 (clock) は差し替えられます。
+  FakeSource と FakeClock を使えば、通信も待ち時間もなしで何日分でも動かせます
+  (python daemon.py で架空の分足を使った動作確認)。
+"""
+
+POLL_SECONDS = 300
+
+# 取引時間 (intraday.SESSIONS) の時刻は東京の時刻
+MARKET_TZ = "Asia/Tokyo"
+
+# 取引時間の外でも、引け後しばらくは確定した最後の足を取りに行く
+CLOSE_GRACE = pd.Timedelta(minutes=30)
+
+
+# ==========================================
+# 1. 時計と株価の取得元 (差し替え可能)
+# ==========================================
+class SystemClock:
+    """実際の時計 (東京の時刻をタイムゾーン無しで返す。stop() で待ちを中断できる)"""
+    def __init__(self):
+        self._stop = threading.Event()
+
+    def now(self):
+        # サーバー (GitHub Actions など) は UTC のことが多いので、ホストの時刻ではなく東京の時刻
+        return pd.Timestamp.now(tz=MARKET_TZ).tz_localize(None)
+
+    def sleep(self, seconds):
+        self._stop.wait(max(seconds, 0))
+
+    def stop(self):
+        self._stop.set()
+
+
+class FakeClock:
+    """sleep() で時刻を進めるだけの時計 (オフライン検証用)"""
+    def __init__(self, start):
+        self.time = pd.Timestamp(start)
+        self.slept = 0.0
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += pd.Timedelta(seconds=seconds)
+        self.slept += seconds
+
+    def stop(self):
+        pass
+
+
+class StoreSource:
+    """日足 (PriceStore) から読む。初回は period 分、以降は since 以降だけ"""
+    def __init__(self, store, period="2y"):
+        self.store = store
+        self.period = period
+
+    def update(self, tickers):
+        self.store.refresh_many(list(tickers))
+
+    def bars(self, ticker, since=None):
+        df = self.store.load(ticker)
+        df = df[df.index >= (period_start(self.period) if since is None else since)]
+        if len(df):
+            yield df
+
+
+class IntradaySource:
+    """分足 (IntradayStore) から月ごとのチャンクで読む"""
+    def __init__(self, store):
+        self.store = store
+
+    def update(self, tickers):
+        self.store.update_many(list(tickers))
+
+    def bars(self, ticker, since=None):
+        return self.store.chunks(ticker, since)
+
+
+class FakeSource:
+    """手元のDataFrameのうち、時計の時刻までに出来た足だけを見せる (オフライン検証用)"""
+    def __init__(self, frames, clock, chunk_rows=intraday.CHUNK_ROWS):
+        self.frames = frames
+        self.clock = clock
+        self.chunk_rows = chunk_rows
+        self.updates = 0
+
+    def update(self, tickers):
+        self.updates += 1
+
+    def bars(self, ticker, since=None):
+        df = self.frames.get(ticker)
+        if df is None:
+            return
+        df = df[df.index <= self.clock.now()]
+        if since is not None:
+            df = df[df.index >= since]
+        for i in range(0, len(df), self.chunk_rows):
+            yield df.iloc[i:i + self.chunk_rows]
+
+
+def market_open(now, grace=CLOSE_GRACE):
+    """平日の取引時間中 (引け後 grace まで含む) か (タイムゾーン付きの時刻は東京の時刻にして見る)"""
+    if now.tzinfo is not None:
+        now = now.tz_convert(MARKET_TZ).tz_localize(None)
+    if now.weekday() >= 5:
+        return False
+    first = now.normalize() + pd.Timedelta(f"{intraday.SESSIONS[0][0]}:00")
+    last = now.normalize() + pd.Timedelta(f"{intraday.SESSIONS[-1][1]}:00") + grace
+    return first <= now <= last
+
+
+# ==========================================
+# 2. 銘柄ごとの常駐状態
+# ==========================================
+class TickerState:
+    """
+    1銘柄の途中状態
+    ・engine: 確定した足まで進めたバックテスト (指標の状態も含む)
+    ・pending: まだ確定していない最後の足 (1行のDataFrame)
+    ・signal: 最後に判定した (戦略名, 判定, 根拠)
+    """
+    def __init__(self, cash=1000000, commission=.002):
+        self.engine = ChunkedBacktest(cash, commission)
+        self.pending = None
+        self.signal = None
+        self.stats = None
+
+    def advance(self, chunks):
+        """
+        新しい足 (pending の時刻以降) を確定分だけ engine に流す
+        戻り値: 足が増えた・最後の足の値が変わったなら True
+        """
+        previous = self.pending
+        held, fed = None, 0
+        for chunk in chunks:
+            if held is not None:
+                chunk = pd.concat([held, chunk])
+            self.engine.feed(chunk.iloc[:-1])
+            fed += len(chunk) - 1
+            held = chunk.iloc[-1:]
+        if held is None:
+            return False
+        self.pending = held
+        return fed > 0 or previous is None or not previous.equals(held)
+
+    def evaluate(self):
+        """仮の最後の足を状態のコピーに足し、全戦略の成績と勝率No.1の戦略の判定を出す"""
+        tentative = copy.deepcopy(self.engine).feed(self.pending)
+        stats = tentative.stats()
+        self.stats = [stats.get(s["name"]) for s in STRATEGIES]
+        name, win_rate = best_strategy(self.stats)
+        rows = [r for r in (tentative.ind.prev_row, tentative.ind.row) if r is not None]
+        action, reason = check_current_signal(name, pd.DataFrame(rows))
+        return name, win_rate, action, reason
+
+
+# ==========================================
+# 3. 監視ループ
+# ==========================================
+class Watcher:
+    """
+    poll 秒ごとに 取得 → 足が変わった銘柄だけ状態を進めて判定 → 判定が変わったら送信 を繰り返す
+    tickers: {銘柄: 名前} を返す関数 (reload 秒ごとに呼び直す)
+    send: send(ブロック, header) で送る関数 (notify.send_line_push など)。ブロックは (重複除外のキー, 本文)
+    """
+    def __init__(self, source, tickers, send, clock=None, poll=POLL_SECONDS, market_hours=False,
+                 reload=3600, cash=1000000, commission=.002):
+        self.source = source
+        self.tickers = tickers
+        self.send = send
+        self.clock = clock or SystemClock()
+        self.poll = poll
+        self.market_hours = market_hours
+        self.reload = reload
+        self.cash = cash
+        self.commission = commission
+        self.states = {}
+        self.names = {}
+        self.loaded_at = None
+        self.polls = 0
+        self.running = False
+
+    def refresh_tickers(self):
+        now = self.clock.now()
+        if self.loaded_at is None or (now - self.loaded_at).total_seconds() >= self.reload:
+            self.names = dict(self.tickers())
+            self.loaded_at = now
+            for t in list(self.states):
+                if t not in self.names:
+                    del self.states[t]
+
+    def poll_once(self):
+        """1回分の監視。送ったメッセージ (無ければ None) を返す"""
+        self.refresh_tickers()
+        with METRICS.span("daemon.fetch", tickers=len(self.names)):
+            self.source.update(self.names)
+        changes = []
+        for t, name in self.names.items():
+            try:
+                change = self.check(t, name)
+            except Exception as e:
+                print(f"[WARN] 監視中の判定失敗 {t}: {e}")
+                METRICS.failure("daemon.ticker", e, ticker=t)
+                continue
+            if change:
+                changes.append(change)
+        self.polls += 1
+        if not changes:
+            return None
+        header = f"🔔 シグナル変化 ({self.clock.now():%m/%d %H:%M})"
+        with METRICS.span("daemon.send", changes=len(changes)):
+            self.send(changes, header)
+        METRICS.incr("daemon.pushed")
+        return "\n".join([header] + [text for _, text in changes])
+
+    def check(self, ticker, name):
+        """1銘柄の新しい足を処理し、判定が買い・売りに変わったら (重複除外のキー, レポートの行) を返す"""
+        state = self.states.get(ticker)
+        first = state is None
+        if first:
+            state = self.states[ticker] = TickerState(self.cash, self.commission)
+        since = None if state.pending is None else state.pending.index[0]
+        with METRICS.span("daemon.advance", ticker=ticker) as span:
+            changed = state.advance(self.source.bars(ticker, since))
+            span["changed"] = changed
+        if not changed:
+            METRICS.incr("daemon.unchanged")
+            return None
+        METRICS.incr("daemon.changed")
+        with METRICS.span("daemon.evaluate", ticker=ticker):
+            strategy, win_rate, action, reason = state.evaluate()
+        previous, state.signal = state.signal, (strategy, action, reason)
+        if first or previous is None or previous[:2] == (strategy, action) or action not in (BUY, SELL):
+            return None
+        close = float(state.pending['Close'].iloc[0])
+        text = (f"{'🚀' if action == BUY else '🔻'} 【{name}】 ({ticker}) {int(close):,}円\n"
+                f"{strategy} (勝率{win_rate:.0f}%): {action} / {reason}")
+        return signal_key(ticker, action), text
+
+    def run(self, cycles=None):
+        """cycles 回 (None なら stop() まで) 監視を繰り返す"""
+        self.running = True
+        done = 0
+        while self.running and (cycles is None or done < cycles):
+            # 次の回の時刻は差し替えた時計で決める (FakeClock がホストの処理時間でずれないように)
+            deadline = self.clock.now() + pd.Timedelta(seconds=self.poll)
+            if not self.market_hours or market_open(self.clock.now()):
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    # 取得元の一時的な失敗などでは止まらず、次の回に取り直す
+                    print(f"[WARN] 監視の1回分が失敗: {e}")
+                    METRICS.failure("daemon.poll", e)
+            done += 1
+            if self.running and (cycles is None or done < cycles):
+                self.clock.sleep((deadline - self.clock.now()).total_seconds())
+        return done
+
+    def stop(self):
+        self.running = False
+        self.clock.stop()
+
+
+# ==========================================
+# 4. 架空の分足での動作確認
+# ==========================================
+def simulate(days=30, tickers=5, interval="5m", warmup_days=60, seed=0):
+    """
+    FakeClock と FakeSource で、warmup_days 分の履歴がある状態から days 日分を監視する
+    戻り値: (Watcher, 送ったメッセージの一覧)
+    """
+    frames = {}
+    for i in range(tickers):
+        frames[str(1000 + i)] = pd.concat(intraday.synthetic_chunks(warmup_days + days, interval, seed + i))
+    index = frames[next(iter(frames))].index
+    start = index[index.normalize() == index.normalize().unique()[warmup_days]][0]
+    clock = FakeClock(start)
+    sent = []
+
+    def send(blocks, header):
+        sent.append("\n".join([header] + [text for _, text in blocks]))
+
+    watcher = Watcher(FakeSource(frames, clock), lambda: {t: f"銘柄{t}" for t in frames}, send, clock,
+                      poll=intraday.INTERVALS[interval] * 60, market_hours=True)
+    cycles = int((index[-1] - start).total_seconds() // watcher.poll) + 1
+    watcher.run(cycles)
+    return watcher, sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="常駐モードの動作確認 (架空の分足・時計で通信なし)")
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--tickers', type=int, default=5)
+    parser.add_argument('--interval', default="5m", choices=list(intraday.INTERVALS))
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    watcher, sent = simulate(args.days, args.tickers, args.interval)
+    wall = time.perf_counter() - t0
+    for message in sent[-3:]:
+        print(message, "\n")
+    print(f"監視 {watcher.polls}回 (架空の時間 {watcher.clock.slept / 3600:.0f}時間) を {wall:.1f}秒で実行, 送信 {len(sent)}通")
+    print(METRICS.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+"""
+import_profile.py (起動時間の計測、開発用)
+・python -X importtime で対象を新しいプロセスで読み込み、パッケージごとの読み込み時間を多い順に表示します。
+・python import_profile.py notify : notify.py の読み込み (Actions の毎回の起動時間)
+・python import_profile.py app    : app.py を Streamlit なしで1回実行 (最初の画面が出るまでの処理)
+・--lazy-check を付けると、起動時に読み込まれてはいけない重いライブラリが混ざっていないかも確認します。
+"""
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+TARGETS = {
+    "notify": "import notify",
+    "app": "import runpy; runpy.run_path('app.py', run_name='__main__')",
+}
+
+# 起動時には読み込まず、使う処理の中で読み込むライブラリ
+HEAVY_MODULES = ["backtesting", "bokeh", "mplfinance", "matplotlib", "gspread", "oauth2client",
+                 "pandas_ta", "yfinance"]
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(text):
+    """-X importtime の出力を {トップレベルのパッケージ: (自身の時間の合計[ms], モジュール数)} にまとめる"""
+    totals = defaultdict(lambda: [0.0, 0])
+    for line in text.splitlines():
+        m = LINE.match(line)
+        if not m:
+            continue
+        package = m.group(4).split('.')[0]
+        totals[package][0] += int(m.group(1)) / 1000
+        totals[package][1] += 1
+    return {k: tuple(v) for k, v in totals.items()}
+
+
+def profile(target):
+    """新しいプロセスで対象を読み込み、(経過時間[秒], パッケージ別の集計) を返す"""
+    env = dict(os.environ, STREAMLIT_LOG_LEVEL="error")
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", TARGETS[target]],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+    return elapsed, parse_importtime(proc.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動時の読み込み時間をパッケージごとに表示する")
+    parser.add_argument('target', choices=sorted(TARGETS), help="計測する対象")
+    parser.add_argument('--top', type=int, default=15, help="表示するパッケージ数")
+    parser.add_argument('--lazy-check', action='store_true',
+                        help="起動時に重いライブラリ (HEAVY_MODULES) が読み込まれていたら失敗にする")
+    args = parser.parse_args(argv)
+
+    elapsed, packages = profile(args.target)
+    ranked = sorted(packages.items(), key=lambda kv: kv[1][0], reverse=True)
+    total = sum(v[0] for v in packages.values())
+    print(f"{args.target}: 起動 {elapsed * 1000:.0f} ms (うち読み込み {total:.0f} ms, {len(packages)}パッケージ)")
+    for name, (ms, count) in ranked[:args.top]:
+        print(f"  {name:<24} {ms:8.1f} ms  ({count}モジュール)")
+
+    loaded = [m for m in HEAVY_MODULES if m in packages]
+    if loaded:
+        print(f"起動時に読み込まれた重いライブラリ: {', '.join(loaded)}")
+    return 1 if args.lazy_check and loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
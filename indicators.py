@@ -0,0 +1,121 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+"""
+indicators.py (テクニカル指標の共有キャッシュ)
+・(銘柄, データの指紋, 指標名, パラメータ) をキーに計算結果を保持します。
+・判定用の指標列 (check_current_signal) も戦略クラスの init() も同じキャッシュから取るので、
+  SMA_25 や MACD_12_26_9 は1銘柄・1回の実行につき1回だけ計算されます。
+・ヒット/ミスの回数を数えているので、CACHE.stats() で削減効果を確認できます。
+・指標は株価のDataFrameに列として足さず、{列名: 配列} (indicator_arrays) で別に持ちます。
+  判定に要る直近の数本だけは signal_tail() で小さなDataFrameにします。
+"""
+
+# 指標名 → pandas_ta の計算関数
+FUNCTIONS = ("sma", "rsi", "macd", "bbands")
+
+
+def ta_function(kind):
+    """pandas_ta の関数 (pandas_ta は読み込みが重いので、初めて指標を計算する時に読み込む)"""
+    if kind not in FUNCTIONS:
+        raise KeyError(kind)
+    import pandas_ta as ta
+    return getattr(ta, kind)
+
+
+def signal_specs():
+    """
+    判定用に計算する指標 (check_current_signal が参照する列)
+    strategies のルールから作るので、ルールの既定値を変えれば判定用の指標も変わる
+    (strategies がこのモジュールを読み込むので、循環しないよう使う時に読み込む)
+    """
+    import strategies
+    return strategies.signal_specs()
+
+
+def fingerprint(close):
+    """終値配列の指紋 (同じデータなら同じ値になる)"""
+    values = np.ascontiguousarray(close, dtype=float)
+    return f"{len(values)}:{hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()}"
+
+
+class IndicatorCache:
+    """計算済み指標の保管庫 (件数上限を超えたら古いものから捨てる)"""
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, close, ticker="", **params):
+        """
+        指標を返す (未計算なら計算して保存)
+        戻り値は pandas_ta と同じ Series / DataFrame。共有しているので書き換えないこと
+        """
+        key = (str(ticker), fingerprint(close), kind, tuple(sorted(params.items())))
+        with self._lock:
+            if key in self._store:
+                self.hits += 1
+                self._store.move_to_end(key)
+                return self._store[key]
+            self.misses += 1
+        # 計算はロックの外で行う (同じ指標を2スレッドが同時に計算しても結果は同じ)
+        value = ta_function(kind)(pd.Series(np.asarray(close, dtype=float)), **params)
+        with self._lock:
+            self._store[key] = value
+            if len(self._store) > self.max_entries:
+                self._store.popitem(last=False)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._store),
+            "hit_rate": self.hits / total * 100 if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self.hits = self.misses = 0
+
+
+# プロセス内で共有するキャッシュ
+CACHE = IndicatorCache()
+
+
+def indicator_arrays(close, ticker="", specs=None):
+    """
+    指標を {列名 (pandas_ta と同じ): 配列} で返す (specs を省略すると判定用の指標)
+    配列はキャッシュの値そのもの (コピーしない) なので書き換えないこと
+    """
+    arrays = {}
+    for kind, params in specs or signal_specs():
+        value = CACHE.get(kind, close, ticker, **params)
+        if isinstance(value, pd.Series):
+            arrays[value.name] = value.values
+        else:
+            for col in value.columns:
+                arrays[col] = value[col].values
+    return arrays
+
+
+def signal_tail(df, ticker="", n=2, specs=None):
+    """判定用に、直近 n 本の終値と指標だけの小さなDataFrameを作る (df には列を足さない)"""
+    arrays = indicator_arrays(df['Close'].values, ticker, specs)
+    tail = {'Close': df['Close'].values[-n:].astype(float)}
+    tail.update({col: values[-n:] for col, values in arrays.items()})
+    return pd.DataFrame(tail, index=df.index[-n:])
+
+
+def append_indicators(df, ticker="", specs=None):
+    """df.ta.xxx(append=True) の代わりに、キャッシュから指標列を追加する (チャート描画用)"""
+    for col, values in indicator_arrays(df['Close'].values, ticker, specs).items():
+        df[col] = values
+    return df
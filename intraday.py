@@ -0,0 +1,465 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import strategies
+import vector_backtest
+from price_store import (BATCH_SIZE, TokenBucket, to_yf_ticker, normalize_frame, split_multi_frame,
+                         period_start, yfinance_fetcher, yfinance_batch_fetcher)
+from streaming import IndicatorSet
+from walkforward import new_state, add_return, state_stats
+from metrics import METRICS
+
+"""
+intraday.py (5分足・15分足の保存とチャンク単位のバックテスト)
+・分足は日足の約60〜70倍の行数になるので、1つのDataFrameに全期間を載せずに扱います。
+  - 保存: 銘柄ごとのフォルダに月ごとのParquet (data/intraday/5m/7203.T/2026-10.parquet) で持ち、
+    差分取得で増えた足は該当する月のファイルにだけ追記します。
+    yfinance で取れる分足は直近60日分だけですが、毎日差分を足していけば履歴は伸びていきます。
+  - 読み込み: chunks() で1か月分ずつ順に返します (メモリに載るのは常に1チャンク分)。
+  - 計算: ChunkedBacktest にチャンクを順に feed() します。指標 (streaming の IndicatorSet)、
+    建玉・現金・未約定の注文、資産のピーク、日次リターンの集計は次のチャンクへ引き継ぐので、
+    結果は全期間を一括で計算した vector_backtest.run() と一致します。
+    指標はチャンクごとに update_many() の配列演算、約定はシグナルが出た足だけのループです。
+・年率リターンなどの集計は、日足と同じく「1日の最後の足の資産」からの日次リターンで計算します。
+・一括計算との一致は tests/test_intraday.py で、処理速度 (足/秒) は python intraday.py bench で確認できます。
+"""
+
+INTRADAY_DIR = os.getenv('INTRADAY_DIR', os.path.join('data', 'intraday'))
+
+# 足の間隔 → 分
+INTERVALS = {"5m": 5, "15m": 15}
+
+# yfinance で取れる分足の期間 (5分足・15分足は直近60日まで)
+FETCH_LIMIT_DAYS = 59
+
+# バックテストで1回に流す本数 (月ごとのファイルをこの本数までまとめる。大きいほど速く、メモリを使う)
+CHUNK_ROWS = 10000
+
+# 東証の取引時間 (前場・後場)
+SESSIONS = [("09:00", "11:30"), ("12:30", "15:30")]
+
+
+def session_offsets(interval):
+    """1日の中の各足の開始時刻 (0時からの経過時間)"""
+    step = pd.Timedelta(minutes=INTERVALS[interval])
+    offsets = []
+    for start, end in SESSIONS:
+        t, end = pd.Timedelta(f"{start}:00"), pd.Timedelta(f"{end}:00")
+        while t < end:
+            offsets.append(t)
+            t += step
+    return pd.TimedeltaIndex(offsets)
+
+
+def report_bars(interval):
+    """レポート用に受け取る本数 (今日の足がすべて揃っていても、前の取引日の最後の足まで含む)"""
+    return len(session_offsets(interval)) + 1
+
+
+# ==========================================
+# 1. 月ごとのファイルに保存する分足
+# ==========================================
+class IntradayStore:
+    """
+    銘柄 × 足の間隔ごとに、分足を月ごとのParquetで保存する
+    ・update(): 最後に保存した日から取り直して追記 (その日の途中の足は確定値で上書き)
+    ・chunks(): 古い月から1か月分ずつ返す
+    """
+    def __init__(self, interval="5m", root=INTRADAY_DIR, fetcher=yfinance_fetcher,
+                 batch_fetcher=yfinance_batch_fetcher, limiter=None):
+        if interval not in INTERVALS:
+            raise ValueError(f"未対応の足の間隔です: {interval}")
+        self.interval = interval
+        self.root = os.path.join(root, interval)
+        self.fetcher = fetcher
+        self.batch_fetcher = batch_fetcher
+        self.limiter = limiter or TokenBucket()
+
+    def folder(self, ticker):
+        return os.path.join(self.root, to_yf_ticker(ticker))
+
+    def partitions(self, ticker):
+        """保存済みの月ファイル (古い順)"""
+        return sorted(glob.glob(os.path.join(self.folder(ticker), "*.parquet")))
+
+    def write(self, ticker, df):
+        """足を月ごとに分けて、該当する月のファイルにだけ追記する (同じ時刻の足は新しい方を残す)"""
+        df = normalize_frame(df)
+        if df.empty:
+            return 0
+        os.makedirs(self.folder(ticker), exist_ok=True)
+        for month, part in df.groupby(df.index.strftime('%Y-%m')):
+            path = os.path.join(self.folder(ticker), f"{month}.parquet")
+            if os.path.exists(path):
+                part = pd.concat([pd.read_parquet(path), part])
+                part = part[~part.index.duplicated(keep='last')].sort_index()
+            tmp = f"{path}.{os.getpid()}.tmp"
+            part.to_parquet(tmp)
+            os.replace(tmp, path)
+        return len(df)
+
+    def last_time(self, ticker):
+        """保存済みの最後の足の時刻 (無ければ None)"""
+        parts = self.partitions(ticker)
+        return pd.read_parquet(parts[-1]).index[-1] if parts else None
+
+    def fetch_start(self, ticker, now=None):
+        """差分取得の開始日 (最後に保存した日。yfinance で取れる期間より前なら None = 取れるだけ取る)"""
+        last = self.last_time(ticker)
+        now = pd.Timestamp.now() if now is None else now
+        if last is None or last < now.normalize() - pd.Timedelta(days=FETCH_LIMIT_DAYS):
+            return None
+        return last.normalize()
+
+    def update(self, ticker):
+        """1銘柄の差分を取得して保存し、追加・上書きした足の数を返す"""
+        start = self.fetch_start(ticker)
+        self.limiter.acquire()
+        raw = self.fetcher(to_yf_ticker(ticker), start=start, period=f"{FETCH_LIMIT_DAYS}d", interval=self.interval)
+        return self.write(ticker, raw)
+
+    def update_many(self, tickers, batch_size=BATCH_SIZE):
+        """複数銘柄をまとめて取得して保存する (取得できなかった銘柄は保存済みの分のまま)"""
+        tickers = list(tickers)
+        starts = {t: self.fetch_start(t) for t in tickers}
+        for i in range(0, len(tickers), batch_size):
+            chunk = tickers[i:i + batch_size]
+            known = [starts[t] for t in chunk]
+            start = None if any(s is None for s in known) else min(known)
+            yf_tickers = [to_yf_ticker(t) for t in chunk]
+            self.limiter.acquire()
+            try:
+                with METRICS.span("download", tickers=len(chunk), interval=self.interval):
+                    raw = self.batch_fetcher(yf_tickers, start=start, period=f"{FETCH_LIMIT_DAYS}d",
+                                             interval=self.interval)
+                frames = split_multi_frame(raw, yf_tickers)
+            except Exception as e:
+                print(f"[WARN] 分足の一括取得失敗 ({len(chunk)}銘柄): {e}")
+                frames = {}
+            for t, yf_t in zip(chunk, yf_tickers):
+                if yf_t in frames:
+                    self.write(t, frames[yf_t])
+
+    def chunks(self, ticker, start=None):
+        """古い月から1か月分ずつ返す (start より前の足は含めない)"""
+        start = None if start is None else pd.Timestamp(start)
+        for path in self.partitions(ticker):
+            if start is not None and os.path.basename(path)[:7] < start.strftime('%Y-%m'):
+                continue
+            df = pd.read_parquet(path)
+            if start is not None:
+                df = df[df.index >= start]
+            if not df.empty:
+                yield df
+
+    def load(self, ticker, period=None):
+        """指定期間の分足を1つのDataFrameで返す (チャートなど期間を区切って使う時だけ)"""
+        parts = list(self.chunks(ticker, None if period is None else period_start(period)))
+        return pd.concat(parts) if parts else normalize_frame(None)
+
+    def tail(self, ticker, bars=2):
+        """直近 bars 本 (新しい月から必要な分だけ読む)"""
+        parts, rows = [], 0
+        for path in reversed(self.partitions(ticker)):
+            parts.insert(0, pd.read_parquet(path))
+            rows += len(parts[0])
+            if rows >= bars:
+                break
+        return pd.concat(parts).iloc[-bars:] if parts else normalize_frame(None)
+
+    def get_many(self, tickers, bars=2):
+        """差分を取得してから、{銘柄: 直近 bars 本} を返す (データの無い銘柄は含まない)"""
+        self.update_many(tickers)
+        frames = {t: self.tail(t, bars) for t in tickers}
+        return {t: df for t, df in frames.items() if not df.empty}
+
+
+# ==========================================
+# 2. チャンク単位のバックテスト (状態を引き継ぐ)
+# ==========================================
+class ChunkedBacktest:
+    """
+    全戦略のバックテストを、古い順に渡されるチャンクで少しずつ進める
+    ・feed(df) の df は前のチャンクの続き (同じ足を2回渡さない)
+    ・stats() はそこまでの結果 (Backtest.run() と同じキー)
+    """
+    def __init__(self, cash=1000000, commission=.002):
+        self.cash = cash
+        self.commission = commission
+        self.ind = IndicatorSet()
+        self.bars = 0
+        self.first_close = None
+        self.last_close = None
+        self.states = {}
+        for rule in strategies.STRATEGIES:
+            s = new_state(cash, 0)
+            s.update({"start": None, "warmup": None, "warmup_close": None, "first": {},
+                      "day": None, "day_equity": None, "prev_day_equity": None})
+            self.states[rule["name"]] = s
+        self.curves = {name: [] for name in self.states}  # 日ごとの最後の資産 (画面の資産推移用)
+
+    def feed(self, df):
+        n = len(df)
+        if not n:
+            return self
+        open_ = df['Open'].to_numpy(dtype=float)
+        close = df['Close'].to_numpy(dtype=float)
+        days = df.index.normalize()
+        prev = self.ind.row
+        cols = self.ind.update_many(close)
+        # cross の判定に前のチャンクの最後の足も要るので、1本前の指標値を先頭に付ける
+        frame = pd.DataFrame(cols)
+        skip = 0
+        if prev is not None:
+            frame = pd.concat([pd.DataFrame([prev]), frame], ignore_index=True)
+            skip = 1
+        if self.first_close is None:
+            self.first_close = float(close[0])
+        bar = self.bars + np.arange(n)
+
+        for rule in strategies.STRATEGIES:
+            s = self.states[rule["name"]]
+            values = strategies.frame_columns(rule, frame)
+            entry, exit_ = strategies.signals(rule, values)
+            entry, exit_ = entry[skip:], exit_[skip:]
+            if s["warmup"] is None:
+                self._find_warmup(s, rule, {k: v[skip:] for k, v in values.items()}, close)
+            seen = bar >= s["start"] if s["start"] is not None else np.zeros(n, dtype=bool)
+            entry = entry & seen
+            exit_ = exit_ & seen & ~entry  # next() と同じく買い判定を優先
+            equity = self._simulate(s, open_, close, entry, exit_, rule["pyramid"])
+            self._daily(s, rule["name"], days, equity)
+
+        self.bars += n
+        self.last_close = float(close[-1])
+        return self
+
+    def _find_warmup(self, s, rule, values, close):
+        """指標が揃った足 (vector_backtest.warmup_bars と同じ) を探し、揃ったら判定を始める足を決める"""
+        for alias in rule["indicators"]:
+            if s["first"].get(alias) is None:
+                valid = np.flatnonzero(~np.isnan(values[alias]))
+                if len(valid):
+                    s["first"][alias] = self.bars + int(valid[0])
+        if all(s["first"].get(alias) is not None for alias in rule["indicators"]):
+            s["warmup"] = max(s["first"].values())
+            s["start"] = s["warmup"] + 1
+            s["warmup_close"] = float(close[s["warmup"] - self.bars])
+
+    def _simulate(self, s, open_, close, entry, exit_, pyramid):
+        """
+        チャンク内の約定を処理して各足の資産額を返す (ループはシグナルが出た足だけ)
+        シグナル足の次の足の始値で約定。チャンクの最後の足のシグナルは未約定の注文として次へ引き継ぐ
+        """
+        n = len(close)
+        commission = self.commission
+        units = np.zeros(n + 1)
+        cost = np.zeros(n + 1)
+        cash_delta = np.zeros(n + 1)
+        cash0 = s["cash"]
+        units[0] = sum(size for size, _ in s["holding"])
+        cost[0] = sum(size * price for size, price in s["holding"])
+
+        def execute(b, order):
+            price = open_[b]
+            if order == "buy":
+                margin = s["cash"] - sum(size * p for size, p in s["holding"])
+                size = int(margin * vector_backtest.FULL_EQUITY // (price * (1 + commission)))
+                if size > 0:
+                    s["holding"].append([size, float(price)])
+                    s["cash"] -= size * price * commission
+                    units[b] += size
+                    cost[b] += size * price
+                    cash_delta[b] -= size * price * commission
+            elif order == "close":
+                for size, p in s["holding"]:
+                    comm = (p + price) * size * commission
+                    pl = size * (price - p) - comm
+                    ret = (price / p - 1) - comm / (size * p)
+                    s["cash"] += size * (price - p) - size * price * commission
+                    s["trades"] += 1
+                    s["wins"] += int(pl > 0)
+                    if ret > 0:
+                        s["ret_pos"] += ret
+                    elif ret < 0:
+                        s["ret_neg"] += ret
+                    units[b] -= size
+                    cost[b] -= size * p
+                    cash_delta[b] += size * (price - p) - size * price * commission
+                s["holding"] = []
+
+        if s["pending"]:
+            execute(0, s["pending"])
+            s["pending"] = None
+        for k in np.flatnonzero(entry | exit_):
+            order = None
+            if entry[k]:
+                if pyramid or not s["holding"]:
+                    order = "buy"
+            elif s["holding"]:
+                order = "close"
+            if order and k + 1 < n:
+                execute(k + 1, order)
+            elif order:
+                s["pending"] = order
+
+        equity = cash0 + np.cumsum(cash_delta[:n]) + np.cumsum(units[:n]) * close - np.cumsum(cost[:n])
+        peaks = np.maximum.accumulate(np.concatenate([[s["peak"]], equity]))[1:]
+        s["max_dd"] = max(s["max_dd"], float((1 - equity / peaks).max()))
+        s["peak"] = float(peaks[-1])
+        s["equity"] = float(equity[-1])
+        s["bars"] += n
+        return equity
+
+    def _daily(self, s, name, days, equity):
+        """1日の最後の足の資産から日次リターンを集計する (その日が次のチャンクに続く時は持ち越す)"""
+        ends = np.flatnonzero(np.append(days[1:] != days[:-1], True))
+        finished = []
+        if s["day"] is not None and pd.Timestamp(s["day"]) != days[ends[0]]:
+            finished.append((s["day"], s["day_equity"]))
+        finished += [(str(days[k].date()), float(equity[k])) for k in ends[:-1]]
+        for day, value in finished:
+            if s["prev_day_equity"] is not None:
+                add_return(s, value / s["prev_day_equity"] - 1)
+            s["prev_day_equity"] = value
+            self.curves[name].append((day, value))
+        s["day"] = str(days[ends[-1]].date())
+        s["day_equity"] = float(equity[ends[-1]])
+
+    def stats(self):
+        """{戦略名: 統計値}。最後の日 (続きが来るかもしれない日) もその時点の資産で集計に含める"""
+        out = {}
+        for name, s in self.states.items():
+            s = {**s, "holding": [list(h) for h in s["holding"]]}
+            if s["day"] is not None and s["prev_day_equity"] is not None:
+                add_return(s, s["day_equity"] / s["prev_day_equity"] - 1)
+            start = s["warmup_close"] if s["warmup_close"] is not None else self.first_close
+            out[name] = pd.Series(state_stats(s, start, self.last_close), dtype=object)
+        return out
+
+    def equity_curve(self, name):
+        """日ごとの最後の資産額 (最後の日を含む)"""
+        rows = self.curves[name] + [(self.states[name]["day"], self.states[name]["day_equity"])]
+        return pd.Series([v for _, v in rows], index=pd.to_datetime([d for d, _ in rows]), name="Equity")
+
+
+def backtest(store, ticker, cash=1000000, commission=.002, start=None, rows=CHUNK_ROWS):
+    """保存済みの分足を rows 本ずつ流して全戦略をバックテストする"""
+    engine = ChunkedBacktest(cash, commission)
+    for chunk in rechunk(store.chunks(ticker, start), rows):
+        engine.feed(chunk)
+    return engine
+
+
+def rechunk(frames, rows):
+    """チャンクの並びを rows 本ずつのチャンクに切り直す"""
+    buf = []
+    for df in frames:
+        buf.append(df)
+        total = sum(len(b) for b in buf)
+        while total >= rows:
+            joined = pd.concat(buf)
+            yield joined.iloc[:rows]
+            buf = [joined.iloc[rows:]]
+            total -= rows
+    if buf and sum(len(b) for b in buf):
+        yield pd.concat(buf)
+
+
+# ==========================================
+# 3. 架空の分足・速度計測
+# ==========================================
+def synthetic_chunks(days=250, interval="5m", seed=0, chunk_days=20):
+    """
+    架空の分足 (取引時間だけ、日をまたぐ窓開けあり) を chunk_days 日分ずつ返す
+    全期間を一度に作らないので、長い期間でもメモリは1チャンク分
+    """
+    rng = np.random.default_rng(seed)
+    offsets = session_offsets(interval)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=days)
+    price = rng.uniform(500, 5000)
+    for i in range(0, days, chunk_days):
+        block = dates[i:i + chunk_days]
+        index = pd.DatetimeIndex([d + o for d in block for o in offsets], name='Date')
+        n = len(index)
+        ret = rng.normal(0, 0.002, n)
+        ret[::len(offsets)] += rng.normal(0, 0.01, len(block))  # 寄り付きの窓
+        close = price * np.exp(np.cumsum(ret))
+        open_ = np.concatenate([[price], close[:-1]]) * np.exp(rng.normal(0, 0.0005, n))
+        price = close[-1]
+        wick = np.abs(rng.normal(0, 0.001, (2, n)))
+        yield pd.DataFrame({
+            'Open': open_, 'High': np.maximum(open_, close) * (1 + wick[0]),
+            'Low': np.minimum(open_, close) * (1 - wick[1]), 'Close': close,
+            'Volume': np.round(rng.lognormal(8, 1, n)),
+        }, index=index)
+
+
+def bench(days=500, interval="5m", seed=0):
+    """保存 → チャンク読み込み → 指標 → 全戦略バックテスト の処理速度 (足/秒) とピークメモリ"""
+    import tempfile
+    from benchmark import peak_rss_mb
+    report = {}
+    with tempfile.TemporaryDirectory() as root:
+        store = IntradayStore(interval, root=root)
+        t0 = time.perf_counter()
+        bars = sum(store.write("BENCH", c) for c in synthetic_chunks(days, interval, seed))
+        report["保存"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in store.chunks("BENCH"):
+            pass
+        report["読み込み"] = time.perf_counter() - t0
+
+        ind = IndicatorSet()
+        t0 = time.perf_counter()
+        for chunk in rechunk(store.chunks("BENCH"), CHUNK_ROWS):
+            ind.update_many(chunk['Close'].to_numpy(dtype=float))
+        report["指標 (チャンク)"] = time.perf_counter() - t0
+
+        ind = IndicatorSet()
+        sample = next(store.chunks("BENCH"))['Close'].to_numpy(dtype=float)
+        t0 = time.perf_counter()
+        for x in sample:
+            ind.update(x)
+        report["指標 (1本ずつ)"] = (time.perf_counter() - t0) * bars / len(sample)
+
+        t0 = time.perf_counter()
+        engine = backtest(store, "BENCH")
+        report["バックテスト (読み込み込み)"] = time.perf_counter() - t0
+    print(f"{interval} × {days}日 = {bars:,}本 (1チャンク {CHUNK_ROWS:,}本)")
+    for stage, sec in report.items():
+        print(f"  {stage:<24} {bars / sec:>12,.0f} 本/秒  ({sec:.2f}秒)")
+    print(f"  ピークメモリ {peak_rss_mb():.0f} MB")
+    return {stage: bars / sec for stage, sec in report.items()}, engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分足のチャンク単位バックテスト")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("bench", help="処理速度 (足/秒) の計測 (通信なし)")
+    p.add_argument('--days', type=int, default=500)
+    p.add_argument('--interval', default="5m", choices=list(INTERVALS))
+    p = sub.add_parser("backtest", help="分足を取得・保存してバックテストする")
+    p.add_argument('tickers', nargs='+')
+    p.add_argument('--interval', default="5m", choices=list(INTERVALS))
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        bench(args.days, args.interval)
+        return 0
+    store = IntradayStore(args.interval)
+    store.update_many(args.tickers)
+    for t in args.tickers:
+        engine = backtest(store, t)
+        print(f"--- {t} ({args.interval}, {engine.bars:,}本) ---")
+        print(pd.DataFrame(engine.stats()).T[['Return [%]', '# Trades', 'Win Rate [%]', 'Max. Drawdown [%]']])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
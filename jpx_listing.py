@@ -0,0 +1,135 @@
+import os
+import time
+import bisect
+import unicodedata
+from collections import defaultdict
+import pandas as pd
+
+"""
+jpx_listing.py (東証の上場銘柄一覧)
+・JPXが公開している data_j.xls から (コード, 銘柄名, 市場・商品区分) を取得します。
+・取得した一覧は Parquet で保存し、LISTING_TTL を過ぎるまではダウンロードしません。
+・取得できない時は保存済みの一覧 (古くても) 、それも無ければ主要銘柄だけの既定リストを返します。
+・SearchIndex はコードの前方一致と銘柄名の部分一致 (1〜2文字のn-gram) で上位だけを返す検索索引です。
+"""
+
+JPX_LIST_URL = "https://www.jpx.co.jp/markets/statistics-equities/misc/tvdivq0000001vg2-att/data_j.xls"
+LISTING_PATH = os.getenv('JPX_LISTING_PATH', os.path.join('data', 'jpx_listing.parquet'))
+LISTING_TTL = 7 * 24 * 3600  # 銘柄一覧の入れ替えは月次程度なので1週間に1回で十分
+
+DEFAULT_LISTING = [
+    ("7203", "トヨタ自動車"), ("9984", "ソフトバンクグループ"), ("8306", "三菱UFJフィナンシャル・グループ"),
+    ("6758", "ソニーグループ"), ("6861", "キーエンス"), ("6098", "リクルートホールディングス"),
+    ("9432", "日本電信電話"), ("4063", "信越化学工業"), ("8035", "東京エレクトロン"),
+    ("9861", "吉野家ホールディングス"), ("7267", "ホンダ"), ("5401", "日本製鉄"),
+]
+
+
+def default_listing():
+    df = pd.DataFrame(DEFAULT_LISTING, columns=['コード', '銘柄名'])
+    df['市場・商品区分'] = ""
+    return df
+
+
+def fetch_jpx_listing(url=JPX_LIST_URL):
+    """JPXの銘柄一覧を取得する (失敗時は例外)"""
+    df = pd.read_excel(url)
+    df['コード'] = df['コード'].astype(str).str.strip()
+    df['銘柄名'] = df['銘柄名'].astype(str).str.strip()
+    if '市場・商品区分' not in df.columns:
+        df['市場・商品区分'] = ""
+    return df[['コード', '銘柄名', '市場・商品区分']].reset_index(drop=True)
+
+
+def load_listing(path=LISTING_PATH, ttl=LISTING_TTL, fetcher=fetch_jpx_listing, now=None):
+    """銘柄一覧 (保存済みで期限内ならそれを使い、期限切れなら取り直して保存する)"""
+    now = time.time() if now is None else now
+    cached = None
+    if os.path.exists(path):
+        try:
+            cached = pd.read_parquet(path)
+            if now - os.path.getmtime(path) < ttl:
+                return cached
+        except Exception as e:
+            print(f"[WARN] 保存済み銘柄一覧の読み込み失敗: {e}")
+    try:
+        listing = fetcher()
+    except Exception as e:
+        print(f"[WARN] JPX銘柄一覧の取得失敗: {e}")
+        return cached if cached is not None else default_listing()
+    save_listing(listing, path)
+    return listing
+
+
+def save_listing(listing, path=LISTING_PATH):
+    """一覧を Parquet で保存する (途中で落ちても壊れないよう一時ファイルから置き換え)"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        listing.astype({'市場・商品区分': 'category'}).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[WARN] 銘柄一覧の保存失敗: {e}")
+
+
+def stock_codes(listing):
+    """ETF・REITなどを除いた株式のコード一覧 (区分が不明な既定リストはそのまま)"""
+    market = listing['市場・商品区分'].fillna("").astype(str)
+    mask = market.str.contains("株式") | (market == "")
+    return listing.loc[mask, 'コード'].tolist()
+
+
+# ==========================================
+# 検索索引
+# ==========================================
+def normalize(text):
+    """全角/半角・大文字/小文字・カタカナ/ひらがなの違いをそろえる"""
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    return "".join(chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c for c in text).replace(" ", "").replace("\u3000", "")
+
+
+class SearchIndex:
+    """
+    コードと銘柄名の検索索引
+    ・コードは前方一致、銘柄名は1文字・2文字のn-gramの転置索引で候補を絞ってから部分一致を確認
+    ・順位は コード完全一致 → コード前方一致 → 銘柄名前方一致 → 銘柄名部分一致 (同順位は短い名前が先)
+    """
+    def __init__(self, listing):
+        self.codes = listing['コード'].astype(str).tolist()
+        self.names = listing['銘柄名'].astype(str).tolist()
+        self.labels = [f"{c}: {n}" for c, n in zip(self.codes, self.names)]
+        self.keys = [normalize(n) for n in self.names]
+        self.grams = defaultdict(set)
+        for i, key in enumerate(self.keys):
+            for n in (1, 2):
+                for j in range(len(key) - n + 1):
+                    self.grams[key[j:j + n]].add(i)
+        # コードの前方一致は、並べたコードを二分探索して範囲だけを見る
+        self.by_code = sorted(range(len(self.codes)), key=lambda i: self.codes[i].lower())
+        self.sorted_codes = [self.codes[i].lower() for i in self.by_code]
+
+    def _name_candidates(self, q):
+        n = min(2, len(q))
+        grams = [q[j:j + n] for j in range(len(q) - n + 1)]
+        posting = sorted((self.grams.get(g, set()) for g in grams), key=len)
+        found = set(posting[0]) if posting else set()
+        for p in posting[1:]:
+            found &= p
+        return [i for i in found if q in self.keys[i]]
+
+    def search(self, query, limit=20):
+        """上位 limit 件の「コード: 銘柄名」を返す"""
+        q = normalize(query)
+        if not q:
+            return []
+        ranked = {}
+        if q.isascii():
+            lo = bisect.bisect_left(self.sorted_codes, q)
+            hi = bisect.bisect_left(self.sorted_codes, q + "\U0010ffff", lo)
+            for i in self.by_code[lo:hi]:
+                ranked[i] = (0 if self.codes[i].lower() == q else 1, self.codes[i])
+        for i in self._name_candidates(q):
+            if i not in ranked:
+                ranked[i] = (2 if self.keys[i].startswith(q) else 3, len(self.keys[i]), self.codes[i])
+        order = sorted(ranked, key=lambda i: ranked[i])[:limit]
+        return [self.labels[i] for i in order]
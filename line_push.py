@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:  # Windows ではファイルロックなし (同時に書くのは同じプロセスの中だけ)
+    fcntl = None
+
+"""
+line_push.py (LINE へのプッシュ通知の配信)
+・レポートを途中で切り捨てず、LINE の上限まで詰めて何通かに分けて送ります。
+  - 1つのテキストは MAX_TEXT 文字まで (LINE の数え方に合わせて UTF-16 で数える)
+  - 1回のリクエストにテキストを MAX_MESSAGES 個まで (通数の上限を消費するのはリクエスト単位)
+  銘柄ごとのレポート (ブロック) は途中で分けず、1ブロックが上限を超える時だけ行で分けます。
+・接続は requests.Session で使い回し、429 (混雑) / 5xx / 通信エラーは間隔を倍にしながら再送します。
+  再送は X-Line-Retry-Key を付けて送るので、届いていたのに応答だけ失われた場合も二重に届きません。
+・リクエストごとの結果 (ステータス・試行回数・リクエストID) を deliveries に残します。
+・(キー, 本文) で渡したブロックは、同じ日にもう届けたキーなら送りません (日付とキーは SENT_LOG_PATH に保存)。
+  notify の朝のレポートと常駐モードで、同じ銘柄の同じシグナルを1日に何度も送らないためのものです。
+  2つのプロセスが同時に書いても互いのキーを消さないよう、ロックを取ってファイルを読み直してから書きます。
+・分割・再送・重複除外は tests/test_line_push.py で、手元に立てた偽の LINE サーバーに対して確認します。
+"""
+
+PUSH_URL = os.getenv('LINE_PUSH_URL', 'https://api.line.me/v2/bot/message/push')
+SENT_LOG_PATH = os.getenv('LINE_SENT_LOG', os.path.join('data', 'line_sent.json'))
+
+MAX_TEXT = 5000
+MAX_MESSAGES = 5
+
+# 再送する応答 (それ以外の 4xx は送り直しても同じなので諦める)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Retry-After で指定されても、1回の再送でこれ以上は待たない (秒)
+MAX_RETRY_WAIT = 60
+
+
+# ==========================================
+# 1. メッセージへの詰め込み
+# ==========================================
+def text_length(text):
+    """LINE の文字数 (UTF-16 の単位。絵文字は2文字になる)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_block(text, limit=MAX_TEXT):
+    """上限を超える1ブロックを行ごとに分ける (1行が上限を超えるなら文字で切る)"""
+    parts, current = [], ""
+    for line in text.split("\n"):
+        while text_length(line) > limit:
+            cut = limit
+            while text_length(line[:cut]) > limit:
+                cut -= 1
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:cut])
+            line = line[cut:]
+        candidate = f"{current}\n{line}" if current else line
+        if current and text_length(candidate) > limit:
+            parts.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def pack(blocks, limit=MAX_TEXT):
+    """
+    [(キー, 本文)] を上限まで詰めたテキストにする
+    戻り値: [(テキスト, そのテキストに入ったキーの一覧)]
+    """
+    texts = []
+    text, keys = "", []
+    for key, block in blocks:
+        for part in split_block(block, limit) if text_length(block) > limit else [block]:
+            candidate = f"{text}\n{part}" if text else part
+            if text and text_length(candidate) > limit:
+                texts.append((text, keys))
+                text, keys, candidate = "", [], part
+            text = candidate
+        if key is not None:
+            keys.append(key)
+    if text:
+        texts.append((text, keys))
+    return texts
+
+
+def normalize(blocks):
+    """文字列 (1ブロック) / 文字列か (キー, 本文) の並び を [(キー, 本文)] にそろえる"""
+    if isinstance(blocks, str):
+        blocks = [blocks]
+    return [b if isinstance(b, tuple) else (None, b) for b in blocks if b]
+
+
+# ==========================================
+# 2. 送信済みの記録 (1日ごと)
+# ==========================================
+@contextlib.contextmanager
+def file_lock(path):
+    """別プロセスとの排他 (path のロック用ファイルを flock する。fcntl の無い環境では何もしない)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SentLog:
+    """
+    その日に届けたキーの記録 (日付が変わったら空にする)
+    ファイルが他のプロセスに書き換えられていたら (更新時刻が変わったら) 読み直して足す
+    """
+    def __init__(self, path=SENT_LOG_PATH, today=None):
+        self.path = path
+        self.today = today or (lambda: datetime.now().strftime('%Y-%m-%d'))
+        self.day, self.keys, self.mtime = None, set(), None
+        self._lock = threading.Lock()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def _read(self, day):
+        """保存済みの day のキー (無い・読めない・別の日なら空)"""
+        if not self.path or not os.path.exists(self.path):
+            return set()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] 送信記録の読み込み失敗: {e}")
+            return set()
+        return set(saved.get("keys", [])) if saved.get("day") == day else set()
+
+    def _load(self):
+        day = self.today()
+        if self.day != day:
+            self.day, self.keys, self.mtime = day, set(), None
+        mtime = self._mtime()
+        if mtime != self.mtime:
+            self.keys |= self._read(day)
+            self.mtime = mtime
+
+    def seen(self, key):
+        with self._lock:
+            self._load()
+            return key in self.keys
+
+    def add(self, keys):
+        if not keys:
+            return
+        with self._lock:
+            self._load()
+            self.keys.update(keys)
+            if not self.path:
+                return
+            folder = os.path.dirname(self.path) or "."
+            os.makedirs(folder, exist_ok=True)
+            with file_lock(f"{self.path}.lock"):
+                # ロックを取ってから読み直し、その間に他のプロセスが足したキーを消さない
+                self.keys |= self._read(self.day)
+                fd, tmp = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump({"day": self.day, "keys": sorted(self.keys)}, f, ensure_ascii=False)
+                    os.replace(tmp, self.path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+                self.mtime = self._mtime()
+
+
+def signal_key(ticker, action):
+    """重複除外のキー (同じ日の同じ銘柄・同じ判定は1回だけ送る)"""
+    return f"{ticker}:{action}"
+
+
+# ==========================================
+# 3. 送信 (再送・状態の記録)
+# ==========================================
+def retry_after(value, default, now=None):
+    """
+    Retry-After ヘッダー (秒数か HTTP-date) を待つ秒数にする
+    読めない値・ヘッダー無しは default、待ち時間は 0 〜 MAX_RETRY_WAIT 秒に収める
+    """
+    if not value:
+        return default
+    try:
+        wait = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return default
+        if when is None:
+            return default
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        wait = (when - (now or datetime.now(timezone.utc))).total_seconds()
+    if wait != wait:  # NaN
+        return default
+    return min(max(wait, 0.0), MAX_RETRY_WAIT)
+
+
+class LinePusher:
+    """
+    1人の宛先 (to) にプッシュ通知を送る
+    session / sleep / sent_log は差し替えられる (偽サーバーでの確認・記録を残さない実行用)
+    """
+    def __init__(self, token, to, url=PUSH_URL, session=None, retries=3, backoff=1.0, timeout=10,
+                 sleep=time.sleep, sent_log=None, limit=MAX_TEXT, max_messages=MAX_MESSAGES):
+        self.token = token
+        self.to = to
+        self.url = url
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session = session
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.sleep = sleep
+        self.sent_log = sent_log if sent_log is not None else SentLog()
+        self.limit = limit
+        self.max_messages = max_messages
+        self.deliveries = []
+
+    def send(self, blocks, header=""):
+        """
+        ブロックを詰めて送る。header は1通目の先頭に付ける (送るブロックが無ければ何も送らない)
+        戻り値: 全部届いたら True
+        """
+        blocks = self.unsent(blocks)
+        if not blocks:
+            METRICS.incr("line.skipped")
+            return True
+        if header:
+            blocks.insert(0, (None, header))
+        texts = pack(blocks, self.limit)
+        ok = True
+        for i in range(0, len(texts), self.max_messages):
+            batch = texts[i:i + self.max_messages]
+            delivery = self.post([t for t, _ in batch])
+            if delivery["ok"]:
+                self.sent_log.add([k for _, keys in batch for k in keys])
+            ok &= delivery["ok"]
+        return ok
+
+    def unsent(self, blocks):
+        """今日まだ届けていないブロック (キーの無いブロックは常に残す)"""
+        return [(k, b) for k, b in normalize(blocks) if k is None or not self.sent_log.seen(k)]
+
+    def post(self, texts):
+        """1リクエスト分 (テキスト MAX_MESSAGES 個まで) を再送込みで送り、結果を deliveries に足す"""
+        headers = {'Authorization': f'Bearer {self.token}', 'X-Line-Retry-Key': str(uuid.uuid4())}
+        payload = {'to': self.to, 'messages': [{'type': 'text', 'text': t} for t in texts]}
+        delivery = {"messages": len(texts), "chars": sum(map(text_length, texts)), "attempts": 0,
+                    "status": None, "ok": False, "request_id": None, "error": None}
+        with METRICS.span("line", messages=len(texts), chars=delivery["chars"]) as span:
+            for attempt in range(self.retries + 1):
+                delivery["attempts"] = attempt + 1
+                wait = self.backoff * 2 ** attempt
+                try:
+                    res = self.session.post(self.url, headers=headers, json=payload, timeout=self.timeout)
+                except requests.RequestException as e:
+                    delivery["status"], delivery["error"] = None, f"{type(e).__name__}: {e}"
+                else:
+                    delivery["status"] = res.status_code
+                    delivery["request_id"] = res.headers.get('X-Line-Request-Id')
+                    # 409 は同じ再送キーのリクエストを受付済み (前回の応答だけ失われた)
+                    if res.status_code == 200 or res.status_code == 409:
+                        delivery["ok"], delivery["error"] = True, None
+                        break
+                    delivery["error"] = res.text[:200]
+                    if res.status_code not in RETRY_STATUS:
+                        break
+                    wait = retry_after(res.headers.get('Retry-After'), wait)
+                if attempt < self.retries:
+                    METRICS.incr("line.retry")
+                    self.sleep(wait)
+            span.update(status=delivery["status"], attempts=delivery["attempts"], ok=delivery["ok"])
+        if not delivery["ok"]:
+            print(f"[ERROR] LINE送信失敗 ({delivery['status']}): {delivery['error']}")
+            METRICS.failure("line.delivery", RuntimeError(delivery["error"]), status=delivery["status"])
+        self.deliveries.append(delivery)
+        return delivery
+
+    def summary(self):
+        """送信結果の1行まとめ"""
+        d = self.deliveries
+        sent = sum(x["messages"] for x in d if x["ok"])
+        failed = sum(not x["ok"] for x in d)
+        retried = sum(x["attempts"] - 1 for x in d)
+        return f"LINE送信: {sum(x['ok'] for x in d)}/{len(d)}リクエスト ({sent}通), 再送{retried}回, 失敗{failed}"
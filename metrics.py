@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import deque, defaultdict
+import numpy as np
+import pandas as pd
+
+"""
+metrics.py (処理時間と件数の記録)
+・with METRICS.span("fetch", ticker=t): で段階ごとの処理時間を記録します
+  (中で例外が出ても、失敗として記録してから投げ直します)。
+・ワーカープロセスで動く処理は timed() で包んで時間ごと返し、親プロセスで record() します。
+・METRICS.incr() でキャッシュのヒットや失敗の件数を数えます。失敗は failure() で理由と一緒に残します。
+・1件ごとの記録は JSON 1行にして log_path (環境変数 METRICS_LOG) に追記し、
+  最後に summary() で段階別の表 (件数・失敗・合計・p50/p90/最大) を出します。
+"""
+
+METRICS_LOG = os.getenv('METRICS_LOG', '')
+
+
+def timed(func, *args):
+    """func(*args) を実行して (結果, 秒) を返す (プロセスプールに渡せるようにモジュール直下に置く)"""
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+class Metrics:
+    """段階ごとの処理時間 (span) と件数 (counter) の記録 (スレッドから同時に書いてもよい)"""
+    def __init__(self, log_path=METRICS_LOG, max_events=20000, clock=time.perf_counter):
+        self.log_path = log_path
+        self.clock = clock
+        self.events = deque(maxlen=max_events)  # 常駐する Streamlit でも増え続けないよう上限を設ける
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _emit(self, event):
+        event = {"ts": round(time.time(), 3), **event}
+        with self._lock:
+            self.events.append(event)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+        return event
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        with の中の処理時間を stage として記録する
+        as で受け取った辞書に項目を足すと、それも一緒に記録される (例: span["rows"] = len(df))
+        """
+        extra = dict(fields)
+        t0 = self.clock()
+        try:
+            yield extra
+        except Exception as e:
+            self.record(stage, self.clock() - t0, ok=False, error=f"{type(e).__name__}: {e}", **extra)
+            raise
+        self.record(stage, self.clock() - t0, **extra)
+
+    def record(self, stage, seconds, ok=True, **fields):
+        """測り終えた処理時間を記録する (timed() の結果など)"""
+        if not ok:
+            self.incr(f"{stage}.failed")
+        return self._emit({"type": "span", "stage": stage, "seconds": round(seconds, 6), "ok": ok, **fields})
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def failure(self, stage, error, **fields):
+        """握りつぶしていた失敗を、件数と理由だけでも残す"""
+        self.incr(f"{stage}.failed")
+        return self._emit({"type": "error", "stage": stage, "error": f"{type(error).__name__}: {error}", **fields})
+
+    def spans(self):
+        with self._lock:
+            rows = [e for e in self.events if e["type"] == "span"]
+        return pd.DataFrame(rows) if rows else pd.DataFrame(columns=["stage", "seconds", "ok"])
+
+    def summary(self):
+        """段階別の集計表 (記録順)"""
+        df = self.spans()
+        if df.empty:
+            return pd.DataFrame(columns=["段階", "件数", "失敗", "合計[秒]", "p50[ms]", "p90[ms]", "最大[ms]"])
+        rows = []
+        for stage, g in df.groupby("stage", sort=False):
+            ms = g["seconds"].to_numpy() * 1000
+            rows.append({"段階": stage, "件数": len(g), "失敗": int((~g["ok"]).sum()),
+                         "合計[秒]": ms.sum() / 1000, "p50[ms]": float(np.percentile(ms, 50)),
+                         "p90[ms]": float(np.percentile(ms, 90)), "最大[ms]": float(ms.max())})
+        return pd.DataFrame(rows)
+
+    def slowest(self, n=5):
+        """銘柄ごとの処理時間の合計が長い順 (ticker 付きの記録のみ)"""
+        df = self.spans()
+        if df.empty or "ticker" not in df:
+            return pd.Series(dtype=float)
+        return df.dropna(subset=["ticker"]).groupby("ticker")["seconds"].sum().nlargest(n)
+
+    def report(self):
+        """実行の最後に出す集計 (表・件数・遅い銘柄) の文字列。ログにも summary として1行残す"""
+        table = self.summary()
+        with self._lock:
+            counters = dict(sorted(self.counters.items()))
+        slow = self.slowest()
+        self._emit({"type": "summary", "stages": table.to_dict('records'), "counters": counters,
+                    "slowest": {str(k): round(v, 3) for k, v in slow.items()}})
+        lines = [table.to_string(index=False, float_format=lambda v: f"{v:.1f}")]
+        if counters:
+            lines.append("件数: " + ", ".join(f"{k}={v}" for k, v in counters.items()))
+        if len(slow):
+            lines.append("遅い銘柄: " + ", ".join(f"{k} {v:.2f}秒" for k, v in slow.items()))
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.counters.clear()
+
+
+# プロセス内で共有する記録
+METRICS = Metrics()
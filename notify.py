@@ -1,27 +1,35 @@
-import requests
 import os
 import sys
-import json
-import time
+import signal
+import argparse
+import asyncio
 from datetime import datetime
-import yfinance as yf
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
-import pandas_ta as ta
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-# バックテスト用ライブラリ
-try:
-    from backtesting import Backtest, Strategy
-    from backtesting.lib import crossover
-except ImportError:
-    print("[ERROR] backtestingライブラリが見つかりません。requirements.txtを確認してください。")
-    sys.exit(1)
+from price_store import PriceStore, OHLCV_COLUMNS, previous_close
+import vector_backtest
+import indicators
+import sweep
+from walkforward import WalkForward
+from sheet_repo import SheetRepository, open_spreadsheet
+import snapshot
+import portfolio
+import intraday
+import daemon
+import line_push
+from strategies import STRATEGIES, BUY, SELL, check_current_signal, best_strategy
+from metrics import METRICS, timed
 
 """
 notify.py (AI搭載・自動バックテスト版)
 ・過去2年間のデータを元に、4つの戦略から「最も勝率が高い戦略」を自動選定します。
 ・選定された戦略に基づいて、当日の売買判断（買い/売り/ステイ）を行います。
+  戦略のルールと判定は strategies にまとめてあり、バックテストと同じ条件で判定します。
+・--interval 5m / 15m で分足でも検証できます (分足は月ごとに保存し、チャンク単位で流してバックテスト)。
+・--portfolio で保有株全体を共通の資金で運用した場合の成績 (各銘柄は勝率No.1の戦略) も載せます。
+・レポートは切り捨てずに LINE の上限まで詰めて送り、同じ日に送ったシグナルは送り直しません (line_push.py)。
+・--daemon で常駐し、--poll 秒ごとに新しい足だけを処理して、判定が変わった銘柄だけを通知します (daemon.py)。
+・段階ごとの処理時間と失敗件数を最後に表で出します (--metrics-log でJSON 1行ずつのログも残せます)。
 """
 
 # ==========================================
@@ -32,183 +40,125 @@ MY_USER_ID = os.getenv('MY_USER_ID', '')
 SHEET_URL = os.getenv('SHEET_URL', '')
 GCP_KEY_JSON = os.getenv('GCP_SERVICE_ACCOUNT_KEY', '')
 
+# 株価データのローカル保存 (差分だけ取得する)
+PRICE_STORE = PriceStore()
+
 # ==========================================
-# 1. AI分析用 戦略クラス定義 (app.pyと共通)
+# 1. バックテスト実行 (並列実行対応)
 # ==========================================
+def run_strategy_backtest(job):
+    """
+    (戦略番号, 銘柄, 日付配列, OHLCV配列) を受け取ってバックテストし、数値の統計だけを返す
+    ワーカープロセスにはDataFrameではなくNumPy配列だけを送る
+    計算は Backtest.run() と同じ結果になる一括計算版 (vector_backtest) で行う
+    """
+    strat_idx, ticker, dates, values = job
+    try:
+        df = pd.DataFrame(values, index=pd.DatetimeIndex(dates), columns=OHLCV_COLUMNS)
+        stats = vector_backtest.run(df, STRATEGIES[strat_idx]["name"], cash=1000000, commission=.002, ticker=ticker)
+        return {k: v for k, v in stats.items() if not k.startswith('_')}
+    except Exception:
+        return None
 
-class SmaCross(Strategy):
-    n1 = 5
-    n2 = 25
-    def init(self):
-        close = pd.Series(self.data.Close)
-        self.sma1 = self.I(ta.sma, close, self.n1)
-        self.sma2 = self.I(ta.sma, close, self.n2)
-    def next(self):
-        if crossover(self.sma1, self.sma2): self.buy()
-        elif crossover(self.sma2, self.sma1): self.position.close()
-
-class RsiOscillator(Strategy):
-    upper = 70
-    lower = 30
-    def init(self):
-        close = pd.Series(self.data.Close)
-        self.rsi = self.I(ta.rsi, close, 14)
-    def next(self):
-        if crossover(self.rsi, self.lower): self.buy()
-        elif crossover(self.upper, self.rsi): self.position.close()
-
-class MacdTrend(Strategy):
-    def init(self):
-        close = pd.Series(self.data.Close)
-        macd = ta.macd(close, fast=12, slow=26, signal=9)
-        self.macd = self.I(lambda: macd.iloc[:, 0])
-        self.signal = self.I(lambda: macd.iloc[:, 1])
-    def next(self):
-        if crossover(self.macd, self.signal): self.buy()
-        elif crossover(self.signal, self.macd): self.position.close()
-
-class BollingerBands(Strategy):
-    def init(self):
-        close = pd.Series(self.data.Close)
-        bb = ta.bbands(close, length=20, std=2)
-        self.lower = self.I(lambda: bb.iloc[:, 0])
-        self.upper = self.I(lambda: bb.iloc[:, 2])
-    def next(self):
-        if self.data.Close < self.lower: 
-            if not self.position.is_long: self.buy()
-        elif self.data.Close > self.upper: 
-            self.position.close()
-
-STRATEGIES = [
-    {"name": "SMAクロス", "class": SmaCross},
-    {"name": "RSI逆張り", "class": RsiOscillator},
-    {"name": "MACD", "class": MacdTrend},
-    {"name": "ボリンジャー", "class": BollingerBands}
-]
+def backtest_jobs(df, ticker=""):
+    """1銘柄分の (戦略 × データ) のジョブ一覧"""
+    dates = df.index.values
+    values = df[OHLCV_COLUMNS].to_numpy(dtype=float)
+    return [(i, ticker, dates, values) for i in range(len(STRATEGIES))]
 
-# ==========================================
-# 2. 判定ロジック
-# ==========================================
-def check_current_signal(strategy_name, df):
-    """最新データに基づいて売買シグナルを判定"""
+def backtest_ticker(job):
+    """1銘柄の全戦略 (ワーカープロセス用、(銘柄, 日付配列, OHLCV配列) を受け取る)"""
+    ticker, dates, values = job
+    return [run_strategy_backtest((i, ticker, dates, values)) for i in range(len(STRATEGIES))]
+
+def walk_forward_one(ticker, verify=False, engine=None):
+    """1銘柄のウォークフォワード評価 (戻り値: [戦略ごとの統計], 直近2本の指標値)"""
+    engine = engine or WalkForward()
+    df = PRICE_STORE.load(ticker)
     try:
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
-        close = float(latest['Close'])
-        
-        # 安全に値を取得するヘルパー関数
-        def g(row, k, d=0): return float(row[k]) if k in row and not pd.isna(row[k]) else d
-
-        sma5, sma25 = g(latest,'SMA_5'), g(latest,'SMA_25')
-        p_sma5, p_sma25 = g(prev,'SMA_5'), g(prev,'SMA_25')
-        rsi = g(latest,'RSI_14', 50)
-        macd, sig = g(latest,'MACD_12_26_9'), g(latest,'MACDs_12_26_9')
-        p_macd, p_sig = g(prev,'MACD_12_26_9'), g(prev,'MACDs_12_26_9')
-        bbl, bbu = g(latest,'BBL_20_2.0'), g(latest,'BBU_20_2.0')
-
-        if strategy_name == "SMAクロス":
-            if p_sma5 < p_sma25 and sma5 > sma25: return "買い 🚀", "GC発生"
-            elif p_sma5 > p_sma25 and sma5 < sma25: return "売り 🔻", "DC発生"
-        elif strategy_name == "RSI逆張り":
-            if rsi < 30: return "買い 🚀", f"RSI売られすぎ({rsi:.0f})"
-            elif rsi > 70: return "売り 🔻", f"RSI買われすぎ({rsi:.0f})"
-        elif strategy_name == "MACD":
-            if p_macd < p_sig and macd > sig: return "買い 🚀", "MACD上抜け"
-            elif p_macd > p_sig and macd < sig: return "売り 🔻", "MACD下抜け"
-        elif strategy_name == "ボリンジャー":
-            if close < bbl: return "買い 🚀", "バンド下限割れ"
-            elif close > bbu: return "売り 🔻", "バンド上限到達"
-            
-        return "ステイ 🤔", "シグナルなし"
+        if verify:
+            diffs = engine.verify(ticker, df)
+            print(f"[検証] {ticker}: " + ("一致" if not diffs else f"不一致 {diffs}"))
+        stats = engine.update(ticker, df)
+        return [stats.get(s["name"]) for s in STRATEGIES], engine.rows[ticker]
     except Exception as e:
-        return "判定不能", f"エラー: {e}"
+        print(f"[WARN] ウォークフォワード評価失敗 {ticker}: {e}")
+        METRICS.failure("walk_forward", e, ticker=ticker)
+        return [None] * len(STRATEGIES), None
+
+def intraday_one(ticker, interval):
+    """保存済みの分足をチャンクごとに流して全戦略をバックテストする (戻り値は walk_forward_one と同じ形)"""
+    try:
+        engine = intraday.backtest(intraday.IntradayStore(interval), ticker)
+        stats = engine.stats()
+        return [stats.get(s["name"]) for s in STRATEGIES], (engine.ind.prev_row, engine.ind.row)
+    except Exception as e:
+        print(f"[WARN] 分足のバックテスト失敗 {ticker}: {e}")
+        METRICS.failure("intraday", e, ticker=ticker)
+        return [None] * len(STRATEGIES), None
 
 # ==========================================
-# 3. メイン処理・通知連携
+# 2. メイン処理・通知連携
 # ==========================================
 
 def get_tickers_from_sheet():
-    """スプレッドシートから保有株と監視株のリストを取得"""
+    """スプレッドシートから保有株と監視株のリストを取得 (2シートを1回でまとめ読み)"""
     try:
-        key_dict = json.loads(GCP_KEY_JSON)
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(key_dict, scope)
-        client = gspread.authorize(creds)
-
-        sheet = client.open_by_url(SHEET_URL)
-        
-        holdings_ws = sheet.worksheet('Holdings')
-        watchlist_ws = sheet.worksheet('Watchlist')
-        
-        holdings = {str(r['Ticker']).strip(): r['Name'] for r in holdings_ws.get_all_records() if r['Ticker']}
-        watchlist = {str(r['Ticker']).strip(): r['Name'] for r in watchlist_ws.get_all_records() if r['Ticker']}
-        
+        with METRICS.span("sheet") as span:
+            repo = SheetRepository(open_spreadsheet(GCP_KEY_JSON, SHEET_URL))
+            holdings, watchlist = repo.tickers('Holdings'), repo.tickers('Watchlist')
+            span["tickers"] = len(holdings) + len(watchlist)
         return holdings, watchlist
     except Exception as e:
         print(f"[ERROR] スプレッドシート読み込み失敗: {e}")
         return {}, {}
 
-def analyze_ticker_ai(ticker, name, mode="holding"):
+def analyze_ticker_ai(ticker, name, mode="holding", df=None, strategy_stats=None, sweep_table=None,
+                      signal_rows=None, signals=None):
     """
     AI分析実行関数
-    1. 過去2年のデータを取得
-    2. 全戦略をバックテスト
+    1. 過去2年のデータを取得 (一括取得済みのdfがあればそれを使う)
+    2. 全戦略をバックテスト (並列実行済みの結果strategy_statsがあればそれを使う)
+       パラメータ総当たりの結果sweep_tableがあれば、最上位の組み合わせも載せる
+       1本ずつ更新した指標の直近2本signal_rowsがあれば、指標の再計算をせずに判定に使う
     3. 勝率No.1の戦略を採用し、今日の売買判断を行う
+       signals に辞書を渡すと {銘柄: 判定} を入れて返す (送信済みのシグナルを送り直さないため)
     """
     try:
-        # コードの正規化
-        yf_ticker = str(ticker).strip()
-        if yf_ticker.isdigit():
-            yf_ticker = f"{yf_ticker}.T"
-
-        # データ取得 (バックテスト用に2年分)
-        time.sleep(1) 
-        df = yf.download(yf_ticker, period="2y", interval="1d", progress=False)
+        # データ取得 (バックテスト用に2年分、保存済みの分は取得しない)
+        if df is None:
+            df = PRICE_STORE.get(ticker, period="2y")
         
         if df.empty:
             return None
 
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
+        # 現在の指標計算（判定用の直近2本だけ、バックテストで計算済みの指標はキャッシュから取る）
+        if signal_rows is None:
+            with METRICS.span("indicators", ticker=ticker):
+                signal_df = indicators.signal_tail(df, ticker)
+        else:
+            signal_df = pd.DataFrame(list(signal_rows))
 
-        # 現在の指標計算（判定用）
-        df.ta.sma(length=5, append=True)
-        df.ta.sma(length=25, append=True)
-        df.ta.rsi(length=14, append=True)
-        df.ta.macd(fast=12, slow=26, signal=9, append=True)
-        df.ta.bbands(length=20, std=2, append=True)
-
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
-        close = float(latest['Close'])
-        prev_close = float(prev['Close'])
+        close = float(df['Close'].iloc[-1])
+        # 前日比計算 (分足は1本前の足ではなく、前の取引日の最後の足の終値と比べる)
+        prev_close, basis = previous_close(df)
         
-        # 前日比計算
         price_diff = close - prev_close
         price_change_pct = (price_diff / prev_close) * 100
         sign = "+" if price_diff > 0 else ""
-        price_str = f"{int(close):,}円 ({sign}{price_change_pct:.1f}%)"
+        price_str = f"{int(close):,}円 ({basis} {sign}{price_change_pct:.1f}%)"
 
         # --- AIバックテスト実行 ---
-        best_strat_name = "SMAクロス" # デフォルト
-        best_win_rate = -1
+        if strategy_stats is None:
+            strategy_stats = [run_strategy_backtest(job) for job in backtest_jobs(df, ticker)]
         
-        # 全戦略をテストしてベストを探す
-        for strat in STRATEGIES:
-            try:
-                bt = Backtest(df, strat["class"], cash=1000000, commission=.002)
-                stats = bt.run()
-                win_rate = stats['Win Rate [%]']
-                
-                # 勝率が高いものを採用 (同率なら後勝ち)
-                if win_rate >= best_win_rate:
-                    best_win_rate = win_rate
-                    best_strat_name = strat["name"]
-            except:
-                continue
+        # 全戦略の結果からベストを探す
+        best_strat_name, best_win_rate = best_strategy(strategy_stats)
 
         # ベスト戦略で現在の判定を行う
-        action_text, reason_text = check_current_signal(best_strat_name, df)
+        action_text, reason_text = check_current_signal(best_strat_name, signal_df)
+        if signals is not None:
+            signals[ticker] = action_text
         
         # シグナル有無フラグ
         is_signal = "買い" in action_text or "売り" in action_text
@@ -232,53 +182,223 @@ def analyze_ticker_ai(ticker, name, mode="holding"):
         if is_signal or mode == "holding":
             report += f"根拠: {reason_text}\n"
         
+        if sweep_table is not None and not sweep_table.empty:
+            top = sweep_table.iloc[0]
+            report += f"最適パラメータ: {top['戦略名']} {top['パラメータ']} (勝率{top['勝率']:.0f}%)\n"
+        
         report += "-" * 10
         return report
 
     except Exception as e:
         print(f"Error analyzing {ticker}: {e}")
+        METRICS.failure("analyze", e, ticker=ticker)
         return None
 
-def send_line_push(message):
-    if not CHANNEL_ACCESS_TOKEN or not MY_USER_ID:
+# LINE の送信 (接続を使い回すので1つだけ作る)
+LINE_PUSHER = None
+
+def send_line_push(blocks, header=""):
+    """
+    レポートを LINE の上限まで詰めて送る (切り捨てない・失敗は再送する)
+    blocks: 文字列か、文字列 / (重複除外のキー, 本文) の並び。同じ日に送ったキーのブロックは送らない
+    """
+    pusher = line_pusher()
+    if pusher is None:
         print("[ERROR] LINE設定不足")
         return False
-    
-    url = 'https://api.line.me/v2/bot/message/push'
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {CHANNEL_ACCESS_TOKEN}'}
-    payload = {'to': MY_USER_ID, 'messages': [{'type': 'text', 'text': message}]}
-    
+    return pusher.send(blocks, header)
+
+def line_pusher():
+    """LINE の送信先 (設定が無ければ None)"""
+    global LINE_PUSHER
+    if LINE_PUSHER is None and CHANNEL_ACCESS_TOKEN and MY_USER_ID:
+        LINE_PUSHER = line_push.LinePusher(CHANNEL_ACCESS_TOKEN, MY_USER_ID)
+    return LINE_PUSHER
+
+def report_blocks(reports, signals):
+    """{銘柄: レポート} を送信用の (キー, 本文) にする (買い・売りのシグナルにだけキーを付ける)"""
+    return [(line_push.signal_key(t, signals[t]) if signals.get(t) in (BUY, SELL) else None, r)
+            for t, r in reports.items()]
+
+# ==========================================
+# 3. 非同期パイプライン (取得・計算・レポート作成を重ねて実行)
+# ==========================================
+# 1回の取得にまとめる銘柄数 (小さいほど早く計算を始められるが、取得回数は増える)
+PIPELINE_CHUNK = 10
+
+async def run_pipeline(holdings, watchlist, workers=1, fetch_concurrency=2, chunk_size=PIPELINE_CHUNK,
+                       walk_forward=False, verify=False, with_sweep=False, holding_frames=None, interval='1d'):
+    """
+    銘柄のまとまりごとに 取得 → バックテスト → レポート作成 を流す
+    ・株価は I/Oスレッドで取得 (同時に fetch_concurrency まとまりまで)
+    ・取得できた銘柄から CPUプール (workers > 1 ならプロセス、1 ならスレッド1本) に渡し、
+      次のまとまりの取得と計算を重ねる (全体の時間は「通信」と「計算」の和ではなく長い方に近づく)
+    ・レポートは出来た順に作り、最後に保有株・監視株の元の順序で並べる
+    ・interval が分足なら、取得は分足の差分を保存するだけ (レポート用に前の取引日の最後の足から受け取る) で、
+      バックテストはワーカーが保存済みの分足をチャンクごとに読んで行う (全期間を1つの表にしない)
+    ・holding_frames に辞書を渡すと、保有株の {銘柄: (株価, 勝率No.1の戦略名)} を入れて返す (ポートフォリオ検証用)
+    戻り値: (保有株のレポート, 監視株のレポート, 取得できた銘柄数)
+      レポートは銘柄ごとの (重複除外のキー, 本文) (キーは買い・売りのシグナルだけ、それ以外は None)
+    """
+    loop = asyncio.get_running_loop()
+    tickers = list(dict.fromkeys(list(holdings) + list(watchlist)))
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+    limit = asyncio.Semaphore(fetch_concurrency)
+    io_pool = ThreadPoolExecutor(max_workers=fetch_concurrency)
+    cpu_pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else ThreadPoolExecutor(max_workers=1)
+    reports = {}
+    signals = {}
+    fetched = []
+    records = []
+    store = intraday.IntradayStore(interval) if interval != '1d' else None
+
+    async def analyze(t, df):
+        dates, values = df.index.values, df[OHLCV_COLUMNS].to_numpy(dtype=float)
+        # 計算はワーカーの中で測る (プールの順番待ちの時間を含めない)
+        if store is not None:
+            stage, work = "intraday", loop.run_in_executor(cpu_pool, timed, intraday_one, t, interval)
+        elif walk_forward:
+            stage, work = "walk_forward", loop.run_in_executor(cpu_pool, timed, walk_forward_one, t, verify)
+        else:
+            stage, work = "backtest", loop.run_in_executor(cpu_pool, timed, backtest_ticker, (t, dates, values))
+        if with_sweep:
+            # パラメータの組み合わせはワーカー数のまとまりに分けて、1銘柄でも全ワーカーで評価する
+            parts = [loop.run_in_executor(cpu_pool, timed, sweep.sweep_arrays, dates, values, jobs)
+                     for jobs in sweep.split_grid(sweep.grid(), workers)]
+            (stats, sec), *parts = await asyncio.gather(work, *parts)
+            table = sweep.rank([rows for rows, _ in parts])
+            METRICS.record("sweep", sum(part_sec for _, part_sec in parts), ticker=t)
+        else:
+            (stats, sec), table = await work, None
+        rows = None
+        if walk_forward or store is not None:
+            stats, rows = stats
+        METRICS.record(stage, sec, ticker=t)
+        METRICS.incr("strategy.failed", sum(s is None for s in stats))
+        if holding_frames is not None and t in holdings:
+            holding_frames[t] = (df, best_strategy(stats)[0])
+        for mode, names in (("holding", holdings), ("watching", watchlist)):
+            if t in names:
+                with METRICS.span("report", ticker=t, mode=mode):
+                    reports[(mode, t)] = analyze_ticker_ai(t, names[t], mode=mode, df=df, strategy_stats=stats,
+                                                           sweep_table=table, signal_rows=rows, signals=signals)
+        if store is not None:
+            return  # スナップショット (アプリのAI診断タブ) は日足の成績だけ
+        try:
+            records.extend(snapshot_records(t, df, stats, rows))
+        except Exception as e:
+            print(f"[WARN] スナップショット作成失敗 {t}: {e}")
+            METRICS.failure("snapshot", e, ticker=t)
+
+    async def fetch_and_analyze(chunk):
+        async with limit:
+            with METRICS.span("fetch", tickers=len(chunk)) as span:
+                if store is not None:
+                    frames = await loop.run_in_executor(io_pool, store.get_many, chunk, intraday.report_bars(interval))
+                else:
+                    frames = await loop.run_in_executor(io_pool, PRICE_STORE.get_many, chunk, "2y")
+                span["fetched"] = len(frames)
+        METRICS.incr("fetch.missing", len(chunk) - len(frames))
+        fetched.extend(frames)
+        await asyncio.gather(*(analyze(t, df) for t, df in frames.items()))
+
     try:
-        requests.post(url, headers=headers, data=json.dumps(payload), timeout=10)
-        return True
-    except:
-        return False
+        await asyncio.gather(*(fetch_and_analyze(c) for c in chunks))
+    finally:
+        io_pool.shutdown()
+        cpu_pool.shutdown()
+
+    if records:
+        with METRICS.span("snapshot", rows=len(records)):
+            n = snapshot.write_snapshot(records)
+        print(f"スナップショット保存: {snapshot.SNAPSHOT_PATH} ({n}行)")
 
-def main():
+    hold_reports = report_blocks({t: reports[("holding", t)] for t in holdings if reports.get(("holding", t))}, signals)
+    watch_reports = report_blocks({t: reports[("watching", t)] for t in watchlist if reports.get(("watching", t))},
+                                  signals)
+    return hold_reports, watch_reports, len(fetched)
+
+def snapshot_records(ticker, df, strategy_stats, signal_rows=None, cash=1000000):
+    """アプリのAI診断タブ用に、1銘柄分の成績・現在の判定・判定用指標を行にする"""
+    if signal_rows is None:
+        signal_df = indicators.signal_tail(df, ticker)
+    else:
+        signal_df = pd.DataFrame(list(signal_rows), index=df.index[-2:])
+    stats = {s["name"]: st for s, st in zip(STRATEGIES, strategy_stats)}
+    signals = {name: check_current_signal(name, signal_df) for name in stats}
+    rows = snapshot.diagnosis_rows(stats, signals, cash)
+    # 成績の評価開始日 (--walk-forward では2年ちょうどではないので、期間を一緒に保存する)
+    start = next((st['Start'] for st in strategy_stats if st is not None and 'Start' in st), df.index[0])
+    return snapshot.ticker_records(ticker, signal_df, rows, cash, stats_start=start)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="株価AI分析 & LINE通知")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('NOTIFY_WORKERS', '1')),
+                        help="バックテストを並列実行するプロセス数 (1なら計算用スレッド1本)")
+    parser.add_argument('--fetch-concurrency', type=int, default=2,
+                        help="株価取得を同時に進めるまとまりの数")
+    parser.add_argument('--chunk-size', type=int, default=PIPELINE_CHUNK,
+                        help="1回の株価取得にまとめる銘柄数")
+    parser.add_argument('--walk-forward', action='store_true',
+                        help="保存済みの途中状態から新しい足だけを処理して戦略を評価する (全期間の再計算をしない)")
+    parser.add_argument('--verify-walk-forward', action='store_true',
+                        help="差分更新の結果を評価開始日からの一括バックテストと突き合わせる")
+    parser.add_argument('--sweep', action='store_true',
+                        help="戦略パラメータを総当たりで検証し、最適なパラメータもレポートに載せる")
+    parser.add_argument('--interval', default='1d', choices=['1d'] + list(intraday.INTERVALS),
+                        help="足の間隔 (5m / 15m は分足を保存・差分取得し、チャンク単位でバックテスト)")
+    parser.add_argument('--portfolio', action='store_true',
+                        help="保有株全体を共通の資金で運用した場合の成績もレポートに載せる")
+    parser.add_argument('--daemon', action='store_true',
+                        help="常駐して新しい足を監視し、判定が買い・売りに変わった時だけ通知する")
+    parser.add_argument('--poll', type=int, default=daemon.POLL_SECONDS,
+                        help="常駐モードで新しい足を取りに行く間隔 (秒)")
+    parser.add_argument('--metrics-log', default=os.getenv('METRICS_LOG', ''),
+                        help="段階ごとの処理時間をJSON 1行ずつ追記するファイル")
+    return parser.parse_args(argv)
+
+async def main_async(args):
     print(f"--- AI分析開始: {datetime.now()} ---")
     
     if not GCP_KEY_JSON or not SHEET_URL:
         print("[ERROR] Google Sheets設定(Secrets)がありません")
         return
 
-    holdings, watchlist = get_tickers_from_sheet()
+    # 保有株・監視株は1回のまとめ読み (待っている間もイベントループは止めない)
+    holdings, watchlist = await asyncio.get_running_loop().run_in_executor(None, get_tickers_from_sheet)
     
-    reports = []
+    # 取得・バックテスト (--walk-forward なら新しい足だけ処理)・レポート作成を重ねて実行
+    # (パラメータ総当たり・ウォークフォワード・ポートフォリオは日足だけ)
+    daily = args.interval == '1d'
+    holding_frames = {} if args.portfolio and daily else None
+    hold_reports, watch_reports, n_fetched = await run_pipeline(
+        holdings, watchlist, workers=args.workers, fetch_concurrency=args.fetch_concurrency,
+        chunk_size=args.chunk_size, walk_forward=daily and (args.walk_forward or args.verify_walk_forward),
+        verify=args.verify_walk_forward, with_sweep=daily and args.sweep, holding_frames=holding_frames,
+        interval=args.interval)
+    print(f"データ取得: {n_fetched}/{len(set(holdings) | set(watchlist))}銘柄")
     
-    # 保有株の分析
+    pusher = line_pusher()
+    if pusher is not None:
+        # 今日もう送った監視株のシグナルは、見出しごと載せない
+        watch_reports = pusher.unsent(watch_reports)
+    
+    reports = []
+    if holding_frames:
+        # 保有株全体の成績を先頭に (各銘柄は勝率No.1の戦略、保有株の元の順序)
+        picked = {t: holding_frames[t] for t in holdings if t in holding_frames}
+        try:
+            with METRICS.span("portfolio", tickers=len(picked)):
+                pstats = portfolio.run({t: df for t, (df, _) in picked.items()},
+                                       {t: name for t, (_, name) in picked.items()})
+            reports.append(f"【 📦 保有株ポートフォリオ (2年・{len(picked)}銘柄) 】")
+            reports.append(portfolio.summary_text(pstats) + "\n")
+        except Exception as e:
+            print(f"[WARN] ポートフォリオ検証失敗: {e}")
+            METRICS.failure("portfolio", e)
     if holdings:
         reports.append("【 💰 保有株 AI診断 】")
-        for code, name in holdings.items():
-            rep = analyze_ticker_ai(code, name, mode="holding")
-            if rep: reports.append(rep)
-            
-    # 監視株の分析
-    watch_reports = []
-    if watchlist:
-        for code, name in watchlist.items():
-            rep = analyze_ticker_ai(code, name, mode="watching")
-            if rep: watch_reports.append(rep)
-            
+        reports.extend(hold_reports)
     if watch_reports:
         reports.append("\n【 🔍 監視株 AIシグナル 】")
         reports.extend(watch_reports)
@@ -287,16 +407,59 @@ def main():
         print("通知対象なし")
         return
 
-    full_message = f"📊 株価AI分析レポート ({datetime.now().strftime('%m/%d')})\n"
-    full_message += "過去2年のデータを全戦略で検証し、最適解を導出しました。\n\n"
-    full_message += "\n".join(reports)
-    
-    if len(full_message) > 2000:
-        send_line_push(full_message[:2000] + "\n...(省略)...")
+    header = f"📊 株価AI分析レポート ({datetime.now().strftime('%m/%d')})\n"
+    if daily and (args.walk_forward or args.verify_walk_forward):
+        header += "直近2年 (評価開始日は月に1回更新) のデータを全戦略で検証し、最適解を導出しました。\n"
+    elif daily:
+        header += "過去2年のデータを全戦略で検証し、最適解を導出しました。\n"
     else:
-        send_line_push(full_message)
+        header += f"保存済みの{args.interval}足を全戦略で検証し、最適解を導出しました。\n"
     
+    # 銘柄ごとのブロックは分けずに、上限まで詰めて何通かで送る (同じ日に送ったシグナルは除く)
+    send_line_push(reports, header)
+    if pusher is not None:
+        print(pusher.summary())
     print("通知完了")
 
+def run_daemon(args):
+    """常駐モード (銘柄リストは1時間ごとに読み直す。Ctrl+C / SIGTERM で止まる)"""
+    if not GCP_KEY_JSON or not SHEET_URL:
+        print("[ERROR] Google Sheets設定(Secrets)がありません")
+        return
+
+    def tickers():
+        holdings, watchlist = get_tickers_from_sheet()
+        return {**watchlist, **holdings}
+
+    if args.interval == '1d':
+        source = daemon.StoreSource(PRICE_STORE)
+    else:
+        source = daemon.IntradaySource(intraday.IntradayStore(args.interval))
+    watcher = daemon.Watcher(source, tickers, send_line_push, poll=args.poll, market_hours=True)
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    print(f"--- 常駐モード開始: {datetime.now()} ({args.interval}足, {args.poll}秒ごと) ---")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    print(f"--- 常駐モード終了: 監視{watcher.polls}回 ---")
+
+def main(argv=None):
+    args = parse_args(argv)
+    METRICS.log_path = args.metrics_log
+    try:
+        with METRICS.span("total"):
+            if args.daemon:
+                run_daemon(args)
+            else:
+                asyncio.run(main_async(args))
+    finally:
+        c = indicators.CACHE.stats()
+        print(f"指標キャッシュ: ヒット{c['hits']} / ミス{c['misses']} (ヒット率{c['hit_rate']:.0f}%)")
+        METRICS.incr("indicators.hit", c['hits'])
+        METRICS.incr("indicators.miss", c['misses'])
+        print("--- 処理時間 ---")
+        print(METRICS.report())
+
 if __name__ == "__main__":
     main()
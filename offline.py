@@ -0,0 +1,70 @@
+import pandas as pd
+from price_store import normalize_frame, period_start, to_yf_ticker
+
+"""
+offline.py (通信しない差し替え部品)
+・yfinance・Google Sheets の代わりに、手元のデータを供給します。
+・benchmark.py の計測とテスト (tests/) の両方から使うので、tests/ の外に置いています。
+"""
+
+
+class FrameFetcher:
+    """手元のDataFrameから供給するfetcher (オフライン検証・テスト用、足の間隔は渡したデータのまま)"""
+    def __init__(self, frames):
+        self.frames = {to_yf_ticker(k): normalize_frame(v) for k, v in frames.items()}
+        self.calls = []
+
+    def __call__(self, yf_ticker, start=None, period="2y", interval='1d'):
+        self.calls.append((yf_ticker, start, period))
+        df = self.frames.get(yf_ticker)
+        if df is None:
+            return pd.DataFrame()
+        if start is not None:
+            return df[df.index >= pd.Timestamp(start)]
+        return df[df.index >= period_start(period, now=df.index[-1])]
+
+    def batch(self, yf_tickers, start=None, period="2y", interval='1d'):
+        """yfinanceの一括取得と同じ (銘柄, 項目) のMultiIndex形式で返す"""
+        self.calls.append((tuple(yf_tickers), start, period))
+        parts = {}
+        for t in yf_tickers:
+            df = self.frames.get(t)
+            if df is None:
+                continue
+            if start is not None:
+                parts[t] = df[df.index >= pd.Timestamp(start)]
+            else:
+                parts[t] = df[df.index >= period_start(period, now=df.index[-1])]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, axis=1)
+
+
+class FakeSpreadsheet:
+    """values_batch_get / values_batch_update だけを持つメモリ上のスプレッドシート (呼び出し回数を記録)"""
+    def __init__(self, tables=None):
+        self.tables = {name: [list(r) for r in rows] for name, rows in (tables or {}).items()}
+        self.calls = []
+
+    @staticmethod
+    def _sheet(a1):
+        return a1.split("!")[0].strip("'")
+
+    def values_batch_get(self, ranges, params=None):
+        self.calls.append(("get", tuple(ranges)))
+        return {"valueRanges": [{"range": r, "values": [list(x) for x in self.tables.get(self._sheet(r), [])]}
+                                for r in ranges]}
+
+    def values_batch_update(self, body):
+        self.calls.append(("update", tuple(d["range"] for d in body["data"])))
+        for d in body["data"]:
+            table = self.tables.setdefault(self._sheet(d["range"]), [])
+            for i, row in enumerate(d["values"]):
+                if i < len(table):
+                    table[i] = list(row)
+                else:
+                    table.append(list(row))
+            # Sheets API と同じく、末尾の空行はデータとして返さない
+            while table and not any(str(v) for v in table[-1]):
+                table.pop()
+        return {}
@@ -0,0 +1,236 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import strategies
+import screener
+import vector_backtest
+
+"""
+portfolio.py (保有株全体のポートフォリオ・バックテスト)
+・保有株の全銘柄を1つの日付軸にそろえ、共通の現金で売買するバックテストです。
+  (銘柄ごとに100万円ずつ別々に検証する vector_backtest と違い、資金の取り合いも再現します)
+・売買ルールは strategies のもの。指標とシグナルは (日付 × 銘柄) の配列で全銘柄まとめて計算します。
+・約定は vector_backtest と同じく「シグナル足の次の足の始値」、手数料は建てと決済の両方に掛かります。
+  1銘柄に使える金額は「その時点の資産 × 配分比率 (既定は均等)」が上限で、
+  同じ日の買いで現金が足りなければ、買う銘柄の間で比例配分します。売りは買いより先に約定します。
+・ループはシグナルが約定する日だけで、その日の全銘柄を配列でまとめて処理します。
+・資産推移・ドローダウン・銘柄ごとの損益の寄与度を返します。
+・python portfolio.py [銘柄...] でコマンドラインからも実行できます (省略時は乱数データ)。
+"""
+
+
+# ==========================================
+# 1. (日付 × 銘柄) の売買シグナル
+# ==========================================
+def first_valid(x):
+    """各銘柄で値が初めて揃う足 (最後まで揃わなければ足数)"""
+    valid = ~np.isnan(x)
+    return np.where(valid.any(axis=0), valid.argmax(axis=0), len(x))
+
+
+def panel_signals(names, close):
+    """
+    銘柄ごとの戦略名の並び names と終値パネルから (買い, 売り, 買い増し可否) を作る
+    同じ戦略の銘柄はまとめて1回の配列演算で判定する
+    """
+    n, m = close.shape
+    entry, exit_ = np.zeros((n, m), dtype=bool), np.zeros((n, m), dtype=bool)
+    pyramid = np.zeros(m, dtype=bool)
+    for name in dict.fromkeys(names):
+        rule = strategies.rule(name)
+        cols_idx = np.array([i for i, s in enumerate(names) if s == name])
+        x = close[:, cols_idx]
+        cols = screener.panel_columns(rule, x)
+        buy, sell = strategies.signals(rule, cols)
+        # 指標が揃った次の足からシグナルを見る (vector_backtest の start = 1 + warmup と同じ)
+        start = 1 + np.max([first_valid(cols[alias]) for alias in rule["indicators"]], axis=0)
+        seen = np.arange(n)[:, None] >= start
+        entry[:, cols_idx] = buy & seen
+        exit_[:, cols_idx] = sell & seen & ~buy  # 買い判定を優先
+        pyramid[cols_idx] = rule["pyramid"]
+    return entry, exit_, pyramid
+
+
+# ==========================================
+# 2. 約定シミュレーション (共通の現金)
+# ==========================================
+def simulate(open_, close, entry, exit_, pyramid, weights, cash=1000000, commission=.002):
+    """
+    シグナル配列から各日の現金・保有株数と、銘柄ごとの損益を求める
+    ・t 日目のシグナルは t+1 日目の始値で約定 (始値が無い日、つまりその銘柄の取引が無い日の注文は取り消し)
+    ・最終足のシグナルは約定しない
+    戻り値: (各日の現金, 各日の保有株数 (日付 × 銘柄), 銘柄ごとの集計の辞書)
+    """
+    n, m = close.shape
+    can_trade = ~np.isnan(open_)
+    buy = np.zeros((n, m), dtype=bool)
+    sell = np.zeros((n, m), dtype=bool)
+    buy[1:] = entry[:-1] & can_trade[1:]
+    sell[1:] = exit_[:-1] & can_trade[1:]
+    mark = pd.DataFrame(close).ffill().to_numpy()  # 取引の無い日は直前の終値で評価
+
+    units = np.zeros(m)
+    cost = np.zeros(m)          # 保有中の建玉の取得額
+    open_comm = np.zeros(m)     # 保有中の建玉の手数料
+    lots = [[] for _ in range(m)]  # 保有中の建玉 (株数, 取得単価, 手数料)。買い増しは別の取引として数える
+    book = {k: np.zeros(m) for k in ("trades", "wins", "realized", "commission", "closed_commission")}
+    d_units = np.zeros((n, m))
+    cash_after = np.full(n, np.nan)
+    cash_after[0] = cash
+
+    for t in np.flatnonzero(buy.any(axis=1) | sell.any(axis=1)):
+        price = np.where(can_trade[t], open_[t], np.nan_to_num(mark[t - 1]))
+
+        # 1. 売り (決済した現金を同じ日の買いに回せるよう先に約定)
+        out = sell[t] & (units > 0)
+        if out.any():
+            proceeds = units[out] * price[out]
+            comm = proceeds * commission
+            cash += (proceeds - comm).sum()
+            for i in np.flatnonzero(out):
+                for size, entry_price, entry_comm in lots[i]:
+                    pl = size * (price[i] - entry_price) - entry_comm - size * price[i] * commission
+                    book["trades"][i] += 1
+                    book["wins"][i] += pl > 0
+                lots[i] = []
+            book["realized"][out] += proceeds - cost[out]
+            book["commission"][out] += comm
+            book["closed_commission"][out] += comm + open_comm[out]
+            d_units[t, out] -= units[out]
+            units[out] = cost[out] = open_comm[out] = 0
+
+        # 2. 買い (資産 × 配分比率 を上限に、足りない現金は比例配分)
+        want = np.zeros(m)
+        go = buy[t] & (pyramid | (units == 0))
+        if go.any():
+            equity = cash + (units * price).sum()
+            want[go] = np.clip(weights[go] * equity - units[go] * price[go], 0, None)
+            total = want.sum()
+            if total > cash:
+                want *= max(cash, 0) / total
+            size = np.zeros(m)
+            size[go] = np.floor(want[go] * vector_backtest.FULL_EQUITY / (price[go] * (1 + commission)))
+            spend = size * price
+            comm = spend * commission
+            cash -= (spend + comm).sum()
+            units += size
+            cost += spend
+            open_comm += comm
+            book["commission"] += comm
+            d_units[t] += size
+            for i in np.flatnonzero(size):
+                lots[i].append((size[i], price[i], comm[i]))
+        cash_after[t] = cash
+
+    book["unrealized"] = units * np.nan_to_num(mark[-1]) - cost
+    book["units"] = units
+    cash_series = pd.Series(cash_after).ffill().to_numpy()
+    return cash_series, np.cumsum(d_units, axis=0), book
+
+
+# ==========================================
+# 3. 実行と集計
+# ==========================================
+def run(frames, strategy=strategies.NAMES[0], cash=1000000, commission=.002, weights=None):
+    """
+    {銘柄: OHLCV} を共通の現金でバックテストする
+    strategy: 全銘柄で使う戦略名、または {銘柄: 戦略名} (銘柄ごとに勝率の高い戦略を使う時など)
+    weights: {銘柄: 配分比率} (省略時は均等。合計が1を超えると現金が足りない日は比例配分)
+    戻り値: Backtest.run() と同じキーの統計値 (資産推移 _equity_curve・寄与度 _contribution 付き)
+    """
+    tickers = list(frames)
+    if not tickers:
+        raise ValueError("銘柄がありません")
+    names = [strategy.get(t, strategies.NAMES[0]) if isinstance(strategy, dict) else strategy for t in tickers]
+    close_df = screener.build_panel(frames, 'Close')
+    index = close_df.index
+    close = close_df[tickers].to_numpy(dtype=float)
+    open_ = screener.build_panel(frames, 'Open')[tickers].to_numpy(dtype=float)
+    w = np.array([(weights or {}).get(t, 1 / len(tickers)) for t in tickers], dtype=float)
+
+    entry, exit_, pyramid = panel_signals(names, close)
+    cash_series, units, book = simulate(open_, close, entry, exit_, pyramid, w, cash, commission)
+    mark = np.nan_to_num(pd.DataFrame(close).ffill().to_numpy())
+    value = units * mark
+    equity = cash_series + value.sum(axis=1)
+    dd = 1 - equity / np.maximum.accumulate(equity)
+
+    # 均等保有 (各銘柄の最初の終値で買って最後まで持つ) のリターン
+    first = close[first_valid(close).clip(max=len(close) - 1), np.arange(len(tickers))]
+    last = pd.DataFrame(close).ffill().to_numpy()[-1]
+    buy_hold = np.nanmean(last / first - 1) * 100
+
+    pnl = book["realized"] + book["unrealized"] - book["commission"]
+    contribution = pd.DataFrame({
+        "銘柄": tickers, "戦略": names, "取引回数": book["trades"].astype(int),
+        "勝率": np.where(book["trades"] > 0, book["wins"] / np.where(book["trades"], book["trades"], 1) * 100, np.nan),
+        "実現損益": book["realized"], "評価損益": book["unrealized"], "手数料": book["commission"],
+        "損益": pnl, "寄与度": pnl / cash * 100, "保有株数": book["units"].astype(int),
+    }).sort_values("寄与度", ascending=False, ignore_index=True)
+
+    s = {}
+    s['Start'] = index[0]
+    s['End'] = index[-1]
+    s['Duration'] = s['End'] - s['Start']
+    # 売った日も保有していた日に数える (Backtest.run() と同じく建てた足から決済した足まで)
+    sold = np.diff(units, axis=0, prepend=0) < 0
+    s['Exposure Time [%]'] = ((units > 0) | sold).any(axis=1).mean() * 100
+    s['Equity Final [$]'] = equity[-1]
+    s['Equity Peak [$]'] = equity.max()
+    # Backtest.run() と同じく決済済みの取引の手数料 (保有中の建玉の分は寄与度の手数料にだけ入る)
+    s['Commissions [$]'] = book["closed_commission"].sum()
+    s['Return [%]'] = (equity[-1] - cash) / cash * 100
+    s['Buy & Hold Return [%]'] = buy_hold
+    s.update(vector_backtest.annual_stats(equity, index))
+    s['Max. Drawdown [%]'] = -np.nan_to_num(dd.max()) * 100
+    s['# Trades'] = n_trades = int(book["trades"].sum())
+    s['Win Rate [%]'] = book["wins"].sum() / n_trades * 100 if n_trades else np.nan
+    s['# Tickers'] = len(tickers)
+    s['_equity_curve'] = pd.DataFrame({'Equity': equity, 'DrawdownPct': dd, 'Cash': cash_series}, index=index)
+    s['_positions'] = pd.DataFrame(value, index=index, columns=tickers)
+    s['_contribution'] = contribution
+    return pd.Series(s, dtype=object)
+
+
+def summary_text(stats, top=3):
+    """通知・画面用の短い要約"""
+    c = stats['_contribution']
+    lines = [f"資産: {int(stats['Equity Final [$]']):,}円 ({stats['Return [%]']:+.1f}%)"
+             f" / 均等保有 {stats['Buy & Hold Return [%]']:+.1f}%",
+             f"最大DD: {stats['Max. Drawdown [%]']:.1f}% / 取引{stats['# Trades']}回"]
+    if len(c):
+        best = c.head(top)
+        lines.append("寄与上位: " + ", ".join(f"{r.銘柄} {r.寄与度:+.1f}%" for r in best.itertuples()))
+        worst = c[c["寄与度"] < 0].tail(top)
+        if len(worst):
+            lines.append("寄与下位: " + ", ".join(f"{r.銘柄} {r.寄与度:+.1f}%" for r in worst.itertuples()))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="保有株全体を共通の現金でバックテストする")
+    parser.add_argument('tickers', nargs='*', help="銘柄 (省略時は乱数データ)")
+    parser.add_argument('--strategy', default=strategies.NAMES[0], choices=strategies.NAMES)
+    parser.add_argument('--cash', type=float, default=1000000)
+    parser.add_argument('--random', type=int, default=200, help="乱数データの銘柄数")
+    parser.add_argument('--bars', type=int, default=500, help="乱数データの本数")
+    args = parser.parse_args(argv)
+
+    if args.tickers:
+        from price_store import PriceStore
+        frames = PriceStore().get_many(args.tickers, period="2y")
+    else:
+        from benchmark import synthetic_market
+        frames = synthetic_market(args.random, args.bars)
+
+    t0 = time.perf_counter()
+    stats = run(frames, args.strategy, args.cash)
+    print(f"{len(frames)}銘柄 × {len(stats['_equity_curve'])}本: {time.perf_counter() - t0:.2f}秒")
+    print(summary_text(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+from metrics import METRICS
+
+"""
+price_store.py (株価データのローカル保存)
+・銘柄ごとの日足OHLCVをParquetファイルとして保存します。
+・2回目以降は「最後に保存した日」以降の差分だけを取得して追記します。
+・複数銘柄はまとめて取得 (yfinanceにリストで渡す) し、銘柄ごとのデータに分割します。
+・取得間隔は固定のsleepではなくトークンバケットで制御します。
+・データ取得関数(fetcher)は差し替え可能です。テスト・計測では offline.py の FrameFetcher でローカルのデータを供給します。
+・get_many(columns=, dtype=) で必要な列だけ・float32 にした軽量なデータも受け取れます (全銘柄スクリーニング用)。
+"""
+
+# ==========================================
+# 設定エリア
+# ==========================================
+STORE_DIR = os.getenv('PRICE_STORE_DIR', os.path.join('data', 'prices'))
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# まとめて取得する銘柄数と、取得リクエストの上限 (1秒あたり / 連続で使える回数)
+BATCH_SIZE = 50
+REQUEST_RATE = 1.0
+REQUEST_BURST = 3
+
+# 差分取得時に重なる足の終値がこれ以上ズレていたら (分割・配当による価格修正) 全期間を取り直す
+ADJUST_TOLERANCE = 1e-3
+
+# yf.download は結果をモジュール内の共有変数に溜めるため、スレッドから同時に呼ばない
+# (1回の呼び出しの中では yfinance 自身が銘柄ごとに並列取得する)
+YF_LOCK = threading.Lock()
+
+
+def to_yf_ticker(ticker):
+    """銘柄コードをyfinance形式に正規化 (数字だけなら東証の .T を付ける)"""
+    code = str(ticker).strip()
+    return f"{code}.T" if code.isdigit() else code
+
+
+def period_start(period, now=None):
+    """'3mo' / '2y' などの期間指定から開始日を求める"""
+    now = pd.Timestamp.now().normalize() if now is None else pd.Timestamp(now).normalize()
+    period = str(period)
+    if period.endswith('mo'):
+        return now - pd.DateOffset(months=int(period[:-2]))
+    if period.endswith('y'):
+        return now - pd.DateOffset(years=int(period[:-1]))
+    if period.endswith('d'):
+        return now - pd.DateOffset(days=int(period[:-1]))
+    raise ValueError(f"未対応の期間指定です: {period}")
+
+
+def previous_close(df):
+    """
+    前日の終値とその呼び方を返す
+    分足でも1本前の足ではなく前の取引日の最後の足 (前の取引日が無ければ1本前の足で「前の足比」)
+    """
+    days = df.index.normalize()
+    before = df['Close'][days < days[-1]]
+    if len(before):
+        return float(before.iloc[-1]), "前日比"
+    return float(df['Close'].iloc[-2]), "前の足比"
+
+
+def normalize_frame(df):
+    """yfinanceの戻り値をOHLCVだけの単純な列・タイムゾーンなしの日付インデックスに揃える"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name='Date'))
+    df = df.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df = df[[c for c in OHLCV_COLUMNS if c in df.columns]]
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df.index = index.rename('Date')
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return df.dropna(subset=['Close'])
+
+
+def compact_frame(df, columns=OHLCV_COLUMNS, dtype='float32'):
+    """必要な列だけにして型を小さくする (float32 は有効数字約7桁、1銘柄あたりのメモリは半分)"""
+    return df[[c for c in columns if c in df.columns]].astype(dtype)
+
+
+def precision_error(df, compact):
+    """軽量化による列ごとの最大相対誤差 (元の値が0の所は除く)"""
+    errors = {}
+    for col in compact.columns:
+        exact = df[col].to_numpy(dtype=float)
+        approx = compact[col].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel = np.abs(approx - exact) / np.abs(exact)
+        rel = rel[np.isfinite(rel)]
+        errors[col] = float(rel.max()) if len(rel) else 0.0
+    return errors
+
+
+def split_multi_frame(df, yf_tickers):
+    """複数銘柄をまとめて取得したMultiIndexのDataFrameを銘柄ごとに分割する"""
+    frames = {}
+    if df is None or df.empty:
+        return frames
+    if not isinstance(df.columns, pd.MultiIndex):
+        # 1銘柄だけの場合は列が単層で返ることがある
+        if len(yf_tickers) == 1:
+            frames[yf_tickers[0]] = normalize_frame(df)
+        return frames
+    # group_by='ticker' なら (銘柄, 項目)、既定なら (項目, 銘柄) の順
+    level = 0 if set(yf_tickers) & set(df.columns.get_level_values(0)) else 1
+    for t in yf_tickers:
+        if t not in df.columns.get_level_values(level):
+            continue
+        sub = normalize_frame(df.xs(t, axis=1, level=level))
+        if not sub.empty:
+            frames[t] = sub
+    return frames
+
+
+class TokenBucket:
+    """トークンバケット方式の流量制限 (rate回/秒、最大burst回まで連続で取得可能)"""
+    def __init__(self, rate=REQUEST_RATE, burst=REQUEST_BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """トークンが貯まるまで待ってから消費する (複数スレッドから呼んでもよい)"""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+# ==========================================
+# 1. データ取得関数 (fetcher)
+# ==========================================
+def yfinance_fetcher(yf_ticker, start=None, period="2y", interval='1d'):
+    """yfinanceから取得 (startがあればその日以降、なければperiod分)"""
+    import yfinance as yf
+    with YF_LOCK:
+        if start is not None:
+            return yf.download(yf_ticker, start=start, interval=interval, progress=False)
+        return yf.download(yf_ticker, period=period, interval=interval, progress=False)
+
+
+def yfinance_batch_fetcher(yf_tickers, start=None, period="2y", interval='1d'):
+    """複数銘柄をまとめて取得 (戻り値は (銘柄, 項目) のMultiIndex)"""
+    import yfinance as yf
+    with YF_LOCK:
+        if start is not None:
+            return yf.download(yf_tickers, start=start, interval=interval, group_by='ticker', progress=False)
+        return yf.download(yf_tickers, period=period, interval=interval, group_by='ticker', progress=False)
+
+
+# ==========================================
+# 2. 保存領域
+# ==========================================
+class PriceStore:
+    """
+    銘柄ごとのOHLCVを保存し、不足している末尾だけを取得する
+    ・初回: history分 (既定2年) をまとめて取得
+    ・2回目以降: 最終保存日の1本前から取得 (最終足は確定前の可能性があるため取り直して上書き)
+    """
+    def __init__(self, root=STORE_DIR, fetcher=yfinance_fetcher, batch_fetcher=yfinance_batch_fetcher,
+                 history="2y", min_interval=900, limiter=None):
+        self.root = root
+        self.fetcher = fetcher
+        self.batch_fetcher = batch_fetcher
+        self.limiter = limiter or TokenBucket()
+        self.history = history
+        self.min_interval = min_interval  # 同じ銘柄をこの秒数以内に再確認しない
+        self._checked = {}
+
+    def path(self, ticker):
+        return os.path.join(self.root, f"{to_yf_ticker(ticker)}.parquet")
+
+    def load(self, ticker):
+        """保存済みデータを読み込む (なければ空のDataFrame)"""
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return normalize_frame(None)
+        return pd.read_parquet(path)
+
+    def save(self, ticker, df):
+        """一時ファイルに書いてから置き換える (同時アクセスでも壊れたファイルを読ませない)"""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(ticker)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+
+    def merge(self, ticker, stored, new):
+        """差分データを保存済みデータに結合して保存する"""
+        new = normalize_frame(new)
+        if new.empty:
+            return stored
+        if not stored.empty:
+            # 最終足は確定前の可能性があるため、その1本前の確定足で価格修正の有無を確認する
+            overlap = new.index.intersection(stored.index[-2:-1])
+            if len(overlap):
+                old_close = float(stored.loc[overlap[0], 'Close'])
+                new_close = float(new.loc[overlap[0], 'Close'])
+                if old_close and abs(new_close / old_close - 1) > ADJUST_TOLERANCE:
+                    # 株式分割などで過去の価格が修正された → 差分では整合しないので全期間を取り直す
+                    return self.refetch(ticker)
+            new = pd.concat([stored[stored.index < new.index[0]], new])
+        self.save(ticker, new)
+        return new
+
+    @staticmethod
+    def tail_start(stored):
+        """差分取得の開始日 (最終足とその1本前を取り直す)"""
+        return stored.index[max(-2, -len(stored))]
+
+    def refetch(self, ticker, period=None):
+        """保存済みデータを捨てて全期間を取り直す"""
+        self.limiter.acquire()
+        df = normalize_frame(self.fetcher(to_yf_ticker(ticker), start=None, period=period or self.history))
+        if not df.empty:
+            self.save(ticker, df)
+        return df
+
+    def refresh(self, ticker, period=None):
+        """不足している末尾を取得して保存し、保存済みの全データを返す"""
+        key = to_yf_ticker(ticker)
+        stored = self.load(ticker)
+        if stored.empty:
+            df = self.refetch(ticker, period)
+        elif time.time() - self._checked.get(key, 0) < self.min_interval:
+            return stored
+        elif period and stored.index[0] > period_start(period) + pd.Timedelta(days=10) \
+                and period_start(period) < period_start(self.history):
+            # 保存している期間より長い期間を要求された
+            df = self.refetch(ticker, period)
+        else:
+            self.limiter.acquire()
+            df = self.merge(ticker, stored, self.fetcher(key, start=self.tail_start(stored), period=self.history))
+        self._checked[key] = time.time()
+        return df
+
+    def refresh_many(self, tickers, batch_size=BATCH_SIZE):
+        """
+        複数銘柄をまとめて更新し、{元のコード: 保存済みの全データ} を返す
+        ・未保存の銘柄は全期間、保存済みの銘柄は最も古い最終日以降をまとめて取得
+        """
+        stored = {t: self.load(t) for t in tickers}
+        now = time.time()
+        fresh = [t for t in tickers if not stored[t].empty
+                 and now - self._checked.get(to_yf_ticker(t), 0) < self.min_interval]
+        new = [t for t in tickers if stored[t].empty]
+        tail = [t for t in tickers if t not in fresh and t not in new]
+
+        results = {t: stored[t] for t in fresh}
+        METRICS.incr("price_store.fresh", len(fresh))
+        METRICS.incr("price_store.new", len(new))
+        METRICS.incr("price_store.tail", len(tail))
+        groups = [(new[i:i + batch_size], None) for i in range(0, len(new), batch_size)]
+        for i in range(0, len(tail), batch_size):
+            chunk = tail[i:i + batch_size]
+            groups.append((chunk, min(self.tail_start(stored[t]) for t in chunk)))
+
+        for chunk, start in groups:
+            yf_tickers = [to_yf_ticker(t) for t in chunk]
+            self.limiter.acquire()
+            try:
+                # 失敗も理由付きで記録される (span が例外を記録してから投げ直す)
+                with METRICS.span("download", tickers=len(chunk)):
+                    raw = self.batch_fetcher(yf_tickers, start=start, period=self.history)
+                frames = split_multi_frame(raw, yf_tickers)
+            except Exception as e:
+                print(f"[WARN] 一括取得失敗 ({len(chunk)}銘柄): {e}")
+                frames = {}
+            for t, yf_t in zip(chunk, yf_tickers):
+                if yf_t not in frames:
+                    results[t] = stored[t]
+                    continue
+                if start is None:
+                    results[t] = frames[yf_t]
+                    self.save(t, frames[yf_t])
+                else:
+                    results[t] = self.merge(t, stored[t], frames[yf_t])
+                self._checked[yf_t] = time.time()
+        return results
+
+    def get_many(self, tickers, period="2y", columns=None, dtype=None):
+        """
+        複数銘柄の指定期間のOHLCVを {元のコード: DataFrame} で返す (取得できなかった銘柄は含まない)
+        columns / dtype を指定すると、その列だけ・その型にした軽量なDataFrameにする
+        """
+        since = period_start(period)
+        frames = {}
+        for t, df in self.refresh_many(list(tickers)).items():
+            if df.empty:
+                continue
+            df = df[df.index >= since]
+            if columns is None and dtype is None:
+                frames[t] = df.copy()
+            else:
+                frames[t] = compact_frame(df, columns or OHLCV_COLUMNS, dtype or float)
+        return frames
+
+    def get(self, ticker, period="2y"):
+        """指定期間のOHLCVを返す (yf.download(period=...) の置き換え)"""
+        df = self.refresh(ticker, period)
+        if df.empty:
+            return df
+        return df[df.index >= period_start(period)].copy()
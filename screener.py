@@ -0,0 +1,219 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import strategies
+from strategies import BUY, SELL
+
+"""
+screener.py (東証全銘柄スクリーナー)
+・全銘柄の終値を (日付 × 銘柄) の2次元配列にまとめ、指標は「全銘柄まとめて1回の配列演算」で計算します。
+・判定ルールは strategies のルール (バックテスト・check_current_signal と同じ) をそのまま使います。
+・銘柄ごとのループをしないので、データが手元にあれば約4,000銘柄でも数秒で終わります。
+・判定に使うのは終値だけなので、株価は終値1列・float32 で読み込みます (全銘柄をメモリに載せるため)。
+  計算は float64 に戻して行います。--check-precision で float64 のままの判定と一致するか確認できます。
+・python screener.py でコマンドラインからも実行できます。
+"""
+
+# 指標計算に使う期間 (EMA・RSIの初期値の影響が消えるよう1年分)
+SCREEN_PERIOD = "1y"
+
+# 読み込む株価の型 (None なら float64 のまま)
+SCREEN_DTYPE = 'float32'
+SIGNAL_NAMES = strategies.NAMES
+
+
+# ==========================================
+# 1. (日付 × 銘柄) の配列で計算する指標
+# ==========================================
+def build_panel(frames, field='Close'):
+    """{銘柄: OHLCV} を (日付 × 銘柄) のDataFrameにそろえる (無い日はNaN)"""
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat({t: df[field] for t, df in frames.items()}, axis=1).sort_index()
+
+
+def panel_sma(x, n):
+    """移動平均 (累積和の差、窓内にNaNがあればNaN)"""
+    valid = ~np.isnan(x)
+    cs = np.vstack([np.zeros((1, x.shape[1])), np.cumsum(np.where(valid, x, 0.0), axis=0)])
+    cnt = np.vstack([np.zeros((1, x.shape[1])), np.cumsum(valid, axis=0)])
+    out = np.full(x.shape, np.nan)
+    full = (cnt[n:] - cnt[:-n]) == n
+    out[n - 1:] = np.where(full, (cs[n:] - cs[:-n]) / n, np.nan)
+    return out
+
+
+def panel_std(x, n):
+    """移動標準偏差 (ddof=0)"""
+    mean = panel_sma(x, n)
+    mean_sq = panel_sma(x ** 2, n)
+    return np.sqrt(np.clip(mean_sq - mean ** 2, 0, None))
+
+
+def panel_ema(x, n):
+    """EMA (pandas_ta と同じく各銘柄の最初のn本の単純平均が起点、途中のNaNは前の値を据え置き)"""
+    alpha = 2 / (n + 1)
+    out = np.full(x.shape, np.nan)
+    count = np.zeros(x.shape[1])
+    total = np.zeros(x.shape[1])
+    value = np.full(x.shape[1], np.nan)
+    for t in range(x.shape[0]):
+        row = x[t]
+        valid = ~np.isnan(row)
+        count += valid
+        total += np.where(valid, row, 0.0)
+        seed = valid & (count == n)
+        value[seed] = total[seed] / n
+        run = valid & (count > n)
+        value[run] = alpha * row[run] + (1 - alpha) * value[run]
+        out[t] = value
+    return out
+
+
+def panel_rma(x, n):
+    """Wilder平滑 (ewm(alpha=1/n, min_periods=n) と同じ加重平均)"""
+    decay = 1 - 1 / n
+    out = np.full(x.shape, np.nan)
+    num = np.zeros(x.shape[1])
+    den = np.zeros(x.shape[1])
+    count = np.zeros(x.shape[1])
+    for t in range(x.shape[0]):
+        row = x[t]
+        valid = ~np.isnan(row)
+        num = np.where(valid, np.nan_to_num(row) + decay * num, num)
+        den = np.where(valid, 1.0 + decay * den, den)
+        count += valid
+        out[t] = np.where(count >= n, num / np.where(den, den, np.nan), np.nan)
+    return out
+
+
+def panel_rsi(x, n=14):
+    diff = np.vstack([np.full((1, x.shape[1]), np.nan), np.diff(x, axis=0)])
+    gain = panel_rma(np.where(np.isnan(diff), np.nan, np.clip(diff, 0, None)), n)
+    loss = panel_rma(np.where(np.isnan(diff), np.nan, np.clip(-diff, 0, None)), n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * gain / (gain + loss)
+
+
+def panel_macd(x, fast=12, slow=26, signal=9):
+    line = panel_ema(x, fast) - panel_ema(x, slow)
+    sig = panel_ema(line, signal)
+    return line, line - sig, sig
+
+
+# ==========================================
+# 2. 全銘柄の現在シグナル
+# ==========================================
+def panel_columns(rule, x, memo=None):
+    """ルールが使う指標をパネルで計算して {名前: (日付 × 銘柄) の配列} (memo で戦略間の重複計算を省く)"""
+    memo = {} if memo is None else memo
+
+    def once(key, func):
+        if key not in memo:
+            memo[key] = func()
+        return memo[key]
+
+    cols = {"close": x}
+    for alias, (kind, p, output) in rule["indicators"].items():
+        if kind == "sma":
+            cols[alias] = once(("sma", p["length"]), lambda: panel_sma(x, p["length"]))
+        elif kind == "rsi":
+            cols[alias] = once(("rsi", p["length"]), lambda: panel_rsi(x, p["length"]))
+        elif kind == "macd":
+            cols[alias] = once(("macd", p["fast"], p["slow"], p["signal"]),
+                               lambda: panel_macd(x, p["fast"], p["slow"], p["signal"]))[output]
+        elif kind == "bbands":
+            def bands():
+                mid, sd = panel_sma(x, p["length"]), panel_std(x, p["length"])
+                return mid - p["std"] * sd, mid, mid + p["std"] * sd
+            cols[alias] = once(("bbands", p["length"], p["std"]), bands)[output]
+        else:
+            raise KeyError(kind)
+    return cols
+
+
+def screen_panel(close):
+    """
+    終値パネル (日付 × 銘柄) から、最新の足で出ている各戦略のシグナルを返す
+    戻り値: 銘柄ごとの行に 終値・RSI・戦略ごとの判定 (買い/売り/空) を持つDataFrame
+    """
+    tickers = close.columns
+    x = close.to_numpy(dtype=float)
+    memo = {}
+    labels = {}
+    for rule in strategies.STRATEGIES:
+        # 判定に要るのは直近2本だけ (指標は全期間で計算してから切り出す)
+        cols = {k: v[-2:] for k, v in panel_columns(rule, x, memo).items()}
+        entry, exit_ = strategies.signals(rule, cols)
+        labels[rule["name"]] = np.where(entry[-1], BUY, np.where(exit_[-1], SELL, ""))
+
+    last = -1
+    rsi = panel_columns(strategies.rule("RSI逆張り"), x, memo)["rsi"]
+    result = pd.DataFrame({"終値": x[last], "RSI": rsi[last], **labels}, index=tickers)
+    # 最新日にデータが無い銘柄 (売買停止など) は判定しない
+    return result[~np.isnan(x[last])]
+
+
+def firing(result):
+    """いずれかの戦略でシグナルが出ている銘柄だけに絞る"""
+    return result[(result[SIGNAL_NAMES] != "").any(axis=1)]
+
+
+def signal_mismatches(exact, result):
+    """float64 の判定 (exact) と軽量化したデータの判定 (result) で、判定が食い違う銘柄"""
+    common = exact.index.intersection(result.index)
+    a, b = exact.loc[common, SIGNAL_NAMES], result.loc[common, SIGNAL_NAMES]
+    return common[(a != b).any(axis=1)].union(exact.index.symmetric_difference(result.index))
+
+
+def run_screen(codes, store=None, period=SCREEN_PERIOD, dtype=SCREEN_DTYPE, check_precision=False):
+    """
+    銘柄コード一覧を取得 (保存済みの分は差分だけ) してスクリーニングする
+    check_precision=True なら float64 のデータでも判定し、食い違う銘柄と終値の誤差を表示する
+    """
+    from price_store import PriceStore, compact_frame, precision_error
+    store = store or PriceStore()
+    if not check_precision or dtype is None:
+        return screen_panel(build_panel(store.get_many(codes, period=period, columns=['Close'], dtype=dtype)))
+
+    frames = store.get_many(codes, period=period, columns=['Close'])
+    compact = {t: compact_frame(df, ['Close'], dtype) for t, df in frames.items()}
+    exact, result = screen_panel(build_panel(frames)), screen_panel(build_panel(compact))
+    worst = max((precision_error(frames[t], compact[t])['Close'] for t in frames), default=0.0)
+    diff = signal_mismatches(exact, result)
+    print(f"[精度確認] {dtype}: 終値の最大相対誤差 {worst:.2e}, 判定の食い違い {len(diff)}銘柄"
+          + (f" ({', '.join(diff[:10])})" if len(diff) else ""))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="東証全銘柄のシグナルスクリーナー")
+    parser.add_argument('codes', nargs='*', help="対象の銘柄コード (省略時はJPXの全株式)")
+    parser.add_argument('--limit', type=int, default=0, help="先頭から何銘柄だけ調べるか (0なら全部)")
+    parser.add_argument('--all', action='store_true', help="シグナルの出ていない銘柄も表示する")
+    parser.add_argument('--float64', action='store_true', help="株価を float32 にせずに読み込む")
+    parser.add_argument('--check-precision', action='store_true',
+                        help="float64 のままの判定とも比べ、食い違う銘柄を表示する")
+    args = parser.parse_args(argv)
+
+    codes = args.codes
+    if not codes:
+        import jpx_listing
+        codes = jpx_listing.stock_codes(jpx_listing.load_listing())
+    if args.limit:
+        codes = codes[:args.limit]
+
+    t0 = time.time()
+    result = run_screen(codes, dtype=None if args.float64 else SCREEN_DTYPE, check_precision=args.check_precision)
+    if not args.all:
+        result = firing(result)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(result)
+    print(f"{len(codes)}銘柄中 {len(result)}銘柄 ({time.time() - t0:.1f}秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
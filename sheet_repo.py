@@ -0,0 +1,152 @@
+import json
+import time
+import threading
+import pandas as pd
+
+"""
+sheet_repo.py (スプレッドシートの銘柄リスト読み書き)
+・認証済みクライアントは使い回し、Holdings と Watchlist は1回のまとめ読み (values_batch_get) で取得します。
+・読んだ内容は手元に保持し、TTL切れか書き込み後 (版番号が変わった時) だけ読み直します。
+・追加・削除はキューに溜め、flush() で「最新を1回読む → まとめて1回書く」の2往復で反映します。
+  アプリのようにセッションごとにキューを持つ場合は、add_op() / delete_op() で作った操作を flush(ops) に渡します。
+・1つのリポジトリを複数のスレッド (アプリのセッション) で共有してよいよう、読み書きはロックの中で行います。
+"""
+
+WORKSHEETS = ("Holdings", "Watchlist")
+HEADER = ["Ticker", "Name"]
+SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+
+_CLIENTS = {}
+
+
+def open_spreadsheet(key_json, url):
+    """サービスアカウントで認証してスプレッドシートを開く (同じ鍵の認証は1回だけ)"""
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    if key_json not in _CLIENTS:
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(key_json), SCOPE)
+        _CLIENTS[key_json] = gspread.authorize(creds)
+    return _CLIENTS[key_json].open_by_url(url)
+
+
+def to_records(values):
+    """[見出し行, データ行...] を get_all_records() と同じ辞書のリストにする (Tickerが空の行は除く)"""
+    if not values:
+        return []
+    header = [str(h).strip() for h in values[0]]
+    records = []
+    for row in values[1:]:
+        rec = {h: (str(row[j]).strip() if j < len(row) else "") for j, h in enumerate(header)}
+        if rec.get("Ticker"):
+            records.append(rec)
+    return records
+
+
+def add_op(name, ticker, label=""):
+    """追加の操作 (flush() に渡す)"""
+    return ("add", name, str(ticker).strip(), label)
+
+
+def delete_op(name, ticker):
+    """削除の操作 (flush() に渡す)"""
+    return ("delete", name, str(ticker).strip(), "")
+
+
+# ==========================================
+# 1. 読み書きの窓口
+# ==========================================
+class SheetRepository:
+    """
+    銘柄リスト (Holdings / Watchlist) の読み書き
+    ・records() / frame() / tickers() は手元のコピーを返す (必要な時だけまとめ読み)
+    ・add() / delete() はキューに積むだけ、flush() でまとめて書き込む
+    ・スレッド間で共有してよい (読み直し・書き込み・キューの出し入れはロックの中)
+    """
+    def __init__(self, spreadsheet, worksheets=WORKSHEETS, ttl=60, clock=time.time):
+        self.spreadsheet = spreadsheet
+        self.worksheets = tuple(worksheets)
+        self.ttl = ttl
+        self.clock = clock
+        self.version = 0          # 書き込むたびに増える
+        self._loaded = None       # (読んだ時の版, 読んだ時刻)
+        self._values = {}
+        self.pending = []         # [("add" / "delete", シート名, コード, 銘柄名)]
+        self._lock = threading.RLock()
+
+    def _fetch(self):
+        res = self.spreadsheet.values_batch_get([f"'{name}'" for name in self.worksheets])
+        ranges = res.get('valueRanges', [])
+        return {name: (ranges[i].get('values', []) if i < len(ranges) else [])
+                for i, name in enumerate(self.worksheets)}
+
+    def refresh(self, force=False):
+        """手元のコピーが古ければ読み直す"""
+        with self._lock:
+            now = self.clock()
+            stale = (self._loaded is None or self._loaded[0] != self.version
+                     or now - self._loaded[1] >= self.ttl)
+            if force or stale:
+                self._values = self._fetch()
+                self._loaded = (self.version, now)
+            return self._values
+
+    def records(self, name):
+        return to_records(self.refresh().get(name, []))
+
+    def frame(self, name):
+        return pd.DataFrame(self.records(name), dtype=str)
+
+    def tickers(self, name):
+        """{コード: 銘柄名}"""
+        return {r["Ticker"]: r.get("Name", "") for r in self.records(name)}
+
+    def add(self, name, ticker, label=""):
+        with self._lock:
+            self.pending.append(add_op(name, ticker, label))
+
+    def delete(self, name, ticker):
+        with self._lock:
+            self.pending.append(delete_op(name, ticker))
+
+    def flush(self, ops=None):
+        """
+        溜めた追加・削除を、最新の内容に当ててから1回のまとめ書きで反映する
+        ops を渡すと、リポジトリのキューではなくその操作の並び (セッションごとのキューなど) を反映する
+        """
+        with self._lock:
+            if ops is not None:
+                return self._write(list(ops))
+            count = self._write(self.pending)
+            self.pending = []  # 書き込みに失敗した時はキューに残す
+            return count
+
+    def _write(self, pending):
+        if not pending:
+            return 0
+        values = self.refresh(force=True)
+        data = []
+        for name in self.worksheets:
+            ops = [op for op in pending if op[1] == name]
+            if not ops:
+                continue
+            old = values.get(name) or [HEADER]
+            header, rows = list(old[0]), [list(r) for r in old[1:]]
+            col_t = header.index("Ticker") if "Ticker" in header else 0
+            col_n = header.index("Name") if "Name" in header else 1
+            for kind, _, ticker, label in ops:
+                exists = [r for r in rows if len(r) > col_t and str(r[col_t]).strip() == ticker]
+                if kind == "add" and not exists:
+                    row = [""] * len(header)
+                    row[col_t], row[col_n] = ticker, label
+                    rows.append(row)
+                elif kind == "delete":
+                    rows = [r for r in rows if r not in exists]
+            # 削除で短くなった分は空文字で上書きして消す
+            width = max([len(header)] + [len(r) for r in old])
+            body = [header] + rows + [[""] * width] * (len(old) - 1 - len(rows))
+            body = [r + [""] * (width - len(r)) for r in body]
+            data.append({"range": f"'{name}'!A1", "values": body})
+        if data:
+            self.spreadsheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+        self.version += 1
+        return len(pending)
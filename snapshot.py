@@ -0,0 +1,134 @@
+import os
+import math
+import pandas as pd
+import strategies
+
+"""
+snapshot.py (夜間分析結果の保存と読み込み)
+・notify.py が計算した「銘柄 × 戦略」ごとの成績・現在の判定・判定用指標の直近2本を
+  1つの Parquet ファイル (列指向・圧縮) に書き出します。
+・app.py のAI診断タブは、最終足と資金が一致する (= 新しい) 時だけこれを読んで表示し、再計算しません。
+  成績が何日からのものか (stats_start) も保存し、タブに評価期間として表示します
+  (notify --walk-forward の成績は2年ちょうどではなく、2年〜2年1か月の期間になるため)。
+・このファイルは notify.py と app.py が同じ data/ (または ANALYSIS_SNAPSHOT_PATH) を読み書きできる環境、
+  つまり手元や自前のサーバーで動かす時にだけ使われます。GitHub Actions の夜間ジョブが作ったファイルは
+  Actions のキャッシュに残るだけで Streamlit のホストには届かないので、そこではタブは毎回計算します。
+・ファイルの形式を変えた時は SNAPSHOT_VERSION を上げます (古い版のファイルは使わない)。
+"""
+
+SNAPSHOT_PATH = os.getenv('ANALYSIS_SNAPSHOT_PATH', os.path.join('data', 'snapshot.parquet'))
+SNAPSHOT_VERSION = 3
+
+# 判定に使う指標 (戦略のルールが読む列)
+SIGNAL_COLUMNS = strategies.signal_columns()
+
+# AI診断タブの成績表の列
+TABLE_COLUMNS = ["戦略名", "勝率", "収益率", "最終資産", "PF", "取引回数", "最大DD", "シャープレシオ",
+                 "現在の判定", "根拠", "ガチホ差額"]
+
+
+def diagnosis_rows(strategy_stats, signals, cash):
+    """
+    戦略ごとの統計と現在の判定から、AI診断の成績表の行を作る
+    strategy_stats: {戦略名: Backtest.run() と同じキーの統計 (失敗した戦略は None)}
+    signals: {戦略名: (判定, 根拠)}
+    """
+    rows = []
+    for name, stats in strategy_stats.items():
+        if stats is None:
+            continue
+        # ガチホ参考値 (どの戦略でも同じ)
+        buy_hold_val = cash * (1 + stats['Buy & Hold Return [%]'] / 100)
+        action, reason = signals[name]
+        rows.append({
+            "戦略名": name,
+            "勝率": stats['Win Rate [%]'],
+            "収益率": stats['Return [%]'],
+            "最終資産": stats['Equity Final [$]'],
+            "PF": stats['Profit Factor'],
+            "取引回数": stats['# Trades'],
+            "最大DD": stats['Max. Drawdown [%]'],
+            "シャープレシオ": stats['Sharpe Ratio'],
+            "現在の判定": action,
+            "根拠": reason,
+            "ガチホ差額": stats['Equity Final [$]'] - buy_hold_val
+        })
+    return rows
+
+
+def sort_table(rows):
+    """成績表を勝率順に並べる"""
+    if not len(rows):
+        return pd.DataFrame(columns=TABLE_COLUMNS)
+    return pd.DataFrame(rows)[TABLE_COLUMNS].sort_values("勝率", ascending=False).reset_index(drop=True)
+
+
+def ticker_records(ticker, signal_df, rows, cash, commission=.002, stats_start=None):
+    """
+    1銘柄分のスナップショット行 (戦略ごとに1行、判定用指標の直近2本を横に並べる)
+    stats_start は成績の評価開始日 (省略時は空)
+    """
+    last, prev = signal_df.iloc[-1], signal_df.iloc[-2]
+    tails = {}
+    for col in SIGNAL_COLUMNS:
+        tails[col] = float(last[col]) if col in last else float('nan')
+        tails[f"prev_{col}"] = float(prev[col]) if col in prev else float('nan')
+    date = signal_df.index[-1]
+    base = {
+        "ticker": str(ticker),
+        "last_date": str(date.date()) if hasattr(date, 'date') else str(date),
+        "cash": float(cash),
+        "commission": float(commission),
+        "stats_start": "" if stats_start is None else str(pd.Timestamp(stats_start).date()),
+    }
+    return [{**base, **row, **tails} for row in rows]
+
+
+# ==========================================
+# 書き込み・読み込み
+# ==========================================
+def write_snapshot(records, path=SNAPSHOT_PATH):
+    """全銘柄分の行を1ファイルに書き出す (途中で落ちても壊れないよう一時ファイルから置き換え)"""
+    df = pd.DataFrame(records)
+    df.insert(0, "version", SNAPSHOT_VERSION)
+    df["created_at"] = pd.Timestamp.now().isoformat(timespec='seconds')
+    for col in ("ticker", "戦略名", "現在の判定", "根拠"):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return len(df)
+
+
+def load_ticker(ticker, path=SNAPSHOT_PATH):
+    """1銘柄分の行だけを読む (ファイルが無い・版が違う時は空のDataFrame)"""
+    try:
+        df = pd.read_parquet(path, filters=[("ticker", "==", str(ticker))])
+    except Exception:
+        return pd.DataFrame()
+    if df.empty or (df["version"] != SNAPSHOT_VERSION).any():
+        return pd.DataFrame()
+    for col in ("ticker", "戦略名", "現在の判定", "根拠"):
+        df[col] = df[col].astype(str)
+    return df
+
+
+def fresh_table(ticker, last_date, last_close, cash, commission=.002, path=SNAPSHOT_PATH):
+    """
+    スナップショットが今のデータと同じ最終足 (日付・終値)・資金・手数料で計算されていれば
+    成績表 (勝率順) を、そうでなければ None を返す
+    成績の評価開始日は表の attrs["stats_start"] に入れる
+    """
+    df = load_ticker(ticker, path)
+    if df.empty:
+        return None
+    row = df.iloc[0]
+    if (row["last_date"] != str(pd.Timestamp(last_date).date())
+            or not math.isclose(row["Close"], float(last_close), rel_tol=1e-9)
+            or row["cash"] != cash or row["commission"] != commission):
+        return None
+    table = sort_table(df.to_dict('records'))
+    table.attrs["stats_start"] = row["stats_start"]
+    return table
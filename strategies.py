@@ -0,0 +1,251 @@
+import functools
+import numpy as np
+import pandas as pd
+import indicators
+
+"""
+strategies.py (売買戦略のルールと判定)
+・4つの戦略を「使う指標」「買い条件」「売り条件」のルールとして、ここで1回だけ宣言します。
+・同じルールから次のものを作るので、バックテストと今日の判定が食い違うことはありません。
+  - 一括計算バックテストの売買シグナル配列 (vector_backtest / sweep / walkforward)
+  - backtesting の Strategy クラス (Backtest.run() との一致確認・アプリの検証実行)
+  - 今日の判定 (check_current_signal、全銘柄をまとめて判定する screener)
+・条件は配列演算で評価します。1銘柄の全期間 (1次元) でも (日付 × 銘柄) のパネル (2次元) でも同じ式です。
+"""
+
+BUY = "買い 🚀"
+SELL = "売り 🔻"
+STAY = "ステイ 🤔"
+
+
+# ==========================================
+# 1. ルール
+# ==========================================
+# indicators: {名前: (指標の種類, パラメータ, 何列目か)}  ※列の順は pandas_ta と同じ
+#   macd は (MACD線, ヒストグラム, シグナル線)、bbands は (下限, 中心, 上限, ...)
+# entry / exit: (演算, 左, 右)。左右は indicators の名前・"close" (終値)・数値
+#   演算は cross_above (上抜け) / cross_below (下抜け) / above (上) / below (下)
+# pyramid: 保有中に買いシグナルが出たら買い増すか
+# reasons: 買い・売りの根拠 (指標の名前で値を埋め込める)
+def sma_cross(n1=5, n2=25):
+    return {
+        "name": "SMAクロス", "class": "SmaCross", "params": {"n1": n1, "n2": n2},
+        "indicators": {"fast": ("sma", {"length": n1}, 0), "slow": ("sma", {"length": n2}, 0)},
+        "entry": ("cross_above", "fast", "slow"),
+        "exit": ("cross_below", "fast", "slow"),
+        "pyramid": True, "reasons": ("ゴールデンクロス", "デッドクロス"),
+    }
+
+
+def rsi_reversal(length=14, lower=30, upper=70):
+    return {
+        "name": "RSI逆張り", "class": "RsiOscillator", "params": {"length": length, "lower": lower, "upper": upper},
+        "indicators": {"rsi": ("rsi", {"length": length}, 0)},
+        "entry": ("cross_above", "rsi", lower),
+        "exit": ("cross_below", "rsi", upper),
+        "pyramid": True, "reasons": ("売られすぎから反発 (RSI{rsi:.0f})", "買われすぎから反落 (RSI{rsi:.0f})"),
+    }
+
+
+def macd_trend(fast=12, slow=26, signal=9):
+    params = {"fast": fast, "slow": slow, "signal": signal}
+    return {
+        "name": "MACD", "class": "MacdTrend", "params": params,
+        "indicators": {"macd": ("macd", params, 0), "signal": ("macd", params, 2)},
+        "entry": ("cross_above", "macd", "signal"),
+        "exit": ("cross_below", "macd", "signal"),
+        "pyramid": True, "reasons": ("MACD上抜け", "MACD下抜け"),
+    }
+
+
+def bollinger(length=20, std=2.0):
+    params = {"length": length, "std": std}
+    return {
+        "name": "ボリンジャー", "class": "BollingerBands", "params": params,
+        "indicators": {"lower": ("bbands", params, 0), "upper": ("bbands", params, 2)},
+        "entry": ("below", "close", "lower"),
+        "exit": ("above", "close", "upper"),
+        "pyramid": False, "reasons": ("バンド下限割れ", "バンド上限到達"),
+    }
+
+
+# 戦略名 → ルールを作る関数 (パラメータ総当たりは別のパラメータで作り直す)
+RULES = {"SMAクロス": sma_cross, "RSI逆張り": rsi_reversal, "MACD": macd_trend, "ボリンジャー": bollinger}
+
+# 既定のパラメータのルール (この順で表示・評価する)
+STRATEGIES = [build() for build in RULES.values()]
+NAMES = [r["name"] for r in STRATEGIES]
+_DEFAULTS = {r["name"]: r for r in STRATEGIES}
+
+
+def rule(name, **params):
+    """戦略名のルール (パラメータを指定しなければ既定のもの)"""
+    return RULES[name](**params) if params else _DEFAULTS[name]
+
+
+def column_name(kind, params, output=0):
+    """pandas_ta が付ける列名 (signal_tail や streaming の指標値はこの名前で持つ)"""
+    if kind == "sma":
+        return f"SMA_{params['length']}"
+    if kind == "rsi":
+        return f"RSI_{params['length']}"
+    if kind == "macd":
+        return f"{('MACD', 'MACDh', 'MACDs')[output]}_{params['fast']}_{params['slow']}_{params['signal']}"
+    if kind == "bbands":
+        return f"{('BBL', 'BBM', 'BBU')[output]}_{params['length']}_{float(params['std'])}"
+    raise KeyError(kind)
+
+
+def signal_specs():
+    """全戦略の判定に使う指標の (種類, パラメータ) (重複なし。indicators・streaming はこれを計算する)"""
+    specs = []
+    for r in STRATEGIES:
+        for kind, params, _ in r["indicators"].values():
+            if (kind, params) not in specs:
+                specs.append((kind, params))
+    return specs
+
+
+def signal_columns():
+    """全戦略の判定に使う列名 (終値を含む)"""
+    cols = ["Close"]
+    for r in STRATEGIES:
+        cols += [column_name(*spec) for spec in r["indicators"].values() if column_name(*spec) not in cols]
+    return cols
+
+
+# ==========================================
+# 2. 指標の用意 ({名前: 配列})
+# ==========================================
+def rule_columns(rule, close, ticker=""):
+    """1銘柄の終値の全期間から、ルールが使う指標を共有キャッシュ (indicators) で計算する"""
+    cols = {"close": np.asarray(close, dtype=float)}
+    for alias, (kind, params, output) in rule["indicators"].items():
+        value = indicators.CACHE.get(kind, close, ticker, **params)
+        if isinstance(value, pd.DataFrame):
+            value = value.iloc[:, output]
+        cols[alias] = value.to_numpy(dtype=float)
+    return cols
+
+
+def frame_columns(rule, df):
+    """pandas_ta の列名で指標を持つ表 (signal_tail・streaming の直近2本など) から取り出す"""
+    cols = {"close": df['Close'].to_numpy(dtype=float)}
+    for alias, spec in rule["indicators"].items():
+        cols[alias] = df[column_name(*spec)].to_numpy(dtype=float)
+    return cols
+
+
+def warmup_series(rule, cols):
+    """指標が揃うまでの足数を数える対象 (backtesting が self.I() で登録する指標と同じ)"""
+    return [cols[alias] for alias in rule["indicators"]]
+
+
+# ==========================================
+# 3. 条件の評価 (1次元でも2次元でも、先頭の軸が時間)
+# ==========================================
+def condition(cond, cols):
+    """条件を満たす足で True の配列 (NaN との比較は False。cross は1本目が False)"""
+    op, a, b = cond
+    a = cols[a] if isinstance(a, str) else a
+    b = cols[b] if isinstance(b, str) else b
+    shape = np.broadcast_shapes(np.shape(a), np.shape(b))
+    a = np.broadcast_to(np.asarray(a, dtype=float), shape)
+    b = np.broadcast_to(np.asarray(b, dtype=float), shape)
+    with np.errstate(invalid='ignore'):
+        if op == "above":
+            return a > b
+        if op == "below":
+            return a < b
+        out = np.zeros(shape, dtype=bool)
+        if op == "cross_above":
+            out[1:] = (a[:-1] < b[:-1]) & (a[1:] > b[1:])
+        elif op == "cross_below":
+            out[1:] = (a[:-1] > b[:-1]) & (a[1:] < b[1:])
+        else:
+            raise KeyError(op)
+        return out
+
+
+def signals(rule, cols):
+    """(買いシグナル, 売りシグナル) の真偽配列"""
+    return condition(rule["entry"], cols), condition(rule["exit"], cols)
+
+
+def backtest_signals(rule, df, ticker=""):
+    """一括計算バックテスト用の (買い, 売り, 指標の一覧)"""
+    cols = rule_columns(rule, df['Close'].values, ticker)
+    entry, exit_ = signals(rule, cols)
+    return entry, exit_, warmup_series(rule, cols)
+
+
+# ==========================================
+# 4. 今日の判定
+# ==========================================
+def current_signal(rule, cols):
+    """最後の足の (判定, 根拠) (買いと売りが同時なら、バックテストと同じく買いを優先)"""
+    entry, exit_ = signals(rule, cols)
+    values = {k: float(v[-1]) for k, v in cols.items()}
+    if entry[-1]:
+        return BUY, rule["reasons"][0].format(**values)
+    if exit_[-1]:
+        return SELL, rule["reasons"][1].format(**values)
+    return STAY, "シグナルなし"
+
+
+def best_strategy(strategy_stats):
+    """全戦略の成績 (STRATEGIES の順) から勝率No.1の (戦略名, 勝率) を選ぶ (同率なら後勝ち、成績が無ければ SMAクロス)"""
+    best_name, best_win_rate = "SMAクロス", -1
+    for r, stats in zip(STRATEGIES, strategy_stats):
+        if stats is None:
+            continue
+        win_rate = stats['Win Rate [%]']
+        if win_rate >= best_win_rate:
+            best_win_rate = win_rate
+            best_name = r["name"]
+    return best_name, best_win_rate
+
+
+def check_current_signal(strategy_name, df):
+    """最新データ (直近2本以上、pandas_ta の列名の指標付き) に基づいて売買シグナルを判定"""
+    try:
+        r = rule(strategy_name)
+        return current_signal(r, frame_columns(r, df.iloc[-2:]))
+    except Exception as e:
+        return "判定不能", f"データ不足 ({e})"
+
+
+# ==========================================
+# 5. backtesting の Strategy クラス
+# ==========================================
+def strategy_class(rule, base):
+    """
+    ルールから backtesting の Strategy クラスを作る
+    シグナルは init() で全期間分を計算し (各足の判定はその足と1本前しか見ない)、next() は参照するだけ
+    """
+    def init(self):
+        cols = rule_columns(rule, self.data.Close, self.ticker)
+        # backtesting は属性に持たせた指標から準備期間を数えるので、名前の属性にする
+        for alias in rule["indicators"]:
+            setattr(self, alias, self.I(lambda values=cols[alias]: values, name=alias))
+        self.entry, self.exit = signals(rule, cols)
+
+    def next(self):
+        i = len(self.data) - 1
+        if self.entry[i]:
+            if rule["pyramid"] or not self.position.is_long:
+                self.buy()
+        elif self.exit[i]:
+            self.position.close()
+
+    return type(rule["class"], (base,), {"ticker": "", "init": init, "next": next})
+
+
+@functools.lru_cache(maxsize=None)
+def strategy_classes():
+    """
+    戦略名 → backtesting の Strategy クラス
+    backtesting (と bokeh) は読み込みに時間が掛かるので、必要になるまで読み込まない
+    """
+    from backtesting import Strategy
+    return {r["name"]: strategy_class(r, Strategy) for r in STRATEGIES}
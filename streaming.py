@@ -0,0 +1,373 @@
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import strategies
+
+"""
+streaming.py (1本ずつ更新できるテクニカル指標)
+・SMA / EMA / RSI / MACD / ボリンジャーバンドを、過去データで一度だけ初期化した後は
+  新しい足1本ごとに O(1) で更新します (移動合計・Wilder平滑・EMAの連鎖・Welford法の分散)。
+・計算方法は pandas_ta と同じです (EMAは最初のn本の単純平均が起点、RSIはewm(alpha=1/n)、BBは母標準偏差)。
+・to_dict() / from_dict() でJSONに保存でき、夜間ジョブは前日の状態から再開できます。
+・update_many() は数千本のまとまり (分足のチャンクなど) を配列演算で一度に更新します。
+  結果も更新後の状態も、1本ずつ update() した場合と同じです (次のチャンクにそのまま引き継げます)。
+・pandas_ta との数値一致は tests/test_streaming.py で確認します。
+"""
+
+# 移動合計の誤差が溜まらないよう、この回数ごとに窓全体から計算し直す
+RESYNC_EVERY = 1000
+NAN = float('nan')
+
+
+class OnlineIndicator:
+    """1本ずつ更新する指標の共通部分 (状態の保存・復元)"""
+    registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        OnlineIndicator.registry[cls.__name__] = cls
+
+    def to_dict(self):
+        state = {}
+        for k, v in self.__dict__.items():
+            if isinstance(v, OnlineIndicator):
+                v = v.to_dict()
+            elif isinstance(v, list) and v and isinstance(v[0], OnlineIndicator):
+                v = [x.to_dict() for x in v]
+            elif isinstance(v, deque):
+                v = list(v)
+            state[k] = v
+        return {"type": type(self).__name__, "state": state}
+
+    @classmethod
+    def from_dict(cls, data):
+        obj = OnlineIndicator.registry[data["type"]].__new__(OnlineIndicator.registry[data["type"]])
+        for k, v in data["state"].items():
+            if isinstance(v, dict) and "type" in v:
+                v = OnlineIndicator.from_dict(v)
+            elif k == "members":
+                v = [OnlineIndicator.from_dict(x) for x in v]
+            elif k == "window":
+                v = deque(v)
+            setattr(obj, k, v)
+        return obj
+
+    def seed(self, values):
+        """過去データでまとめて初期化する"""
+        for x in values:
+            self.update(x)
+        return self.value
+
+    def update_many(self, values):
+        """複数本をまとめて更新し、各足の値の配列を返す (配列演算版が無い指標は1本ずつ)"""
+        return np.array([self.update(x) for x in values], dtype=float)
+
+
+def ewm_from(value, values, alpha):
+    """y = alpha * x + (1 - alpha) * y を直前の値 value から続けて計算する (pandas の ewm で一括)"""
+    return pd.Series(np.concatenate([[value], values])).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def window_context(window, values):
+    """保持している窓の値と新しい値をつないだ配列"""
+    return np.concatenate([np.fromiter(window, dtype=float, count=len(window)), np.asarray(values, dtype=float)])
+
+
+class OnlineSMA(OnlineIndicator):
+    """単純移動平均 (移動合計)"""
+    def __init__(self, length):
+        self.length = length
+        self.window = deque()
+        self.total = 0.0
+        self.updates = 0
+        self.value = NAN
+
+    def update(self, x):
+        x = float(x)
+        self.window.append(x)
+        self.total += x
+        if len(self.window) > self.length:
+            self.total -= self.window.popleft()
+        self.updates += 1
+        if self.updates % RESYNC_EVERY == 0:
+            self.total = math.fsum(self.window)
+        self.value = self.total / self.length if len(self.window) == self.length else NAN
+        return self.value
+
+    def update_many(self, values):
+        ctx = window_context(self.window, values)
+        n, pos = len(ctx) - len(self.window), len(self.window)
+        out = np.full(n, NAN)
+        if len(ctx) >= self.length:
+            # 窓ごとの合計 (窓は length 本なので、長い累積和の引き算より誤差が小さい)
+            means = sliding_window_view(ctx, self.length).sum(axis=1) / self.length
+            first = max(self.length - 1 - pos, 0)
+            out[first:] = means[pos + first - self.length + 1:]
+        self.window = deque(ctx[-self.length:].tolist())
+        self.total = math.fsum(self.window)
+        self.updates += n
+        if n:
+            self.value = float(out[-1])
+        return out
+
+
+class OnlineStd(OnlineIndicator):
+    """移動標準偏差 (Welford法で1本入れて1本出す、ddof=0)"""
+    def __init__(self, length):
+        self.length = length
+        self.window = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+        self.value = NAN
+
+    def _resync(self):
+        n = len(self.window)
+        self.mean = math.fsum(self.window) / n
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in self.window)
+
+    def update(self, x):
+        x = float(x)
+        self.window.append(x)
+        if len(self.window) > self.length:
+            old = self.window.popleft()
+            prev_mean = self.mean
+            self.mean += (x - old) / self.length
+            self.m2 += (x - old) * (x - self.mean + old - prev_mean)
+        else:
+            n = len(self.window)
+            delta = x - self.mean
+            self.mean += delta / n
+            self.m2 += delta * (x - self.mean)
+        self.updates += 1
+        if self.updates % RESYNC_EVERY == 0:
+            self._resync()
+        if len(self.window) == self.length:
+            self.value = math.sqrt(max(self.m2, 0.0) / self.length)
+        else:
+            self.value = NAN
+        return self.value
+
+    def update_many(self, values):
+        ctx = window_context(self.window, values)
+        n, pos = len(ctx) - len(self.window), len(self.window)
+        out = np.full(n, NAN)
+        if len(ctx) >= self.length:
+            sd = np.sqrt(sliding_window_view(ctx, self.length).var(axis=1))
+            first = max(self.length - 1 - pos, 0)
+            out[first:] = sd[pos + first - self.length + 1:]
+        self.window = deque(ctx[-self.length:].tolist())
+        if self.window:
+            self._resync()
+        self.updates += n
+        if n:
+            self.value = float(out[-1])
+        return out
+
+
+class OnlineEMA(OnlineIndicator):
+    """指数移動平均 (pandas_ta と同じく最初のn本の単純平均を起点にする)"""
+    def __init__(self, length):
+        self.length = length
+        self.alpha = 2 / (length + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        x = float(x)
+        self.count += 1
+        if self.count < self.length:
+            self.total += x
+        elif self.count == self.length:
+            self.value = (self.total + x) / self.length
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float)
+        out = np.full(len(values), NAN)
+        i = 0
+        while i < len(values) and self.count < self.length:  # 起点の単純平均が出るまで (最初の length 本だけ)
+            out[i] = self.update(values[i])
+            i += 1
+        if i < len(values):
+            out[i:] = ewm_from(self.value, values[i:], self.alpha)
+            self.count += len(values) - i
+            self.value = float(out[-1])
+        return out
+
+
+class OnlineRMA(OnlineIndicator):
+    """Wilder平滑 (pandas の ewm(alpha=1/n, min_periods=n).mean() と同じ加重平均)"""
+    def __init__(self, length):
+        self.length = length
+        self.decay = 1 - 1 / length
+        self.num = 0.0
+        self.den = 0.0
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x):
+        self.num = float(x) + self.decay * self.num
+        self.den = 1.0 + self.decay * self.den
+        self.count += 1
+        self.value = self.num / self.den if self.count >= self.length else NAN
+        return self.value
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        if not n:
+            return np.empty(0)
+        alpha = 1 - self.decay
+        # num = x + decay * num は alpha * num の ewm、den は等比数列の和
+        num = ewm_from(alpha * self.num, values, alpha) / alpha
+        power = self.decay ** np.arange(1, n + 1)
+        den = (1 - power) / alpha + power * self.den
+        out = np.where(self.count + np.arange(1, n + 1) >= self.length, num / den, NAN)
+        self.num, self.den = float(num[-1]), float(den[-1])
+        self.count += n
+        self.value = float(out[-1])
+        return out
+
+
+class OnlineRSI(OnlineIndicator):
+    def __init__(self, length=14):
+        self.length = length
+        self.gain = OnlineRMA(length)
+        self.loss = OnlineRMA(length)
+        self.prev = None
+        self.value = NAN
+
+    def update(self, x):
+        x = float(x)
+        if self.prev is not None:
+            diff = x - self.prev
+            g = self.gain.update(max(diff, 0.0))
+            l = self.loss.update(max(-diff, 0.0))
+            total = g + l
+            self.value = 100 * g / total if total else NAN
+        self.prev = x
+        return self.value
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=float)
+        out = np.full(len(values), NAN)
+        if not len(values):
+            return out
+        prev = np.concatenate([[NAN if self.prev is None else self.prev], values[:-1]])
+        diff = values - prev
+        has = ~np.isnan(diff)  # 最初の1本 (前の足が無い) だけ False
+        if has.any():
+            g = self.gain.update_many(np.maximum(diff[has], 0.0))
+            l = self.loss.update_many(np.maximum(-diff[has], 0.0))
+            total = g + l
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[has] = np.where(total != 0, 100 * g / total, NAN)
+            self.value = float(out[-1])
+        self.prev = float(values[-1])
+        return out
+
+
+class OnlineMACD(OnlineIndicator):
+    """MACD (値は (MACD線, ヒストグラム, シグナル) の順、pandas_ta の列順と同じ)"""
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = OnlineEMA(fast)
+        self.slow = OnlineEMA(slow)
+        self.signal = OnlineEMA(signal)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        f, s = self.fast.update(x), self.slow.update(x)
+        line = f - s
+        if math.isnan(line):
+            self.value = (NAN, NAN, NAN)
+            return self.value
+        sig = self.signal.update(line)
+        self.value = (line, line - sig, sig)
+        return self.value
+
+    def update_many(self, values):
+        """(MACD線, ヒストグラム, シグナル) の配列を返す"""
+        line = self.fast.update_many(values) - self.slow.update_many(values)
+        sig = np.full(len(line), NAN)
+        ok = ~np.isnan(line)  # MACD線が出る前の足はシグナルの計算に入れない
+        if ok.any():
+            sig[ok] = self.signal.update_many(line[ok])
+        if len(line):
+            self.value = (float(line[-1]), float(line[-1] - sig[-1]), float(sig[-1])) if ok[-1] else (NAN, NAN, NAN)
+        return line, line - sig, sig
+
+
+class OnlineBBands(OnlineIndicator):
+    """ボリンジャーバンド (値は (下限, 中心, 上限))"""
+    def __init__(self, length=20, std=2.0):
+        self.mult = float(std)
+        self.mid = OnlineSMA(length)
+        self.sd = OnlineStd(length)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, x):
+        m, s = self.mid.update(x), self.sd.update(x)
+        self.value = (m - self.mult * s, m, m + self.mult * s)
+        return self.value
+
+    def update_many(self, values):
+        """(下限, 中心, 上限) の配列を返す"""
+        m, s = self.mid.update_many(values), self.sd.update_many(values)
+        return m - self.mult * s, m, m + self.mult * s
+
+
+# 指標の種類 (strategies のルールの名前) → 1本ずつ更新する指標
+ONLINE = {"sma": OnlineSMA, "rsi": OnlineRSI, "macd": OnlineMACD, "bbands": OnlineBBands}
+
+
+# ==========================================
+# 判定用の指標セット (check_current_signal が使う列をまとめて更新)
+# ==========================================
+class IndicatorSet(OnlineIndicator):
+    """
+    判定用の指標 (strategies.signal_specs()、既定では SMA_5 / SMA_25 / RSI_14 / MACD_12_26_9 / BB_20_2.0) を
+    1本ずつ更新し、直近2本分の値を pandas_ta の列名の辞書で保持する
+    """
+    def __init__(self, specs=None):
+        specs = specs or strategies.signal_specs()
+        self.specs = [[kind, dict(params)] for kind, params in specs]
+        self.members = [ONLINE[kind](**params) for kind, params in specs]
+        self.prev_row = None
+        self.row = None
+        self.date = None
+
+    def _columns(self, values):
+        """各指標の値 (出力が複数ある指標はタプル) を pandas_ta の列名で並べる"""
+        cols = {}
+        for (kind, params), value in zip(self.specs, values):
+            outputs = value if isinstance(value, tuple) else (value,)
+            for i, v in enumerate(outputs):
+                cols[strategies.column_name(kind, params, i)] = v
+        return cols
+
+    def update(self, close, date=None):
+        self.prev_row = self.row
+        self.row = {"Close": float(close), **self._columns([m.update(close) for m in self.members])}
+        self.date = None if date is None else str(date)
+        return self.row
+
+    def update_many(self, closes, dates=None):
+        """複数本をまとめて更新し、{pandas_ta の列名: 配列} を返す (直近2本の row も更新する)"""
+        closes = np.asarray(closes, dtype=float)
+        cols = {"Close": closes, **self._columns([m.update_many(closes) for m in self.members])}
+        if len(closes):
+            rows = [{k: float(v[i]) for k, v in cols.items()} for i in range(max(-2, -len(closes)), 0)]
+            self.prev_row = rows[0] if len(rows) == 2 else self.row
+            self.row = rows[-1]
+            self.date = None if dates is None else str(dates[-1])
+        return cols
+
+    @property
+    def value(self):
+        return self.row
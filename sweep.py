@@ -0,0 +1,223 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import pandas as pd
+import vector_backtest
+import strategies
+from price_store import OHLCV_COLUMNS
+
+"""
+sweep.py (戦略パラメータの総当たり検証)
+・各戦略のパラメータ候補 (GRIDS) をすべて一括計算のバックテストで評価し、勝率順の表を返します。
+  売買ルールは strategies のルールをパラメータを変えて作り直したものです。
+・移動平均・標準偏差は期間ごとに1回だけ窓の配列演算で求め、ローリング計算はパラメータ間で使い回します。
+・パラメータの組み合わせは連続したまとまり (split_grid) に分けてプロセスプールに渡せるので、
+  1銘柄でも全コアを使えます (アプリの検証ラボも夜間ジョブ notify --sweep も同じ分け方)。
+"""
+
+# 戦略名 → パラメータ候補 (キーは strategies.RULES の関数の引数)
+GRIDS = {
+    "SMAクロス": {"n1": [3, 5, 10, 15, 20], "n2": [20, 25, 40, 50, 75]},
+    "RSI逆張り": {"length": [9, 14, 21], "lower": [20, 25, 30, 35], "upper": [65, 70, 75, 80]},
+    "MACD": {"fast": [8, 12, 16], "slow": [21, 26, 35], "signal": [5, 9, 12]},
+    "ボリンジャー": {"length": [10, 20, 30], "std": [1.5, 2.0, 2.5]},
+}
+
+
+def combos(strategy_name):
+    """パラメータ候補の全組み合わせ (短期 < 長期 にならないものは除く)"""
+    grid = GRIDS[strategy_name]
+    out = []
+    for values in itertools.product(*grid.values()):
+        params = dict(zip(grid.keys(), values))
+        if params.get("n1", 0) >= params.get("n2", np.inf):
+            continue
+        if params.get("fast", 0) >= params.get("slow", np.inf):
+            continue
+        out.append(params)
+    return out
+
+
+# ==========================================
+# 1. パラメータ間で共有するローリング計算
+# ==========================================
+class WindowCache:
+    """1銘柄の終値から、期間違いの指標をまとめて (一度ずつ) 計算する"""
+    def __init__(self, close):
+        self.close = np.asarray(close, dtype=float)
+        self._memo = {}
+
+    def _memoize(self, key, func):
+        if key not in self._memo:
+            self._memo[key] = func()
+        return self._memo[key]
+
+    def _windows(self, n):
+        """長さ n の窓の (足数 - n + 1, n) のビュー (コピーしない)"""
+        return sliding_window_view(self.close, n) if len(self.close) >= n else np.empty((0, n))
+
+    def sma(self, n):
+        """
+        単純移動平均
+        累積和の引き算は長い期間・値の大きい株価で桁落ちするので、窓ごとに合計する (streaming と同じ)
+        """
+        def calc():
+            out = np.full(len(self.close), np.nan)
+            out[n - 1:] = self._windows(n).mean(axis=1)
+            return out
+        return self._memoize(("sma", n), calc)
+
+    def std(self, n):
+        """母標準偏差 (pandas_ta の bbands と同じ ddof=0。二乗の累積和を使わず窓ごとに計算する)"""
+        def calc():
+            out = np.full(len(self.close), np.nan)
+            out[n - 1:] = self._windows(n).std(axis=1)
+            return out
+        return self._memoize(("std", n), calc)
+
+    def ema(self, n, values=None, key=None):
+        """pandas_ta と同じく最初の n 本の単純平均を起点にした EMA"""
+        def calc():
+            x = pd.Series(self.close if values is None else values)
+            first = x.first_valid_index()
+            x = x.loc[first:].copy()
+            seed = x.iloc[:n].mean()
+            x.iloc[:n - 1] = np.nan
+            x.iloc[n - 1] = seed
+            out = np.full(len(self.close), np.nan)
+            out[first:] = x.ewm(span=n, adjust=False).mean().values
+            return out
+        return self._memoize(("ema", n, key), calc)
+
+    def rsi(self, n):
+        """pandas_ta と同じ Wilder 平滑 (ewm alpha=1/n) の RSI"""
+        def calc():
+            diff = pd.Series(self.close).diff()
+            gain = diff.clip(lower=0).ewm(alpha=1 / n, min_periods=n).mean()
+            loss = (-diff.clip(upper=0)).ewm(alpha=1 / n, min_periods=n).mean()
+            return (100 * gain / (gain + loss)).values
+        return self._memoize(("rsi", n), calc)
+
+    def macd(self, fast, slow, signal):
+        """(MACD線, ヒストグラム, シグナル線) (pandas_ta の列順)"""
+        def calc():
+            line = self.ema(fast) - self.ema(slow)
+            sig = self.ema(signal, line, key=(fast, slow))
+            return line, line - sig, sig
+        return self._memoize(("macd", fast, slow, signal), calc)
+
+    def bbands(self, length, std):
+        """(下限, 中心, 上限)"""
+        mid, sd = self.sma(length), self.std(length)
+        return mid - std * sd, mid, mid + std * sd
+
+    def columns(self, rule):
+        """ルールが使う指標を {名前: 配列} で (strategies.rule_columns のパラメータ総当たり版)"""
+        cols = {"close": self.close}
+        for alias, (kind, p, output) in rule["indicators"].items():
+            if kind == "sma":
+                cols[alias] = self.sma(p["length"])
+            elif kind == "rsi":
+                cols[alias] = self.rsi(p["length"])
+            elif kind == "macd":
+                cols[alias] = self.macd(p["fast"], p["slow"], p["signal"])[output]
+            elif kind == "bbands":
+                cols[alias] = self.bbands(p["length"], p["std"])[output]
+            else:
+                raise KeyError(kind)
+        return cols
+
+
+def signals_for(rule, w):
+    """パラメータ指定版のエントリー/エグジットと指標の一覧"""
+    cols = w.columns(rule)
+    entry, exit_ = strategies.signals(rule, cols)
+    return entry, exit_, strategies.warmup_series(rule, cols)
+
+
+# ==========================================
+# 2. 評価
+# ==========================================
+def evaluate(open_, close, strategy_name, params, w, cash=1000000, commission=.002):
+    """1つのパラメータ組を評価して成績の行を返す (表示に必要な統計だけを計算する)"""
+    rule = strategies.rule(strategy_name, **params)
+    entry, exit_, series = signals_for(rule, w)
+    start = 1 + vector_backtest.warmup_bars(series)
+    trades = vector_backtest.simulate(open_, entry, exit_, start, cash, commission, rule["pyramid"])
+    equity = vector_backtest.equity_curve(close, trades, start, cash, commission)
+
+    closed = np.array([t for t in trades if t[4] >= 0], dtype=float).reshape(-1, 5)
+    size, entry_px, exit_px = closed[:, 0], closed[:, 1], closed[:, 3]
+    comm = (entry_px + exit_px) * size * commission
+    pl = size * (exit_px - entry_px) - comm
+    returns = (exit_px / entry_px - 1) - comm / (size * entry_px)
+    dd = 1 - equity / np.maximum.accumulate(equity)
+    return {
+        "戦略名": strategy_name,
+        "パラメータ": ", ".join(f"{k}={v}" for k, v in params.items()),
+        "勝率": (pl > 0).mean() * 100 if len(pl) else np.nan,
+        "収益率": (equity[-1] - equity[0]) / equity[0] * 100,
+        "取引回数": len(pl),
+        "PF": returns[returns > 0].sum() / (abs(returns[returns < 0].sum()) or np.nan),
+        "最大DD": -np.nan_to_num(dd.max()) * 100,
+        "params": params,
+    }
+
+
+def grid(strategy_names=None):
+    """評価する (戦略名, パラメータ) の一覧 (同じ戦略の組み合わせは並べておく)"""
+    return [(name, params) for name in (strategy_names or GRIDS) for params in combos(name)]
+
+
+def split_grid(jobs, parts):
+    """(戦略名, パラメータ) の一覧を parts 個の連続したまとまりに分ける (近い組み合わせで WindowCache を使い回す)"""
+    size = -(-len(jobs) // max(1, parts))
+    return [jobs[i:i + size] for i in range(0, len(jobs), size)]
+
+
+def evaluate_grid(df, jobs, cash=1000000, commission=.002):
+    """(戦略名, パラメータ) の一覧を1つの WindowCache で評価して成績の行を返す"""
+    w = WindowCache(df['Close'].values)
+    open_ = df['Open'].values.astype(float)
+    return [evaluate(open_, w.close, name, params, w, cash, commission) for name, params in jobs]
+
+
+def sweep_arrays(dates, values, jobs=None, cash=1000000, commission=.002):
+    """
+    日付配列とOHLCV配列から evaluate_grid する (ワーカープロセスにDataFrameを送らないため)
+    jobs を省略すると全戦略の全パラメータ。失敗した時は None
+    """
+    df = pd.DataFrame(values, index=pd.DatetimeIndex(dates), columns=OHLCV_COLUMNS)
+    try:
+        return evaluate_grid(df, grid() if jobs is None else jobs, cash, commission)
+    except Exception as e:
+        print(f"[WARN] パラメータ検証失敗: {e}")
+        return None
+
+
+def rank(parts):
+    """まとまりごとの成績の行をつなぎ、勝率 (同率なら収益率) 順の表にする (全部失敗なら None)"""
+    rows = [row for part in parts if part is not None for row in part]
+    if not rows:
+        return None
+    table = pd.DataFrame(rows)
+    return table.sort_values(["勝率", "収益率"], ascending=False, na_position='last').reset_index(drop=True)
+
+
+def sweep_ticker(df, strategy_names=None, cash=1000000, commission=.002, workers=1):
+    """
+    1銘柄の全戦略×全パラメータを評価し、勝率 (同率なら収益率) 順の表を返す
+    workers > 1 ならパラメータの組み合わせをまとまりに分けてプロセスプールで並列に評価する
+    """
+    jobs = grid(strategy_names)
+    if workers > 1 and len(jobs) > 1:
+        dates, values = df.index.values, df[OHLCV_COLUMNS].to_numpy(dtype=float)
+        parts = split_grid(jobs, workers)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(sweep_arrays, [dates] * len(parts), [values] * len(parts), parts,
+                                  [cash] * len(parts), [commission] * len(parts)))
+        if any(r is None for r in results):
+            raise RuntimeError("パラメータ検証に失敗したまとまりがあります")
+        return rank(results)
+    return rank([evaluate_grid(df, jobs, cash, commission)])
@@ -0,0 +1,23 @@
+import math
+
+import benchmark
+
+
+def test_whole_market_stages_count_tickers_per_second():
+    report = benchmark.run_benchmark(6, 120, stages=["sheet", "screener"])
+    for stage in ("sheet", "screener"):
+        r = report[stage]
+        assert r["count"] == 6
+        assert math.isclose(r["per_sec"], 6 / r["wall_s"])
+
+
+def test_stage_memory_is_measured_per_stage():
+    with benchmark.stage_memory(trace=True) as mem:
+        block = bytearray(32 * 1024 * 1024)
+        block[::4096] = b"x" * len(block[::4096])
+    assert mem["alloc_peak_mb"] >= 32
+    # RSS は /proc が無い環境では NaN
+    assert math.isnan(mem["rss_delta_mb"]) or mem["rss_delta_mb"] >= 16
+    with benchmark.stage_memory() as mem:
+        pass
+    assert math.isnan(mem["alloc_peak_mb"])
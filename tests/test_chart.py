@@ -0,0 +1,24 @@
+import numpy as np
+
+import chart
+from vector_backtest import synthetic_ohlcv
+
+
+def test_downsample_merges_each_group_into_one_candle():
+    df = synthetic_ohlcv(n=3000, seed=4)
+    out = chart.downsample(df, 300)
+    keep = chart.lttb(df['Close'].values, 300)
+    ends = np.r_[keep[1:] - 1, len(df) - 1]
+
+    assert len(out) == 300
+    assert (out.index == df.index[keep]).all()
+    np.testing.assert_allclose(out['Open'].values, df['Open'].values[keep])
+    np.testing.assert_allclose(out['Close'].values, df['Close'].values[ends])  # まとめた最後の足の終値
+    assert (out['High'] >= out[['Open', 'Close']].max(axis=1)).all()
+    assert (out['Low'] <= out[['Open', 'Close']].min(axis=1)).all()
+    assert out['Volume'].sum() == df['Volume'].sum()
+
+
+def test_short_frames_are_not_downsampled():
+    df = synthetic_ohlcv(n=100)
+    assert chart.downsample(df, 300) is df
@@ -0,0 +1,165 @@
+import pandas as pd
+import pytest
+
+import daemon
+import intraday
+from daemon import FakeClock, FakeSource, TickerState, Watcher, market_open
+from line_push import LinePusher, SentLog
+from strategies import BUY, SELL, STAY
+
+
+@pytest.fixture
+def frames():
+    return {t: pd.concat(intraday.synthetic_chunks(6, "5m", seed=i)) for i, t in enumerate(["1000", "2000"])}
+
+
+@pytest.fixture
+def script(monkeypatch):
+    """TickerState.evaluate を、銘柄ごとに決めた判定を順番に返す偽物にする (判定の回数を calls に残す)"""
+    actions, calls = {}, []
+
+    def evaluate(self):
+        ticker = next(t for t, s in watchers[-1].states.items() if s is self)
+        calls.append(ticker)
+        queue = actions.get(ticker, [])
+        return "SMA", 60.0, queue.pop(0) if queue else STAY, "根拠"
+
+    watchers = []
+    monkeypatch.setattr(TickerState, "evaluate", evaluate)
+    return actions, calls, watchers
+
+
+def make_watcher(frames, send, start_day=3, poll=300):
+    index = frames["1000"].index
+    clock = FakeClock(index[index.normalize() == index.normalize().unique()[start_day]][0])
+    return Watcher(FakeSource(frames, clock), lambda: {t: f"銘柄{t}" for t in frames}, send, clock, poll=poll)
+
+
+def recorder():
+    sent = []
+
+    def send(blocks, header):
+        sent.append(list(blocks))
+    send.sent = sent
+    return send
+
+
+# ==========================================
+# 判定の変化と送信
+# ==========================================
+def test_first_poll_only_records_baseline(frames, script):
+    actions, calls, watchers = script
+    actions.update({"1000": [BUY], "2000": [SELL]})
+    send = recorder()
+    watchers.append(w := make_watcher(frames, send))
+    assert w.poll_once() is None
+    assert send.sent == []
+    assert sorted(calls) == ["1000", "2000"]
+    assert w.states["1000"].signal[1] == BUY
+
+
+def test_pushes_only_when_verdict_changes_to_buy_or_sell(frames, script):
+    actions, calls, watchers = script
+    actions["1000"] = [STAY, BUY, BUY, STAY, SELL]
+    send = recorder()
+    watchers.append(w := make_watcher(frames, send))
+    pushed = []
+    for _ in range(5):
+        w.poll_once()
+        pushed.append([k for blocks in send.sent for k, _ in blocks])
+        send.sent.clear()
+        w.clock.sleep(w.poll)
+    assert pushed == [[], [f"1000:{BUY}"], [], [], [f"1000:{SELL}"]]
+
+
+def test_unchanged_ticker_is_not_advanced(frames, script):
+    actions, calls, watchers = script
+    watchers.append(w := make_watcher(frames, recorder()))
+    w.poll_once()
+    bars = {t: s.engine.bars for t, s in w.states.items()}
+    calls.clear()
+    # 時計を進めないので新しい足は無い
+    assert w.check("1000", "銘柄1000") is None
+    w.poll_once()
+    assert calls == []
+    assert {t: s.engine.bars for t, s in w.states.items()} == bars
+
+
+def test_provisional_bar_is_folded_in_when_next_bar_arrives(frames):
+    clock = FakeClock(frames["1000"].index[100])
+    source = FakeSource({"1000": frames["1000"]}, clock, chunk_rows=7)
+    state = TickerState()
+    assert state.advance(source.bars("1000"))
+    assert state.engine.bars == 100
+    assert state.pending.index[0] == frames["1000"].index[100]
+
+    # 取引中に最後の足の値だけ変わった: 確定させずに判定し直す
+    frames["1000"].iloc[100, frames["1000"].columns.get_loc("Close")] *= 1.01
+    assert state.advance(source.bars("1000", state.pending.index[0]))
+    assert state.engine.bars == 100
+    assert state.pending["Close"].iloc[0] == frames["1000"]["Close"].iloc[100]
+
+    # 次の足が来たら仮の足は確定して engine に入る
+    clock.sleep(300)
+    assert state.advance(source.bars("1000", state.pending.index[0]))
+    assert state.engine.bars == 101
+    assert state.pending.index[0] == frames["1000"].index[101]
+    assert not state.advance(source.bars("1000", state.pending.index[0]))
+
+
+class RecordingSession:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        self.posts.append([m["text"] for m in json["messages"]])
+        return type("Response", (), {"status_code": 200, "headers": {}, "text": ""})()
+
+
+def test_repeated_keys_are_not_resent(frames, script):
+    actions, calls, watchers = script
+    actions["1000"] = [STAY, BUY, STAY, BUY]
+    session = RecordingSession()
+    pusher = LinePusher("token", "user", session=session, sleep=lambda s: None,
+                        sent_log=SentLog(path="", today=lambda: "2026-01-05"))
+    watchers.append(w := make_watcher(frames, pusher.send))
+    for _ in range(4):
+        w.poll_once()
+        w.clock.sleep(w.poll)
+    # 同じ日の2回目の「買い」は送信側で除外される
+    assert len(session.posts) == 1
+    assert "🚀 【銘柄1000】" in session.posts[0][0]
+
+
+# ==========================================
+# 時計
+# ==========================================
+def test_run_keeps_the_poll_grid(frames, script):
+    actions, calls, watchers = script
+    watchers.append(w := make_watcher(frames, recorder()))
+    start = w.clock.now()
+    slow = w.poll_once
+
+    def poll_once():
+        w.clock.sleep(42)  # 1回分の処理に時間がかかっても次の回の時刻はずれない
+        return slow()
+    w.poll_once = poll_once
+    assert w.run(4) == 4
+    assert w.clock.now() == start + pd.Timedelta(seconds=3 * w.poll + 42)
+
+
+@pytest.mark.parametrize("utc, expected", [
+    ("2026-10-16 00:30", True),   # 東京 09:30
+    ("2026-10-16 06:50", True),   # 東京 15:50 (引け後の猶予)
+    ("2026-10-16 10:00", False),  # 東京 19:00
+    ("2026-10-17 01:00", False),  # 土曜
+])
+def test_market_open_uses_tokyo_time(utc, expected):
+    assert market_open(pd.Timestamp(utc, tz="UTC")) is expected
+
+
+def test_system_clock_is_tokyo_time():
+    now = daemon.SystemClock().now()
+    assert now.tzinfo is None
+    tokyo = pd.Timestamp.now(tz=daemon.MARKET_TZ).tz_localize(None)
+    assert abs((tokyo - now).total_seconds()) < 60
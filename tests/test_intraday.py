@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from intraday import ChunkedBacktest, IntradayStore, backtest, rechunk, synthetic_chunks
+from streaming import IndicatorSet
+
+DAYS = 60
+
+
+def bars(days=DAYS, seed=0):
+    return pd.concat(synthetic_chunks(days, "5m", seed))
+
+
+def month_boundary_bars(seed=0):
+    """9月末から10月初めにまたがる分足 (月ごとのファイルが2つになる)"""
+    df = pd.concat(synthetic_chunks(12, "5m", seed))
+    days = df.index.normalize()
+    moved = dict(zip(days.unique(), pd.bdate_range("2026-09-24", periods=12)))
+    df.index = pd.DatetimeIndex(days.map(moved) + (df.index - days), name='Date')
+    return df
+
+
+def assert_same_stats(actual, expected, rtol=1e-6):
+    for name, stats in actual.items():
+        for key, value in stats.items():
+            e, a = expected[name][key], value
+            if isinstance(e, pd.Timestamp) or isinstance(a, pd.Timestamp):
+                assert e == a, (name, key)
+                continue
+            e, a = float(e), float(a)
+            assert (np.isnan(e) and np.isnan(a)) or np.isclose(e, a, rtol=rtol, atol=1e-9), (name, key, e, a)
+
+
+def feed(frames, rows):
+    engine = ChunkedBacktest()
+    for chunk in rechunk(frames, rows):
+        engine.feed(chunk)
+    return engine
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IntradayStore("5m", root=str(tmp_path))
+
+
+# ==========================================
+# チャンク単位のバックテスト
+# ==========================================
+@pytest.mark.parametrize("rows", [1, 997, 5000])
+def test_chunked_matches_vector_backtest(rows):
+    pytest.importorskip("pandas_ta")
+    import vector_backtest
+    full = bars()
+    engine = feed([full], rows)
+    assert engine.bars == len(full)
+    assert_same_stats(engine.stats(), {name: vector_backtest.run(full, name) for name in engine.stats()})
+
+
+@pytest.mark.parametrize("rows", [1, 997, 5000])
+def test_chunked_indicators_match_per_bar(rows):
+    close = bars()['Close'].to_numpy()
+    per_bar = IndicatorSet()
+    expected = pd.DataFrame([per_bar.update(x) for x in close])
+    chunked = IndicatorSet()
+    actual = pd.concat([pd.DataFrame(chunked.update_many(close[i:i + rows])) for i in range(0, len(close), rows)],
+                       ignore_index=True)
+    pd.testing.assert_frame_equal(actual[expected.columns], expected, rtol=1e-9, atol=1e-6)
+    assert chunked.row == pytest.approx(per_bar.row, nan_ok=True)
+
+
+# ==========================================
+# 月ごとのファイル
+# ==========================================
+def test_month_boundary_splits_files_and_backtests_the_same(store):
+    df = month_boundary_bars()
+    store.write("7203", df)
+    names = [os.path.basename(p) for p in store.partitions("7203")]
+    assert names == ["2026-09.parquet", "2026-10.parquet"]
+
+    chunks = list(store.chunks("7203"))
+    assert [c.index[0].month for c in chunks] == [9, 10]
+    pd.testing.assert_frame_equal(pd.concat(chunks), df, check_freq=False)
+    # 10月の途中から: 9月のファイルは読まない
+    start = df.index[df.index.month == 10][5]
+    assert next(store.chunks("7203", start)).index[0] == start
+
+    # 月の切れ目でチャンクが分かれても、続けて流した結果と同じ
+    whole = feed([df], len(df))
+    monthly = ChunkedBacktest()
+    for chunk in store.chunks("7203"):
+        monthly.feed(chunk)
+    assert_same_stats(monthly.stats(), whole.stats())
+    for rows in (1, 997, len(df)):
+        assert_same_stats(backtest(store, "7203", rows=rows).stats(), whole.stats())
+
+
+def test_refetch_rewrites_only_one_month(store):
+    df = month_boundary_bars()
+    store.write("7203", df)
+    september, october = store.partitions("7203")
+    with open(september, 'rb') as f:
+        before = f.read()
+
+    # 10月の最後の日を取り直す (途中だった足が確定値に変わり、新しい足が増える)
+    last_day = df.index[-1].normalize()
+    refetched = df[df.index >= last_day].copy()
+    refetched['Close'] *= 1.01
+    extra = refetched.iloc[-1:].copy()
+    extra.index = extra.index + pd.Timedelta(minutes=5)
+    refetched = pd.concat([refetched, extra])
+    calls = []
+
+    def fetcher(yf_ticker, start=None, period=None, interval=None):
+        calls.append(start)
+        return refetched
+    store.fetcher = fetcher
+    store.fetch_start = lambda ticker, now=None: last_day
+    assert store.update("7203") == len(refetched)
+    assert calls == [last_day]
+
+    with open(september, 'rb') as f:
+        assert f.read() == before
+    saved = pd.read_parquet(october)
+    assert not saved.index.duplicated().any()
+    assert saved.index[-1] == extra.index[0]
+    expected = pd.concat([df[df.index < last_day], refetched])
+    pd.testing.assert_frame_equal(store.load("7203"), expected, check_freq=False)
+    assert_same_stats(backtest(store, "7203", rows=997).stats(), feed([expected], len(expected)).stats())
@@ -0,0 +1,132 @@
+import os
+
+import pandas as pd
+import pytest
+
+import jpx_listing
+from jpx_listing import SearchIndex, load_listing, normalize, save_listing
+
+LISTING = pd.DataFrame([
+    ("7203", "トヨタ自動車", "プライム（内国株式）"),
+    ("7201", "日産自動車", "プライム（内国株式）"),
+    ("7267", "本田技研工業", "プライム（内国株式）"),
+    ("72030", "トヨタ自動車ETF", "ETF・ETN"),
+    ("130A", "Ｖｅｒｉｔａｓ　Ｉｎ　Ｓｉｌｉｃｏ", "グロース（内国株式）"),
+    ("9984", "ソフトバンクグループ", "プライム（内国株式）"),
+    ("9434", "ソフトバンク", "プライム（内国株式）"),
+    ("1605", "ＩＮＰＥＸ", "プライム（内国株式）"),
+], columns=['コード', '銘柄名', '市場・商品区分'])
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(LISTING)
+
+
+# ==========================================
+# 正規化
+# ==========================================
+@pytest.mark.parametrize("text, expected", [
+    ("ＩＮＰＥＸ", "inpex"),                   # 全角英字 → 半角・小文字
+    ("１３０Ａ", "130a"),                      # 全角数字
+    ("ｿﾌﾄﾊﾞﾝｸ", "そふとばんく"),               # 半角カナ (濁点付き) → ひらがな
+    ("トヨタ", "とよた"),
+    ("Ｖｅｒｉｔａｓ　Ｉｎ", "veritasin"),     # 全角スペースは除く
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+# ==========================================
+# 検索
+# ==========================================
+def test_hiragana_finds_katakana_names(index):
+    assert index.search("とよた") == ["7203: トヨタ自動車", "72030: トヨタ自動車ETF"]
+    assert index.search("ﾄﾖﾀ") == index.search("トヨタ") == index.search("とよた")
+
+
+def test_code_prefix_ranks_exact_match_first(index):
+    assert index.search("7203") == ["7203: トヨタ自動車", "72030: トヨタ自動車ETF"]
+    assert index.search("72") == ["7201: 日産自動車", "7203: トヨタ自動車", "72030: トヨタ自動車ETF",
+                                  "7267: 本田技研工業"]
+    assert index.search("１３０ａ") == ["130A: Ｖｅｒｉｔａｓ　Ｉｎ　Ｓｉｌｉｃｏ"]
+    assert index.search("8") == []
+
+
+def test_code_prefix_matches_a_full_scan():
+    codes = [f"{i:04d}" for i in range(1300, 9999, 7)] + ["130A", "131a", "285A"]
+    index = SearchIndex(pd.DataFrame({'コード': codes, '銘柄名': ["銘柄"] * len(codes), '市場・商品区分': ""}))
+    for q in ("1", "13", "130", "130a", "28", "9", "99", "a", "0"):
+        expected = sorted((0 if c.lower() == q else 1, c) for c in codes if c.lower().startswith(q))
+        assert index.search(q, limit=len(codes)) == [f"{c}: 銘柄" for _, c in expected]
+
+
+def test_name_candidates_use_ngrams(index):
+    # 1文字は1-gram、2文字以上は2-gramの積集合から候補を出す
+    assert sorted(index._name_candidates(normalize("車"))) == [0, 1, 3]
+    assert sorted(index._name_candidates(normalize("自動車"))) == [0, 1, 3]
+    assert index._name_candidates(normalize("動自")) == []
+    # 名前の前方一致が部分一致より先、同順位は短い名前が先
+    assert index.search("ソフトバンク") == ["9434: ソフトバンク", "9984: ソフトバンクグループ"]
+    assert index.search("バンク") == ["9434: ソフトバンク", "9984: ソフトバンクグループ"]
+    assert index.search("inpex") == ["1605: ＩＮＰＥＸ"]
+
+
+def test_limit(index):
+    assert len(index.search("自動車", limit=2)) == 2
+    assert index.search("") == []
+
+
+# ==========================================
+# 保存・期限・取得失敗時
+# ==========================================
+class Fetcher:
+    def __init__(self, listing=LISTING, fail=False):
+        self.listing = listing
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise OSError("offline")
+        return self.listing
+
+
+def test_fresh_cache_is_used_without_fetching(tmp_path):
+    path = str(tmp_path / "listing.parquet")
+    save_listing(LISTING, path)
+    fetcher = Fetcher(fail=True)
+    listing = load_listing(path, ttl=3600, fetcher=fetcher, now=os.path.getmtime(path) + 10)
+    assert fetcher.calls == 0
+    assert listing['コード'].tolist() == LISTING['コード'].tolist()
+
+
+def test_expired_cache_is_refetched_and_saved(tmp_path):
+    path = str(tmp_path / "listing.parquet")
+    save_listing(LISTING.iloc[:2], path)
+    fetcher = Fetcher()
+    listing = load_listing(path, ttl=3600, fetcher=fetcher, now=os.path.getmtime(path) + 7200)
+    assert fetcher.calls == 1
+    assert len(listing) == len(LISTING)
+    assert len(pd.read_parquet(path)) == len(LISTING)
+
+
+def test_stale_cache_is_used_when_fetch_fails(tmp_path):
+    path = str(tmp_path / "listing.parquet")
+    save_listing(LISTING.iloc[:2], path)
+    fetcher = Fetcher(fail=True)
+    listing = load_listing(path, ttl=3600, fetcher=fetcher, now=os.path.getmtime(path) + 7200)
+    assert fetcher.calls == 1
+    assert listing['コード'].tolist() == ["7203", "7201"]
+
+
+def test_default_listing_when_nothing_is_available(tmp_path):
+    listing = load_listing(str(tmp_path / "missing.parquet"), fetcher=Fetcher(fail=True))
+    assert listing['コード'].tolist() == [c for c, _ in jpx_listing.DEFAULT_LISTING]
+    assert jpx_listing.stock_codes(listing) == listing['コード'].tolist()
+
+
+def test_stock_codes_drop_etfs():
+    assert "72030" not in jpx_listing.stock_codes(LISTING)
+    assert "7203" in jpx_listing.stock_codes(LISTING)
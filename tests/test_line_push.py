@@ -0,0 +1,188 @@
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import line_push
+from line_push import LinePusher, SentLog, MAX_TEXT, MAX_MESSAGES, pack, retry_after, signal_key, text_length
+
+
+NOW = datetime(2026, 10, 16, 0, 0, 0, tzinfo=timezone.utc)
+
+
+# ==========================================
+# 偽の LINE サーバー
+# ==========================================
+class StubLine(BaseHTTPRequestHandler):
+    """
+    受け取ったリクエストを server.received に残し、server.failures の応答を先に順番に返す
+    "lost" は受け付けたのに応答だけ失われた場合 (受け付けてから 503 を返す)
+    """
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        key = self.headers.get('X-Line-Retry-Key')
+        with self.server.lock:
+            status = self.server.failures.pop(0) if self.server.failures else 200
+            if status in (200, "lost") and key in self.server.accepted:
+                status = 409
+            if status in (200, "lost"):
+                self.server.accepted.add(key)
+                self.server.received.append(body)
+            status = 503 if status == "lost" else status
+        self.send_response(status)
+        self.send_header('X-Line-Request-Id', str(uuid.uuid4()))
+        if status == 429:
+            self.send_header('Retry-After', self.server.retry_after)
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLine)
+    server.lock = threading.Lock()
+    server.failures, server.received, server.accepted = [], [], set()
+    server.retry_after = "0"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def pusher(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/v2/bot/message/push"
+    waits = []
+    p = LinePusher("token", "user", url=url, sleep=waits.append, backoff=0,
+                   sent_log=SentLog(path="", today=lambda: "2026-01-05"))
+    p.waits = waits
+    return p
+
+
+def report_blocks(n=120):
+    return [(signal_key(str(1000 + i), "買い 🚀"), f"🚀 【銘柄{i}】 ({1000 + i})\n" + "根拠 " * 40 + "\n" + "-" * 10)
+            for i in range(n)]
+
+
+def texts_of(server):
+    return [m["text"] for body in server.received for m in body["messages"]]
+
+
+# ==========================================
+# 分割・再送・重複除外
+# ==========================================
+def test_packs_every_block_within_limits(server, pusher):
+    blocks = report_blocks()
+    assert pusher.send(blocks, header="📊 レポート")
+    texts = texts_of(server)
+    assert all(text_length(t) <= MAX_TEXT for t in texts)
+    assert all(len(b["messages"]) <= MAX_MESSAGES for b in server.received)
+    assert texts[0].startswith("📊")
+    joined = "\n".join(texts)
+    assert all(b in joined for _, b in blocks)  # 切り捨てない
+
+
+def test_oversized_block_is_split_by_lines():
+    block = "\n".join(f"{i:04d} " + "あ" * 50 for i in range(300))
+    texts = [t for t, _ in pack([(None, block)])]
+    assert len(texts) > 1 and all(text_length(t) <= MAX_TEXT for t in texts)
+    assert "\n".join(texts) == block
+
+
+def test_retries_server_errors_with_the_same_retry_key(server, pusher):
+    server.failures = [500, 429]
+    assert pusher.send("通知")
+    assert pusher.deliveries[0]["attempts"] == 3
+    assert len(server.received) == 1
+
+
+def test_http_date_retry_after_does_not_crash(server, pusher):
+    server.failures = [429]
+    server.retry_after = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert pusher.send("通知")
+    assert pusher.waits == [0.0]
+
+
+def test_gives_up_on_client_errors(server, pusher):
+    server.failures = [400]
+    assert not pusher.send("通知")
+    assert pusher.deliveries[0]["attempts"] == 1 and pusher.deliveries[0]["status"] == 400
+
+
+def test_skips_keys_already_sent_today(server, pusher):
+    blocks = report_blocks(5)
+    pusher.send(blocks)
+    n = len(server.received)
+    pusher.send(blocks + ["ステイの銘柄"])
+    assert len(server.received) == n + 1
+    assert texts_of(server)[-1] == "ステイの銘柄"
+
+
+def test_lost_response_is_not_delivered_twice(server, pusher):
+    server.failures = ["lost"]  # 受け付け済みで応答だけ失われた → 再送は 409 になる
+    assert pusher.send("応答が失われる通知")
+    assert len(server.received) == 1
+
+
+def test_sent_log_persists_for_the_day(tmp_path):
+    path = str(tmp_path / "sent.json")
+    SentLog(path=path, today=lambda: "2026-01-05").add(["7203:買い 🚀"])
+    assert SentLog(path=path, today=lambda: "2026-01-05").seen("7203:買い 🚀")
+    assert not SentLog(path=path, today=lambda: "2026-01-06").seen("7203:買い 🚀")
+
+
+def test_sent_log_keeps_keys_written_by_another_process(tmp_path):
+    path = str(tmp_path / "sent.json")
+    daemon, cron = SentLog(path=path, today=lambda: "2026-01-05"), SentLog(path=path, today=lambda: "2026-01-05")
+    assert not daemon.seen("7203:買い 🚀") and not cron.seen("9984:売り 🔻")
+    daemon.add(["7203:買い 🚀"])
+    cron.add(["9984:売り 🔻"])
+    with open(path, encoding='utf-8') as f:
+        assert set(json.load(f)["keys"]) == {"7203:買い 🚀", "9984:売り 🔻"}
+    # 相手が書いたキーも、ファイルが変わったのを見て読み直す
+    assert daemon.seen("9984:売り 🔻")
+
+
+def add_keys(path, prefix, n):
+    log = SentLog(path=path, today=lambda: "2026-01-05")
+    for i in range(n):
+        log.add([f"{prefix}{i}"])
+
+
+def test_concurrent_writers_do_not_drop_keys(tmp_path):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("fork が使えない環境")
+    path = str(tmp_path / "sent.json")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=add_keys, args=(path, f"{p}:", 40)) for p in range(4)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(30)
+        assert proc.exitcode == 0
+    with open(path, encoding='utf-8') as f:
+        assert len(json.load(f)["keys"]) == 4 * 40
+    # 一時ファイルはプロセスごとに別の名前で、書き終わったら残らない
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+# ==========================================
+# Retry-After の読み取り
+# ==========================================
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert retry_after("3", 1.0) == 3.0
+    assert retry_after("Fri, 16 Oct 2026 00:00:05 GMT", 1.0, now=NOW) == 5.0
+    assert retry_after("Thu, 15 Oct 2026 23:59:00 GMT", 1.0, now=NOW) == 0.0  # 過去の日時は待たない
+
+
+def test_retry_after_falls_back_to_backoff():
+    for value in (None, "", "soon", "nan", "Fri, 99 Foo 2026"):
+        assert retry_after(value, 2.0, now=NOW) == 2.0
+    assert retry_after("86400", 2.0) == line_push.MAX_RETRY_WAIT
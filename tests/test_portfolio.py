@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfolio
+import strategies
+from vector_backtest import synthetic_ohlcv
+
+
+def market(tickers=12, n=400):
+    # 上場の新しい銘柄・途中で取引の無い日がある銘柄も混ぜる
+    frames = {}
+    for i in range(tickers):
+        df = synthetic_ohlcv(n=n, seed=i).iloc[(i % 3) * 50:]
+        if i % 4 == 1:
+            df = df.drop(df.index[100:105])
+        frames[str(1000 + i)] = df
+    return frames
+
+
+def one_day(open_, entry=(), exit_=(), units=None):
+    """1日目のシグナルを2日目の始値で約定させるだけの配列"""
+    open_ = np.array(open_, dtype=float)
+    m = open_.shape[1]
+    e, x = np.zeros((len(open_), m), dtype=bool), np.zeros((len(open_), m), dtype=bool)
+    for t, i in entry:
+        e[t, i] = True
+    for t, i in exit_:
+        x[t, i] = True
+    return open_, open_.copy(), e, x
+
+
+# ==========================================
+# 共通の現金
+# ==========================================
+@pytest.mark.parametrize("strategy", strategies.NAMES)
+def test_cash_never_goes_negative(strategy):
+    frames = market()
+    # 配分比率の合計が1を超えるので、現金が足りない日がある
+    stats = portfolio.run(frames, strategy, weights={t: 0.3 for t in frames})
+    cash = stats['_equity_curve']['Cash']
+    assert cash.min() >= 0
+    assert stats['# Trades'] > 0
+
+
+def test_proportional_allocation_when_cash_is_short():
+    open_, close, entry, exit_ = one_day([[10, 10], [10, 10], [10, 10]], entry=[(0, 0), (0, 1)])
+    weights = np.array([0.9, 0.6])
+    cash, units, book = portfolio.simulate(open_, close, entry, exit_, np.array([True, True]), weights,
+                                           cash=1000, commission=0)
+    # 欲しい額 900 : 600 を、現金 1000 に収まるよう 600 : 400 に縮める
+    assert units[1].tolist() == [59, 39]
+    assert cash[1] == pytest.approx(20)
+    assert cash.min() >= 0
+
+
+def test_sells_fill_before_buys_on_the_same_day():
+    # 0日目に A を全額で買い、2日目に A の売りと B の買いが同時に出る
+    open_, close, entry, exit_ = one_day([[10, 10]] * 5, entry=[(0, 0), (2, 1)], exit_=[(2, 0)])
+    cash, units, book = portfolio.simulate(open_, close, entry, exit_, np.array([False, False]),
+                                           np.array([1.0, 1.0]), cash=1000, commission=0)
+    assert units[1].tolist() == [99, 0]
+    # A を売った現金で B が買える
+    assert units[3].tolist() == [0, 99]
+    assert book["trades"].tolist() == [1, 0]
+    assert cash.min() >= 0
+
+
+# ==========================================
+# 集計
+# ==========================================
+def test_contribution_sums_to_total_pnl():
+    frames = market()
+    stats = portfolio.run(frames, {t: strategies.NAMES[i % 4] for i, t in enumerate(frames)})
+    c = stats['_contribution']
+    assert c["損益"].sum() == pytest.approx(stats['Equity Final [$]'] - 1000000, abs=1e-3)
+    assert c["寄与度"].sum() == pytest.approx(stats['Return [%]'], abs=1e-6)
+    assert c["取引回数"].sum() == stats['# Trades']
+
+
+@pytest.mark.parametrize("strategy", strategies.NAMES)
+def test_one_ticker_at_full_weight_matches_vector_backtest(strategy):
+    pytest.importorskip("pandas_ta")
+    import vector_backtest
+    df = synthetic_ohlcv(n=500, seed=0)
+    stats = portfolio.run({"1000": df}, strategy, weights={"1000": 1.0})
+    expected = vector_backtest.run(df, strategy)
+    keys = ['Equity Final [$]', 'Equity Peak [$]', 'Return [%]', 'Max. Drawdown [%]', 'Commissions [$]']
+    # vector_backtest の保有期間は決済済みの取引だけから数えるので、最後まで持っている時は比べない
+    if not stats['_contribution']['保有株数'].any():
+        keys.append('Exposure Time [%]')
+    for key in keys:
+        assert stats[key] == pytest.approx(expected.get(key, 0.0), rel=1e-9, abs=1e-9), key
+    assert stats['# Trades'] == expected['# Trades']
+    assert stats['Win Rate [%]'] == pytest.approx(expected['Win Rate [%]'], nan_ok=True)
+    np.testing.assert_allclose(stats['_equity_curve']['Equity'].to_numpy(),
+                               expected['_equity_curve']['Equity'].to_numpy(), rtol=1e-9)
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from price_store import PriceStore, TokenBucket, previous_close
+from offline import FrameFetcher
+from vector_backtest import synthetic_ohlcv
+
+
+def store_for(tmp_path, frames):
+    fetcher = FrameFetcher(frames)
+    store = PriceStore(root=str(tmp_path), fetcher=fetcher, batch_fetcher=fetcher.batch, min_interval=0,
+                       limiter=TokenBucket(rate=1e9, burst=1e9))
+    return store, fetcher
+
+
+def test_second_refresh_only_fetches_the_tail(tmp_path):
+    full = synthetic_ohlcv(n=300, seed=0)
+    store, fetcher = store_for(tmp_path, {"7203": full.iloc[:-5]})
+    store.refresh("7203")
+    assert fetcher.calls[-1][1] is None  # 初回は期間指定で全部
+
+    fetcher.frames["7203.T"] = full
+    df = store.refresh("7203")
+    start = fetcher.calls[-1][1]
+    assert start is not None and pd.Timestamp(start) >= full.index[-7]
+    pd.testing.assert_frame_equal(df, store.load("7203"))
+    assert df.index[-1] == full.index[-1] and len(df) == len(full[full.index >= df.index[0]])
+
+
+def test_get_many_uses_batch_fetcher(tmp_path):
+    frames = {c: synthetic_ohlcv(n=200, seed=i) for i, c in enumerate(["7203", "9984", "8306"])}
+    store, fetcher = store_for(tmp_path, frames)
+    got = store.get_many(list(frames) + ["0000"], period="2y")
+    assert set(got) == set(frames)
+    assert any(isinstance(call[0], tuple) for call in fetcher.calls)
+
+
+def test_previous_close_uses_the_previous_session_for_intraday_bars():
+    index = pd.to_datetime(["2026-10-14 15:25", "2026-10-15 09:00", "2026-10-15 09:05"])
+    df = pd.DataFrame({"Close": [100.0, 103.0, 105.0]}, index=index)
+    assert previous_close(df) == (100.0, "前日比")
+    assert previous_close(df.iloc[1:]) == (103.0, "前の足比")  # 前の取引日が無い時だけ1本前
+
+
+def test_previous_close_for_daily_bars():
+    df = synthetic_ohlcv(n=10)
+    assert previous_close(df) == (float(df['Close'].iloc[-2]), "前日比")
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import screener
+from price_store import compact_frame
+from streaming import OnlineEMA, OnlineMACD, OnlineRMA, OnlineRSI, OnlineSMA, OnlineStd
+from vector_backtest import synthetic_ohlcv
+
+TOL = 1e-6  # 株価の単位
+
+
+def frames(tickers=30, n=400):
+    # 上場の新しい銘柄 (先頭がNaN) も混ぜる
+    return {str(1000 + i): synthetic_ohlcv(n=n, seed=i).iloc[(i % 5) * 40:] for i in range(tickers)}
+
+
+def per_series(x, compute):
+    """銘柄ごとに、値のある足だけを1銘柄用の指標 compute(配列) で計算して (日付 × 銘柄) に並べ直す"""
+    out = np.full(x.shape, np.nan)
+    for j in range(x.shape[1]):
+        valid = ~np.isnan(x[:, j])
+        out[valid, j] = compute(x[valid, j])
+    return out
+
+
+def assert_close(actual, expected, tol=TOL):
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    ok = ~np.isnan(expected)
+    assert np.abs(actual[ok] - expected[ok]).max(initial=0) <= tol
+
+
+# ==========================================
+# パネルの指標と1銘柄ずつの指標
+# ==========================================
+@pytest.mark.parametrize("panel, online", [
+    (lambda x: screener.panel_sma(x, 25), lambda: OnlineSMA(25)),
+    (lambda x: screener.panel_std(x, 20), lambda: OnlineStd(20)),
+    (lambda x: screener.panel_ema(x, 12), lambda: OnlineEMA(12)),
+    (lambda x: screener.panel_rma(x, 14), lambda: OnlineRMA(14)),
+    (lambda x: screener.panel_rsi(x, 14), lambda: OnlineRSI(14)),
+], ids=["sma", "std", "ema", "rma", "rsi"])
+def test_panel_indicator_matches_per_series(panel, online):
+    x = screener.build_panel(frames()).to_numpy()
+    assert_close(panel(x), per_series(x, lambda values: online().update_many(values)))
+
+
+@pytest.mark.parametrize("output", [0, 1, 2])
+def test_panel_macd_matches_per_series(output):
+    x = screener.build_panel(frames()).to_numpy()
+    expected = per_series(x, lambda values: OnlineMACD().update_many(values)[output])
+    assert_close(screener.panel_macd(x)[output], expected)
+
+
+def test_panel_indicators_match_pandas_ta():
+    pytest.importorskip("pandas_ta")
+    import pandas_ta as ta
+    x = screener.build_panel(frames()).to_numpy()
+    for j in range(x.shape[1]):
+        valid = ~np.isnan(x[:, j])
+        close = pd.Series(x[valid, j])
+        assert_close(screener.panel_sma(x, 25)[valid, j], ta.sma(close, length=25).to_numpy())
+        assert_close(screener.panel_rsi(x, 14)[valid, j], ta.rsi(close, length=14).to_numpy())
+        expected = ta.macd(close, fast=12, slow=26, signal=9).to_numpy()
+        for output, actual in enumerate(screener.panel_macd(x)):
+            assert_close(actual[valid, j], expected[:, output])
+
+
+# ==========================================
+# float32 で読み込んだ株価での判定
+# ==========================================
+def test_float32_and_float64_screens_give_identical_signals():
+    exact = frames(tickers=60)
+    compact = {t: compact_frame(df, ['Close'], 'float32') for t, df in exact.items()}
+    a, b = screener.build_panel(exact), screener.build_panel(compact)
+    fired = 0
+    for end in range(len(a) - 20, len(a) + 1):
+        full, light = screener.screen_panel(a.iloc[:end]), screener.screen_panel(b.iloc[:end])
+        assert screener.signal_mismatches(full, light).empty, end
+        fired += len(screener.firing(full))
+    assert fired > 0
@@ -0,0 +1,95 @@
+import threading
+
+from sheet_repo import SheetRepository, add_op, delete_op, to_records
+from offline import FakeSpreadsheet
+
+
+def spreadsheet():
+    return FakeSpreadsheet({
+        "Holdings": [["Ticker", "Name"], ["7203", "トヨタ"], ["9984", "ソフトバンクG"]],
+        "Watchlist": [["Ticker", "Name"], ["8306", "三菱UFJ"]],
+    })
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_reads_both_sheets_in_one_call_and_caches_until_ttl():
+    fake, clock = spreadsheet(), Clock()
+    repo = SheetRepository(fake, ttl=60, clock=clock)
+    assert repo.tickers("Holdings") == {"7203": "トヨタ", "9984": "ソフトバンクG"}
+    assert repo.tickers("Watchlist") == {"8306": "三菱UFJ"}
+    assert fake.calls == [("get", ("'Holdings'", "'Watchlist'"))]
+
+    clock.now = 61
+    repo.records("Holdings")
+    assert len(fake.calls) == 2
+
+
+def test_flush_batches_queued_edits_into_one_read_and_one_write():
+    fake = spreadsheet()
+    repo = SheetRepository(fake)
+    repo.tickers("Holdings")
+    repo.add("Holdings", " 6758 ", "ソニーG")
+    repo.delete("Holdings", "7203")
+    repo.add("Watchlist", "7203", "トヨタ")
+    repo.add("Holdings", "9984", "重複")  # 既にある銘柄は足さない
+    assert len(fake.calls) == 1  # 積むだけでは書かない
+
+    assert repo.flush() == 4
+    assert [kind for kind, _ in fake.calls[1:]] == ["get", "update"]
+    assert repo.pending == []
+    assert repo.tickers("Holdings") == {"9984": "ソフトバンクG", "6758": "ソニーG"}
+    assert repo.tickers("Watchlist") == {"8306": "三菱UFJ", "7203": "トヨタ"}
+
+
+def test_delete_clears_trailing_rows():
+    fake = spreadsheet()
+    repo = SheetRepository(fake)
+    repo.flush([delete_op("Holdings", "7203"), delete_op("Holdings", "9984")])
+    assert fake.tables["Holdings"] == [["Ticker", "Name"]]
+    assert repo.records("Holdings") == []
+
+
+def test_flush_of_session_queue_leaves_repository_queue_alone():
+    fake = spreadsheet()
+    repo = SheetRepository(fake)
+    repo.add("Holdings", "1111", "他の処理")
+    assert repo.flush([add_op("Watchlist", "6758", "ソニーG")]) == 1
+    assert repo.pending == [add_op("Holdings", "1111", "他の処理")]
+    assert "6758" in repo.tickers("Watchlist")
+
+
+def test_flush_keeps_queue_when_write_fails():
+    class Failing(FakeSpreadsheet):
+        def values_batch_update(self, body):
+            raise RuntimeError("quota")
+
+    repo = SheetRepository(Failing({"Holdings": [["Ticker", "Name"]]}))
+    repo.add("Holdings", "7203", "トヨタ")
+    try:
+        repo.flush()
+    except RuntimeError:
+        pass
+    assert repo.pending == [add_op("Holdings", "7203", "トヨタ")]
+
+
+def test_concurrent_sessions_do_not_lose_edits():
+    fake = spreadsheet()
+    repo = SheetRepository(fake)
+    codes = [str(1000 + i) for i in range(40)]
+    threads = [threading.Thread(target=repo.flush, args=([add_op("Watchlist", c, c)],)) for c in codes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert set(codes) <= set(repo.tickers("Watchlist"))
+
+
+def test_to_records_skips_blank_tickers():
+    assert to_records([["Ticker", "Name"], ["", "空"], ["7203"]]) == [{"Ticker": "7203", "Name": ""}]
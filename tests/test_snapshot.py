@@ -0,0 +1,38 @@
+import pandas as pd
+
+import snapshot
+import strategies
+
+
+def signal_df(close=1234.0):
+    index = pd.to_datetime(["2026-10-14", "2026-10-15"])
+    return pd.DataFrame({col: [1.0, 2.0] for col in snapshot.SIGNAL_COLUMNS} | {"Close": [1200.0, close]},
+                        index=index)
+
+
+def stats(win_rate):
+    return {'Win Rate [%]': win_rate, 'Return [%]': 5.0, 'Equity Final [$]': 1050000.0, 'Profit Factor': 1.2,
+            '# Trades': 4, 'Max. Drawdown [%]': -8.0, 'Sharpe Ratio': 0.5, 'Buy & Hold Return [%]': 3.0}
+
+
+def write(path, stats_start):
+    rows = snapshot.diagnosis_rows({name: stats(40.0 + i) for i, name in enumerate(strategies.NAMES)},
+                                   {name: (strategies.STAY, "シグナルなし") for name in strategies.NAMES}, 1000000)
+    records = snapshot.ticker_records("7203", signal_df(), rows, 1000000, stats_start=stats_start)
+    snapshot.write_snapshot(records, path)
+
+
+def test_fresh_table_reports_the_span_the_stats_cover(tmp_path):
+    path = str(tmp_path / "snapshot.parquet")
+    write(path, pd.Timestamp("2024-09-02"))
+    table = snapshot.fresh_table("7203", "2026-10-15", 1234.0, 1000000, path=path)
+    assert list(table["戦略名"]) == strategies.NAMES[::-1]  # 勝率順
+    assert table.attrs["stats_start"] == "2024-09-02"
+
+
+def test_stale_snapshot_is_not_used(tmp_path):
+    path = str(tmp_path / "snapshot.parquet")
+    write(path, None)
+    assert snapshot.fresh_table("7203", "2026-10-16", 1234.0, 1000000, path=path) is None
+    assert snapshot.fresh_table("7203", "2026-10-15", 1300.0, 1000000, path=path) is None
+    assert snapshot.fresh_table("9984", "2026-10-15", 1234.0, 1000000, path=path) is None
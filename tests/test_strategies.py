@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import screener
+import strategies
+from strategies import BUY, SELL, STAY, rule
+from streaming import IndicatorSet
+from vector_backtest import synthetic_ohlcv
+
+
+def rule_frame(r, close):
+    """ルールが使う指標だけを streaming で計算した、pandas_ta の列名の表"""
+    specs = []
+    for kind, params, _ in r["indicators"].values():
+        if (kind, params) not in specs:
+            specs.append((kind, params))
+    return pd.DataFrame(IndicatorSet(specs).update_many(close))
+
+
+def signal_bars(r, close):
+    entry, exit_ = strategies.signals(r, strategies.frame_columns(r, rule_frame(r, close)))
+    return np.flatnonzero(entry).tolist(), np.flatnonzero(exit_).tolist()
+
+
+# ==========================================
+# 手で作った株価で、買い・売りの足を固定する
+# ==========================================
+@pytest.mark.parametrize("r, close, entry, exit_", [
+    # SMA2 が SMA3 を上抜け (4本目) / 下抜け (7本目)
+    (rule("SMAクロス", n1=2, n2=3), [12, 11, 10, 10, 16, 16, 17, 4, 4, 4], [4], [7]),
+    # 下げ続けて RSI 0 → 反発の足で30を上抜け / 上げ続けて RSI 98 → 反落の足で70を下抜け
+    (rule("RSI逆張り", length=2), [10, 9, 8, 7, 6, 7, 8, 9, 10, 11, 12, 11, 10], [5], [11]),
+    # 加速して下げた後の最初の上げの足 / 上げた後の最初の下げの足
+    (rule("MACD", fast=2, slow=4, signal=2), [30, 29, 27, 24, 20, 15, 16, 18, 21, 25, 30, 29, 27, 24, 20], [6], [11]),
+    # 3本の ±1σ のバンドを下に外れた足 / 上に外れた足
+    (rule("ボリンジャー", length=3, std=1.0), [10, 10, 10, 10, 7, 10, 10, 10, 13, 10], [4], [8]),
+])
+def test_rule_entry_and_exit_bars(r, close, entry, exit_):
+    assert signal_bars(r, close) == (entry, exit_)
+
+
+def test_rsi_is_a_crossover_not_a_level():
+    r = rule("RSI逆張り", length=2)
+    close = [10, 9, 8, 7, 6, 7, 8, 9, 10, 11, 12, 11, 10]
+    rsi = rule_frame(r, close)["RSI_2"].to_numpy()
+    # 30未満・70超えの足は何本もあるが、シグナルは抜けた足だけ
+    assert np.flatnonzero(rsi < 30).tolist() == [2, 3, 4, 12]
+    assert np.flatnonzero(rsi > 70).tolist() == [6, 7, 8, 9, 10]
+    assert signal_bars(r, close) == ([5], [11])
+
+
+def test_macd_compares_with_the_signal_line_not_the_histogram():
+    r = rule("MACD", fast=2, slow=4, signal=2)
+    close = [30, 29, 27, 24, 20, 15, 16, 18, 21, 25, 30, 29, 27, 24, 20]
+    frame = rule_frame(r, close)
+    cols = strategies.frame_columns(r, frame)
+    np.testing.assert_array_equal(cols["signal"], frame["MACDs_2_4_2"])
+    # ヒストグラムと比べていたら9本目で買いになる
+    histogram = {"macd": cols["macd"], "signal": frame["MACDh_2_4_2"].to_numpy()}
+    assert np.flatnonzero(strategies.condition(r["entry"], histogram)).tolist() == [9]
+    assert signal_bars(r, close)[0] == [6]
+
+
+def test_buy_wins_when_both_fire():
+    r = {**rule("SMAクロス"), "entry": ("above", "close", 0), "exit": ("above", "close", 0)}
+    assert strategies.current_signal(r, {"close": np.array([1.0, 2.0])})[0] == BUY
+
+
+# ==========================================
+# 全銘柄まとめての判定 (screener) と1銘柄ずつの判定
+# ==========================================
+def sample_panel(tickers=40, n=400):
+    # 上場の新しい銘柄 (先頭がNaN) も混ぜる
+    frames = {}
+    for i in range(tickers):
+        df = synthetic_ohlcv(n=n, seed=i)
+        frames[str(1000 + i)] = df.iloc[(i % 4) * 60:]
+    return screener.build_panel(frames)
+
+
+def streaming_tail(close):
+    ind = IndicatorSet()
+    ind.update_many(close)
+    return pd.DataFrame([ind.prev_row, ind.row])
+
+
+def pandas_ta_tail(close):
+    pytest.importorskip("pandas_ta")
+    import indicators
+    return indicators.signal_tail(pd.DataFrame({"Close": close}))
+
+
+@pytest.mark.parametrize("tail", [streaming_tail, pandas_ta_tail])
+def test_screen_panel_agrees_with_check_current_signal(tail):
+    panel = sample_panel()
+    fired = 0
+    # 最新日をずらして、シグナルが出る日も含むようにする
+    for end in range(len(panel) - 10, len(panel) + 1):
+        result = screener.screen_panel(panel.iloc[:end])
+        for ticker in panel.columns:
+            close = panel[ticker].iloc[:end].dropna().to_numpy()
+            rows = tail(close)
+            for name in strategies.NAMES:
+                action, _ = strategies.check_current_signal(name, rows)
+                assert (result.loc[ticker, name] or STAY) == action, (ticker, name, end)
+                fired += action in (BUY, SELL)
+    assert fired > 0
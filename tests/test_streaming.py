@@ -0,0 +1,80 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+from streaming import IndicatorSet, OnlineIndicator
+from vector_backtest import synthetic_ohlcv
+
+TOL = 1e-6  # 株価の単位
+
+
+def closes(seed, n=2000):
+    return synthetic_ohlcv(n=n, seed=seed)['Close'].values
+
+
+def per_bar(close):
+    ind = IndicatorSet()
+    return pd.DataFrame([ind.update(c) for c in close])
+
+
+def chunked(close, chunk):
+    ind = IndicatorSet()
+    return pd.concat([pd.DataFrame(ind.update_many(close[i:i + chunk])) for i in range(0, len(close), chunk)],
+                     ignore_index=True)
+
+
+def assert_same(actual, expected, tol=TOL):
+    """NaN の位置が同じで、値の差が tol 以内"""
+    for col in expected.columns:
+        a, b = actual[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float)
+        np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=col)
+        ok = ~np.isnan(b)
+        assert np.abs(a[ok] - b[ok]).max(initial=0) <= tol, col
+
+
+def pandas_ta_frame(close):
+    pytest.importorskip("pandas_ta")
+    import indicators
+    frame = pd.DataFrame({"Close": close})
+    indicators.append_indicators(frame)
+    return frame
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_per_bar_matches_pandas_ta(seed):
+    close = closes(seed)
+    expected = pandas_ta_frame(close)
+    actual = per_bar(close)
+    assert_same(actual, expected[[c for c in actual.columns if c in expected.columns]])
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 500])
+def test_chunked_matches_pandas_ta(chunk):
+    close = closes(0)
+    expected = pandas_ta_frame(close)
+    actual = chunked(close, chunk)
+    assert_same(actual, expected[[c for c in actual.columns if c in expected.columns]])
+
+
+@pytest.mark.parametrize("chunk", [3, 64, 1500])
+def test_chunked_matches_per_bar(chunk):
+    close = closes(1)
+    assert_same(chunked(close, chunk), per_bar(close), tol=1e-9)
+
+
+def test_resumes_from_saved_state():
+    close = closes(2, n=600)
+    ind = IndicatorSet()
+    ind.update_many(close[:400])
+    resumed = OnlineIndicator.from_dict(json.loads(json.dumps(ind.to_dict())))
+    rows = pd.DataFrame([resumed.update(c) for c in close[400:]])
+    assert_same(rows, per_bar(close).iloc[400:].reset_index(drop=True), tol=1e-9)
+    assert resumed.prev_row.keys() == resumed.row.keys()
+
+
+def test_columns_follow_strategy_rules():
+    import strategies
+    ind = IndicatorSet()
+    row = ind.update(100.0)
+    assert set(strategies.signal_columns()) <= set(row)
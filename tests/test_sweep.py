@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import strategies
+import sweep
+from streaming import IndicatorSet
+from vector_backtest import synthetic_ohlcv
+
+
+def long_high_priced(n=20000, seed=0):
+    """値がさ株の分足を何年分も持った時のような、長くて値の大きい終値"""
+    rng = np.random.default_rng(seed)
+    return 80000 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+SERIES = {
+    "daily": lambda: synthetic_ohlcv(n=500, seed=1)['Close'].to_numpy(),
+    "long_high_priced": long_high_priced,
+}
+
+
+def rules():
+    """GRIDS の全パラメータの組のルール"""
+    return [strategies.rule(name, **params) for name, params in sweep.grid()]
+
+
+def streaming_columns(rule, close):
+    specs = []
+    for kind, params, _ in rule["indicators"].values():
+        if (kind, params) not in specs:
+            specs.append((kind, params))
+    frame = pd.DataFrame(IndicatorSet(specs).update_many(close))
+    return strategies.frame_columns(rule, frame)
+
+
+def pandas_ta_columns(rule, close):
+    pytest.importorskip("pandas_ta")
+    return strategies.rule_columns(rule, close)
+
+
+@pytest.mark.parametrize("series", SERIES)
+# 株価の大きさに対する誤差の上限 (pandas_ta の移動標準偏差は窓を足し引きしながら動かすので少し大きい)
+@pytest.mark.parametrize("reference, rtol", [(streaming_columns, 1e-11), (pandas_ta_columns, 1e-10)])
+def test_window_cache_matches_rule_columns(series, reference, rtol):
+    close = SERIES[series]()
+    w = sweep.WindowCache(close)
+    # RSI は 0〜100 なので 1e-8 まで
+    price_tol = rtol * np.abs(close).max()
+    for rule in rules():
+        expected = reference(rule, close)
+        for alias, actual in w.columns(rule).items():
+            e = np.asarray(expected[alias], dtype=float)
+            np.testing.assert_array_equal(np.isnan(actual), np.isnan(e), err_msg=f"{rule['params']} {alias}")
+            ok = ~np.isnan(e)
+            tol = 1e-8 if alias == "rsi" else price_tol
+            assert np.abs(actual[ok] - e[ok]).max(initial=0) <= tol, (rule["params"], alias)
+
+
+def test_window_cache_std_has_no_cumsum_cancellation():
+    close = long_high_priced(n=60000)
+    w = sweep.WindowCache(close)
+    # 窓の中だけで2回走査した標準偏差と比べる
+    expected = np.array([close[i - 4:i + 1].std() for i in range(4, len(close))])
+    assert np.abs(w.std(5)[4:] - expected).max() <= 1e-8
+
+
+def test_sweep_ticker_ranks_the_same_with_workers():
+    df = synthetic_ohlcv(n=400, seed=2)
+    serial = sweep.sweep_ticker(df, workers=1)
+    parallel = sweep.sweep_ticker(df, workers=3)
+    assert len(serial) == len(sweep.grid())
+    pd.testing.assert_frame_equal(parallel.drop(columns="params"), serial.drop(columns="params"))
+    assert parallel["params"].tolist() == serial["params"].tolist()
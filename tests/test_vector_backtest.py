@@ -0,0 +1,42 @@
+import warnings
+import numpy as np
+import pytest
+
+# 指標は pandas_ta、比べる相手は backtesting.py の Backtest.run()
+pytest.importorskip("pandas_ta")
+pytest.importorskip("backtesting")
+
+import strategies
+import vector_backtest
+from vector_backtest import synthetic_ohlcv
+
+PARITY_KEYS = ['# Trades', 'Win Rate [%]', 'Return [%]', 'Equity Final [$]', 'Profit Factor',
+               'Max. Drawdown [%]', 'Sharpe Ratio', 'Buy & Hold Return [%]', 'Exposure Time [%]']
+
+
+def backtest_run(df, name, cash=1000000, commission=.002):
+    from backtesting import Backtest
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return Backtest(df, strategies.strategy_classes()[name], cash=cash, commission=commission).run()
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("name", strategies.NAMES)
+def test_matches_backtest_run(name, seed):
+    df = synthetic_ohlcv(seed=seed)
+    expected = backtest_run(df, name)
+    actual = vector_backtest.run(df, name)
+    for key in PARITY_KEYS:
+        e, a = float(expected[key]), float(actual[key])
+        assert (np.isnan(e) and np.isnan(a)) or np.isclose(e, a, rtol=1e-6, atol=1e-9), key
+    np.testing.assert_allclose(actual['_equity_curve']['Equity'].values,
+                               expected['_equity_curve']['Equity'].values, rtol=1e-6)
+
+
+def test_commission_and_cash_are_passed_through():
+    df = synthetic_ohlcv(seed=3)
+    expected = backtest_run(df, "SMAクロス", cash=500000, commission=.001)
+    actual = vector_backtest.run(df, "SMAクロス", cash=500000, commission=.001)
+    assert np.isclose(float(actual['Equity Final [$]']), float(expected['Equity Final [$]']), rtol=1e-6)
+    assert int(actual['# Trades']) == int(expected['# Trades'])
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+# 評価開始時の指標・一括計算のバックテストは pandas_ta を使う
+pytest.importorskip("pandas_ta")
+
+import vector_backtest
+from price_store import period_start
+from vector_backtest import synthetic_ohlcv
+from walkforward import WalkForward, SPAN, ROLL
+
+
+def feed(engine, df, first, step=5):
+    """first 本から始めて step 本ずつ足し、各回の評価開始日を集める"""
+    origins = []
+    for end in list(range(first, len(df), step)) + [len(df)]:
+        engine.update("TEST", df.iloc[:end])
+        origins.append(engine.origins["TEST"])
+    return origins
+
+
+def test_window_rolls_forward_and_matches_full_run(tmp_path):
+    df = synthetic_ohlcv(n=900, seed=1)
+    engine = WalkForward(root=str(tmp_path))
+    origins = feed(engine, df, first=560)
+
+    assert len(set(origins)) > 1  # 評価開始日が動いた
+    start = period_start(SPAN, now=df.index[-1])
+    origin = pd.Timestamp(origins[-1])
+    assert period_start(ROLL, now=start) <= origin <= start + pd.Timedelta(days=7)
+    # 動いた後も、評価開始日からの一括計算と一致する
+    assert engine.verify("TEST", df) == {}
+
+
+def test_zero_roll_matches_batch_span(tmp_path):
+    df = synthetic_ohlcv(n=700, seed=2)
+    engine = WalkForward(root=str(tmp_path), roll="0d")
+    feed(engine, df, first=600, step=7)
+
+    stats = engine.update("TEST", df)
+    window = df[df.index >= period_start(SPAN, now=df.index[-1])]
+    for name, s in stats.items():
+        expected = vector_backtest.run(window, name)
+        assert s["# Trades"] == expected["# Trades"]
+        assert s["Equity Final [$]"] == pytest.approx(float(expected["Equity Final [$]"]), rel=1e-6)
@@ -0,0 +1,182 @@
+import sys
+import numpy as np
+import pandas as pd
+import strategies
+
+"""
+vector_backtest.py (NumPy一括計算のバックテスト)
+・SMAクロス / RSI逆張り / MACD / ボリンジャー の売買ルール (strategies) を、
+  backtesting.py の1本ずつの next() ループではなく配列演算で計算します。
+・約定・手数料・建玉サイズの扱いは backtesting.py (Backtest.run) と同じです。
+  (シグナル足の次の足の始値で約定、手数料は建てと決済の両方、資金のほぼ全額で買う)
+・統計値のキーも Backtest.run() と同じなので、そのまま置き換えられます。
+・Backtest.run() との一致は tests/test_vector_backtest.py で確認します。
+"""
+
+# backtesting.py の buy() と同じ「資金のほぼ全額」
+FULL_EQUITY = 1 - sys.float_info.epsilon
+
+
+# ==========================================
+# 1. シグナルを見始める足
+# ==========================================
+def warmup_bars(indicators):
+    """指標が揃うまでの足数 (backtesting.py の _indicator_warmup_nbars と同じ)"""
+    return max((int(np.isnan(np.asarray(x, dtype=float)).argmin()) for x in indicators), default=0)
+
+
+# ==========================================
+# 2. 約定シミュレーション
+# ==========================================
+def simulate(open_, entry, exit_, start, cash=1000000, commission=.002, pyramid=True):
+    """
+    シグナル配列から約定一覧を作る
+    ループはシグナルが出た足だけ (数十回程度) で、足ごとのループはしない
+    戻り値: [(株数, 建値, 建てた足, 決済値 or NaN, 決済した足 or -1)]
+    """
+    n = len(open_)
+    exit_ = exit_ & ~entry  # next() と同じく買い判定を優先
+    events = np.flatnonzero(entry | exit_)
+    events = events[(events >= start) & (events < n - 1)]  # 最終足のシグナルは約定しない
+
+    trades, holding = [], []
+    for i in events:
+        price = open_[i + 1]
+        if entry[i]:
+            if holding and not pyramid:
+                continue
+            margin = cash - sum(s * p for s, p, _ in holding)
+            size = int(margin * FULL_EQUITY // (price * (1 + commission)))
+            if size > 0:
+                holding.append((size, price, i + 1))
+                cash -= size * price * commission
+        elif holding:
+            for s, p, b in holding:
+                cash += s * (price - p) - s * price * commission
+                trades.append((s, p, b, price, i + 1))
+            holding = []
+    trades += [(s, p, b, np.nan, -1) for s, p, b in holding]
+    return trades
+
+
+def equity_curve(close, trades, start, cash=1000000, commission=.002):
+    """約定一覧から各足の資産額を配列演算で求める"""
+    n = len(close)
+    units = np.zeros(n + 1)
+    cost = np.zeros(n + 1)
+    cash_delta = np.zeros(n + 1)
+    for s, p, b, xp, xb in trades:
+        units[b] += s
+        cost[b] += s * p
+        cash_delta[b] -= s * p * commission
+        if xb >= 0:
+            units[xb] -= s
+            cost[xb] -= s * p
+            cash_delta[xb] += s * (xp - p) - s * xp * commission
+    units, cost = np.cumsum(units[:n]), np.cumsum(cost[:n])
+    equity = cash + np.cumsum(cash_delta[:n]) + units * close - cost
+    equity[:start] = equity[min(start, n - 1)]
+    return equity
+
+
+# ==========================================
+# 3. 統計値 (Backtest.run() と同じキー)
+# ==========================================
+def geometric_mean(returns):
+    returns = np.asarray(returns, dtype=float)
+    returns = np.nan_to_num(returns) + 1
+    if np.any(returns <= 0):
+        return 0
+    return np.exp(np.log(returns).sum() / (len(returns) or np.nan)) - 1
+
+
+def annual_stats(equity, index):
+    """年率リターン・ボラティリティ・シャープレシオ (backtesting.py と同じ複利ベースの計算)"""
+    day_returns = pd.Series(equity, index=index).resample('D').last().dropna().pct_change().dropna().values
+    gmean_day_return = geometric_mean(day_returns)
+    annual_trading_days = 252
+    annualized_return = (1 + gmean_day_return) ** annual_trading_days - 1
+    ddof = int(bool(day_returns.shape))
+    var = day_returns.var(ddof=ddof) if len(day_returns) > ddof else np.nan
+    s = {'Return (Ann.) [%]': annualized_return * 100,
+         'Volatility (Ann.) [%]': np.sqrt((var + (1 + gmean_day_return) ** 2) ** annual_trading_days
+                                          - (1 + gmean_day_return) ** (2 * annual_trading_days)) * 100}
+    s['Sharpe Ratio'] = s['Return (Ann.) [%]'] / (s['Volatility (Ann.) [%]'] or np.nan)
+    return s
+
+
+def compute_stats(df, equity, trades, warmup, commission=.002):
+    index = df.index
+    close = df['Close'].values
+    closed = [t for t in trades if t[4] >= 0]
+    size = np.array([t[0] for t in closed], dtype=float)
+    entry_px = np.array([t[1] for t in closed], dtype=float)
+    exit_px = np.array([t[3] for t in closed], dtype=float)
+    comm = (entry_px + exit_px) * size * commission
+    pl = size * (exit_px - entry_px) - comm
+    returns = (exit_px / entry_px - 1) - comm / (size * entry_px)
+    entry_bar = np.array([t[2] for t in closed], dtype=int)
+    exit_bar = np.array([t[4] for t in closed], dtype=int)
+
+    trades_df = pd.DataFrame({
+        'Size': size.astype(int), 'EntryBar': entry_bar, 'ExitBar': exit_bar,
+        'EntryPrice': entry_px, 'ExitPrice': exit_px, 'PnL': pl, 'Commission': comm, 'ReturnPct': returns,
+        'EntryTime': index[entry_bar], 'ExitTime': index[exit_bar],
+    })
+    trades_df['Duration'] = trades_df['ExitTime'] - trades_df['EntryTime']
+
+    dd = 1 - equity / np.maximum.accumulate(equity)
+    s = {}
+    s['Start'] = index[0]
+    s['End'] = index[-1]
+    s['Duration'] = s['End'] - s['Start']
+    have_position = np.zeros(len(index) + 1)
+    np.add.at(have_position, entry_bar, 1)
+    np.add.at(have_position, exit_bar + 1, -1)
+    s['Exposure Time [%]'] = (np.cumsum(have_position[:-1]) > 0).mean() * 100
+    s['Equity Final [$]'] = equity[-1]
+    s['Equity Peak [$]'] = equity.max()
+    if len(closed):
+        s['Commissions [$]'] = comm.sum()
+    s['Return [%]'] = (equity[-1] - equity[0]) / equity[0] * 100
+    s['Buy & Hold Return [%]'] = (close[-1] - close[warmup]) / close[warmup] * 100
+
+    s.update(annual_stats(equity, index))
+    s['Max. Drawdown [%]'] = -np.nan_to_num(dd.max()) * 100
+    s['# Trades'] = n_trades = len(closed)
+    s['Win Rate [%]'] = np.nan if not n_trades else (pl > 0).mean() * 100
+    s['Best Trade [%]'] = returns.max() * 100 if n_trades else np.nan
+    s['Worst Trade [%]'] = returns.min() * 100 if n_trades else np.nan
+    s['Avg. Trade [%]'] = geometric_mean(returns) * 100 if n_trades else np.nan
+    s['Profit Factor'] = returns[returns > 0].sum() / (abs(returns[returns < 0].sum()) or np.nan)
+    s['Expectancy [%]'] = returns.mean() * 100 if n_trades else np.nan
+    s['SQN'] = np.sqrt(n_trades) * pl.mean() / (pl.std(ddof=1) or np.nan) if n_trades > 1 else np.nan
+    s['_equity_curve'] = pd.DataFrame({'Equity': equity, 'DrawdownPct': dd}, index=index)
+    s['_trades'] = trades_df
+    return pd.Series(s, dtype=object)
+
+
+def run(df, strategy_name, cash=1000000, commission=.002, ticker=""):
+    """Backtest(df, 戦略, cash, commission).run() の代わりに使う一括計算版"""
+    rule = strategies.rule(strategy_name)
+    entry, exit_, series = strategies.backtest_signals(rule, df, ticker)
+    warmup = warmup_bars(series)
+    start = 1 + warmup
+    trades = simulate(df['Open'].values.astype(float), entry, exit_, start, cash, commission, rule["pyramid"])
+    equity = equity_curve(df['Close'].values.astype(float), trades, start, cash, commission)
+    return compute_stats(df, equity, trades, warmup, commission)
+
+
+# ==========================================
+# 4. 検証・計測用のデータ
+# ==========================================
+def synthetic_ohlcv(n=500, seed=0):
+    """検証用のランダムウォーク株価"""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n)
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n))
+    return pd.DataFrame({
+        'Open': open_, 'High': np.maximum(open_, close) * 1.01, 'Low': np.minimum(open_, close) * 0.99,
+        'Close': close, 'Volume': rng.integers(1000, 100000, n).astype(float),
+    }, index=index)
@@ -0,0 +1,266 @@
+import os
+import json
+import math
+import numpy as np
+import pandas as pd
+import vector_backtest
+import strategies
+from price_store import to_yf_ticker, period_start
+from streaming import IndicatorSet, OnlineIndicator
+
+"""
+walkforward.py (差分更新のウォークフォワード評価)
+・戦略ごとの途中状態 (保有中の建玉、未約定の注文、現金、勝ち負け数、資産のピーク、日次リターンの集計) を
+  ファイルに保存し、次回は新しく増えた足だけを1本ずつ処理します (1足あたり O(1))。
+・シグナル判定用の指標も streaming の IndicatorSet を一緒に保存し、新しい足の分だけ更新します。
+  ルール (strategies) の既定値が変わった時は、保存した状態を捨てて作り直します。
+・集計値は「評価開始日から今日まで」を一括でバックテストした結果 (vector_backtest.run) と一致します。
+・評価期間は一括計算のジョブと同じ span (2年) から始め、評価開始日が span より roll (1か月) 以上古くなったら
+  直近 span で作り直します (期間は span 〜 span + roll の間に収まり、どこまでも伸びない)。
+・verify() で差分更新の結果と一括計算の結果を突き合わせられます。
+"""
+
+STATE_DIR = os.getenv('WALKFORWARD_DIR', os.path.join('data', 'walkforward'))
+STATE_VERSION = 4
+# 評価期間 (一括計算のジョブの取得期間と同じ) と、評価開始日を動かさずに伸ばしてよい長さ
+SPAN = "2y"
+ROLL = "1mo"
+
+
+# ==========================================
+# 1. 戦略ごとの途中状態
+# ==========================================
+def rules_signature():
+    """途中状態を作った時のルール (strategies の既定値が変わったら、保存した状態は使わずに作り直す)"""
+    return json.loads(json.dumps(strategies.STRATEGIES))
+
+
+def new_state(cash, start):
+    return {
+        "cash": float(cash),
+        "initial": float(cash),
+        "start": int(start),        # 指標が揃ってシグナルを見始める足
+        "holding": [],              # [株数, 建値]
+        "pending": None,            # 次の足の始値で約定する注文 ("buy" / "close")
+        "bars": 0,                  # 処理済みの足数
+        "trades": 0, "wins": 0,
+        "ret_pos": 0.0, "ret_neg": 0.0,
+        "equity": float(cash), "peak": float(cash), "max_dd": 0.0,
+        # 日次リターンの集計 (Welford法の平均・二乗偏差和と対数和)
+        "n_ret": 0, "mean_ret": 0.0, "m2_ret": 0.0, "log_ret": 0.0, "nonpositive": False,
+    }
+
+
+def add_return(s, r):
+    """日次リターン1件を集計に足す"""
+    s["n_ret"] += 1
+    delta = r - s["mean_ret"]
+    s["mean_ret"] += delta / s["n_ret"]
+    s["m2_ret"] += delta * (r - s["mean_ret"])
+    if 1 + r <= 0:
+        s["nonpositive"] = True
+    else:
+        s["log_ret"] += math.log1p(r)
+
+
+def step(state, open_, close, entry, exit_, pyramid=True, commission=.002):
+    """1本分の足を処理する (前の足で出た注文の約定 → 資産の記録 → この足のシグナル判定)"""
+    s = state
+    i = s["bars"]
+
+    # 1. 前の足で出た注文を、この足の始値で約定
+    if s["pending"] == "buy":
+        margin = s["cash"] - sum(size * price for size, price in s["holding"])
+        size = int(margin * vector_backtest.FULL_EQUITY // (open_ * (1 + commission)))
+        if size > 0:
+            s["holding"].append([size, float(open_)])
+            s["cash"] -= size * open_ * commission
+    elif s["pending"] == "close":
+        for size, price in s["holding"]:
+            comm = (price + open_) * size * commission
+            s["cash"] += size * (open_ - price) - size * open_ * commission
+            pl = size * (open_ - price) - comm
+            ret = (open_ / price - 1) - comm / (size * price)
+            s["trades"] += 1
+            s["wins"] += int(pl > 0)
+            if ret > 0:
+                s["ret_pos"] += ret
+            elif ret < 0:
+                s["ret_neg"] += ret
+        s["holding"] = []
+    s["pending"] = None
+
+    # 2. 資産額・ドローダウン・日次リターンの更新
+    equity = s["cash"] + sum(size * (close - price) for size, price in s["holding"])
+    if i > 0:
+        add_return(s, equity / s["equity"] - 1)
+    s["equity"] = float(equity)
+    s["peak"] = max(s["peak"], equity)
+    s["max_dd"] = max(s["max_dd"], 1 - equity / s["peak"])
+
+    # 3. この足のシグナル (約定は次の足)
+    if i >= s["start"]:
+        if entry:
+            if pyramid or not s["holding"]:
+                s["pending"] = "buy"
+        elif exit_ and s["holding"]:
+            s["pending"] = "close"
+    s["bars"] = i + 1
+    return s
+
+
+def stream_signals(prev_row, rows):
+    """
+    1本ずつ更新した指標値 (pandas_ta の列名の辞書) の並びから、各戦略の (買い, 売り) シグナル配列を作る
+    prev_row は rows の1本前 (無ければ None)。ルールは strategies のもの (バックテストと同じ)
+    """
+    frame = pd.DataFrame(([prev_row] if prev_row is not None else []) + list(rows))
+    skip = 1 if prev_row is not None else 0
+    out = {}
+    for rule in strategies.STRATEGIES:
+        entry, exit_ = strategies.signals(rule, strategies.frame_columns(rule, frame))
+        out[rule["name"]] = (entry[skip:], exit_[skip:])
+    return out
+
+
+def state_stats(s, close_start, close_last):
+    """途中状態から Backtest.run() と同じキーの統計値を作る"""
+    n = s["n_ret"]
+    gmean = 0 if s["nonpositive"] or not n else math.exp(s["log_ret"] / n) - 1
+    var = s["m2_ret"] / (n - 1) if n > 1 else np.nan
+    days = 252
+    ann_return = (1 + gmean) ** days - 1
+    vol = np.sqrt((var + (1 + gmean) ** 2) ** days - (1 + gmean) ** (2 * days)) * 100
+    return {
+        "Equity Final [$]": s["equity"],
+        "Equity Peak [$]": s["peak"],
+        "Return [%]": (s["equity"] - s["initial"]) / s["initial"] * 100,
+        "Buy & Hold Return [%]": (close_last - close_start) / close_start * 100,
+        "Return (Ann.) [%]": ann_return * 100,
+        "Volatility (Ann.) [%]": vol,
+        "Sharpe Ratio": ann_return * 100 / (vol or np.nan),
+        "Max. Drawdown [%]": -s["max_dd"] * 100,
+        "# Trades": s["trades"],
+        "Win Rate [%]": s["wins"] / s["trades"] * 100 if s["trades"] else np.nan,
+        "Profit Factor": s["ret_pos"] / (abs(s["ret_neg"]) or np.nan),
+    }
+
+
+# ==========================================
+# 2. 差分更新エンジン
+# ==========================================
+class WalkForward:
+    """
+    銘柄ごとに全戦略の途中状態を保存し、新しい足だけで更新する
+    ・初回・過去データが修正された時・評価開始日が古くなった時だけ、直近 span の全足を処理
+    ・df には直近 span 以上を含む保存済みの全履歴 (PriceStore.load) を渡す
+    """
+    def __init__(self, root=STATE_DIR, cash=1000000, commission=.002, span=SPAN, roll=ROLL):
+        self.root = root
+        self.cash = cash
+        self.commission = commission
+        self.span = span
+        self.roll = roll
+        self.rows = {}     # 銘柄 → 直近2本の指標値 (check_current_signal にそのまま渡せる)
+        self.origins = {}  # 銘柄 → 評価開始日 (統計値が何日からの成績か)
+
+    def path(self, ticker):
+        return os.path.join(self.root, f"{to_yf_ticker(ticker)}.json")
+
+    def load(self, ticker):
+        try:
+            with open(self.path(ticker), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get("version") != STATE_VERSION or saved.get("rules") != rules_signature():
+                return None
+            return saved
+        except (OSError, ValueError):
+            return None
+
+    def save(self, ticker, saved):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(ticker)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        os.replace(tmp, path)
+
+    def _bootstrap(self, df):
+        origin = df.index[0]
+        saved = {"version": STATE_VERSION, "origin": str(origin.date()), "rules": rules_signature(), "strategies": {},
+                 "indicators": IndicatorSet().to_dict()}
+        for rule in strategies.STRATEGIES:
+            cols = strategies.rule_columns(rule, df['Close'].values)
+            warmup = vector_backtest.warmup_bars(strategies.warmup_series(rule, cols))
+            saved["strategies"][rule["name"]] = new_state(self.cash, 1 + warmup)
+            saved["strategies"][rule["name"]]["warmup"] = warmup
+        return saved
+
+    def _is_consistent(self, saved, df):
+        """保存時の最終足が今のデータと同じか (株式分割などで過去の価格が変わっていないか)"""
+        last = pd.Timestamp(saved["last_date"])
+        bars = next(iter(saved["strategies"].values()))["bars"]
+        if last not in df.index or df.index.get_loc(last) != bars - 1:
+            return False
+        return math.isclose(float(df.loc[last, 'Close']), saved["last_close"], rel_tol=1e-9)
+
+    def update(self, ticker, df):
+        """新しい足だけを処理して {戦略名: 統計値} を返す"""
+        saved = self.load(ticker)
+        start = period_start(self.span, now=df.index[-1])
+        if saved is not None:
+            origin = pd.Timestamp(saved["origin"])
+            # 評価開始日が古くなりすぎた (または保存済みの履歴から外れた) ら、直近 span で作り直す
+            if origin < period_start(self.roll, now=start) or origin < df.index[0]:
+                saved = None
+            else:
+                df = df[df.index >= origin]
+                if not self._is_consistent(saved, df):
+                    saved = None
+        if saved is None:
+            df = df[df.index >= start]
+            saved = self._bootstrap(df)
+
+        first_new = next(iter(saved["strategies"].values()))["bars"]
+        open_ = df['Open'].values.astype(float)
+        close = df['Close'].values.astype(float)
+        ind = OnlineIndicator.from_dict(saved["indicators"])
+        # 新しい足の指標を先に1本ずつ更新し、シグナルは新しい足の分をまとめて判定する
+        prev_row, rows = ind.row, []
+        for i in range(first_new, len(df)):
+            rows.append(ind.update(close[i], df.index[i].date()))
+        if rows:
+            signals = stream_signals(prev_row, rows)
+            for rule in strategies.STRATEGIES:
+                entry, exit_ = signals[rule["name"]]
+                state = saved["strategies"][rule["name"]]
+                for k, i in enumerate(range(first_new, len(df))):
+                    step(state, open_[i], close[i], entry[k], exit_[k] and not entry[k],
+                         rule["pyramid"], self.commission)
+        saved["indicators"] = ind.to_dict()
+        saved["last_date"] = str(df.index[-1].date())
+        saved["last_close"] = float(close[-1])
+        self.save(ticker, saved)
+        self.rows[ticker] = (ind.prev_row, ind.row)
+        self.origins[ticker] = saved["origin"]
+        # Start / End は Backtest.run() と同じく、統計値が何日から何日までの成績か
+        return {name: {"Start": df.index[0], "End": df.index[-1], **state_stats(s, close[s["warmup"]], close[-1])}
+                for name, s in saved["strategies"].items()}
+
+    def verify(self, ticker, df, rtol=1e-6):
+        """差分更新の結果と、評価開始日からの一括バックテストの結果を比べて食い違いを返す"""
+        incremental = self.update(ticker, df)
+        saved = self.load(ticker)
+        window = df[df.index >= pd.Timestamp(saved["origin"])]
+        diffs = {}
+        for name, stats in incremental.items():
+            expected = vector_backtest.run(window, name, self.cash, self.commission, ticker)
+            for key, value in stats.items():
+                if key in ("Start", "End"):
+                    if pd.Timestamp(value) != pd.Timestamp(expected[key]):
+                        diffs[(name, key)] = (expected[key], value)
+                    continue
+                e = float(expected[key])
+                if not (np.isnan(e) and np.isnan(value)) and not np.isclose(e, value, rtol=rtol, atol=1e-9):
+                    diffs[(name, key)] = (e, value)
+        return diffs